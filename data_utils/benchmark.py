@@ -0,0 +1,301 @@
+"""
+Benchmarks for the extractors on synthetic sessions
+
+Usage:
+    python -m data_utils.benchmark frame-reduction [--minutes 10] [--sessions 3]
+    python -m data_utils.benchmark mouse-tensor [--minutes 10] [--sessions 3]
+    python -m data_utils.benchmark combined [--minutes 10] [--sessions 3]
+    python -m data_utils.benchmark streaming [--minutes 10] [--sessions 3]
+"""
+
+import argparse
+import json
+import os
+import random
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+import torch
+
+from . import (
+    extract_button_inputs,
+    extract_inputs,
+    extract_mouse_inputs,
+    stream_extract,
+)
+from .extract_button_inputs import load_button_events, reduce_frame_events
+from .extract_mouse_inputs import load_mouse_moves, mean_movement_per_frame
+
+BENCH_KEYCODES = [87, 65, 83, 68, 16, 32, 17, 70, 82, 69, 81, 90]  # WASD-heavy mix
+
+
+def make_synthetic_session(video_dir, minutes=10, events_per_second=1000, seed=0):
+    """
+    Write a synthetic inputs.csv to video_dir
+
+    Events arrive at roughly `events_per_second` (1 kHz mouse polling by default),
+    mostly MOUSE_MOVE with a heavy share of keyboard presses/releases, some mouse
+    buttons and scrolls, plus events before START and after END to exercise
+    trimming.
+    """
+    rng = random.Random(seed)
+    os.makedirs(video_dir, exist_ok=True)
+
+    start = 1_700_000_000.0 + seed * 3600
+    end = start + minutes * 60
+    rows = [
+        f'{start - 0.5},MOUSE_MOVE,"[1, 1]"',
+        f'{start},START,"[]"',
+    ]
+
+    pressed = set()
+    t = start
+    while True:
+        t += rng.expovariate(events_per_second)
+        if t >= end:
+            break
+        r = rng.random()
+        if r < 0.8:
+            dx, dy = rng.randint(-20, 20), rng.randint(-20, 20)
+            rows.append(f'{t},MOUSE_MOVE,"[{dx}, {dy}]"')
+        elif r < 0.93:
+            code = rng.choice(BENCH_KEYCODES)
+            # Mostly alternate press/release, with some repeats and stray releases
+            if rng.random() < 0.8:
+                is_pressed = code not in pressed
+            else:
+                is_pressed = rng.random() < 0.5
+            (pressed.add if is_pressed else pressed.discard)(code)
+            rows.append(f'{t},KEYBOARD,"[{code}, {json.dumps(is_pressed)}]"')
+        elif r < 0.96:
+            button = rng.choice([1, 2, 3])
+            is_pressed = rng.random() < 0.5
+            rows.append(f'{t},MOUSE_BUTTON,"[{button}, {json.dumps(is_pressed)}]"')
+        else:
+            rows.append(f'{t},SCROLL,"[{rng.choice([-1, 1])}]"')
+
+    rows.append(f'{end},END,"[]"')
+    rows.append(f'{end + 0.5},MOUSE_MOVE,"[3, 3]"')
+
+    with open(os.path.join(video_dir, "inputs.csv"), "w") as f:
+        f.write("timestamp,event_type,event_args\n")
+        f.write("\n".join(rows) + "\n")
+
+
+def reference_reduce_frame_events(button_data):
+    """The original groupby.apply formulation of reduce_frame_events"""
+
+    def process_frame_events(group):
+        group = group.sort_values("timestamp")
+        down_events = group[group["event_type"] == "DOWN"]
+        up_events = group[group["event_type"] == "UP"]
+
+        if len(down_events) > 0 and len(up_events) == 0:
+            return down_events.iloc[-1:]
+        elif len(up_events) > 0 and len(down_events) == 0:
+            return up_events.iloc[-1:]
+
+        last_event = group.iloc[-1]
+        if last_event["event_type"] == "DOWN":
+            return pd.DataFrame([last_event])
+        else:
+            if len(down_events) > 0:
+                last_event = last_event.copy()
+                last_event["event_type"] = "TAP"
+                return pd.DataFrame([last_event])
+            else:
+                return pd.DataFrame([last_event])
+
+    return (
+        button_data.groupby(["frame", "event_args"])
+        .apply(process_frame_events)
+        .reset_index(drop=True)
+    )
+
+
+def reference_mouse_tensor(mouse_moves):
+    """The original groupby + iterrows construction of the mouse tensor"""
+    frame_data = (
+        mouse_moves.groupby("frame").agg({"dx": "mean", "dy": "mean"}).reset_index()
+    )
+
+    total_frames = frame_data["frame"].max() + 1
+    movement_tensor = torch.zeros((total_frames, 2), dtype=torch.bfloat16)
+
+    for _, row in frame_data.iterrows():
+        frame_idx = int(row["frame"])
+        movement_tensor[frame_idx] = torch.tensor(
+            [row["dx"], row["dy"]], dtype=torch.bfloat16
+        )
+    return movement_tensor
+
+
+def vectorized_mouse_tensor(mouse_moves):
+    total_frames = mouse_moves["frame"].max() + 1
+    return torch.from_numpy(
+        mean_movement_per_frame(
+            mouse_moves["frame"].to_numpy(),
+            mouse_moves["dx"].to_numpy(dtype="float64"),
+            mouse_moves["dy"].to_numpy(dtype="float64"),
+            total_frames,
+        )
+    ).to(torch.bfloat16)
+
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - start
+
+
+def same_events(a, b):
+    columns = ["frame", "event_args", "event_type", "timestamp"]
+    a = a[columns].reset_index(drop=True)
+    b = b[columns].reset_index(drop=True)
+    a["frame"] = a["frame"].astype(int)
+    b["frame"] = b["frame"].astype(int)
+    return a.equals(b)
+
+
+def bench_frame_reduction(video_dirs):
+    print(f"{'session':<12}{'events':>10}{'groupby.apply':>16}{'vectorized':>12}")
+    total_ref, total_new = 0.0, 0.0
+    for video_dir in video_dirs:
+        button_data = load_button_events(os.path.join(video_dir, "inputs.csv"))
+        expected, ref_time = timed(reference_reduce_frame_events, button_data)
+        reduced, new_time = timed(reduce_frame_events, button_data)
+        if not same_events(expected, reduced):
+            raise AssertionError(f"Reductions differ for {video_dir}")
+        total_ref += ref_time
+        total_new += new_time
+        print(
+            f"{os.path.basename(video_dir):<12}{len(button_data):>10}"
+            f"{ref_time:>15.3f}s{new_time:>11.3f}s"
+        )
+    print(f"Speedup: {total_ref / total_new:.1f}x (outputs identical)")
+
+
+def bench_mouse_tensor(video_dirs):
+    print(f"{'session':<12}{'moves':>10}{'iterrows':>12}{'vectorized':>12}")
+    total_ref, total_new = 0.0, 0.0
+    for video_dir in video_dirs:
+        mouse_moves = load_mouse_moves(os.path.join(video_dir, "inputs.csv"))
+        expected, ref_time = timed(reference_mouse_tensor, mouse_moves)
+        movement, new_time = timed(vectorized_mouse_tensor, mouse_moves)
+        if not torch.equal(expected.view(torch.int16), movement.view(torch.int16)):
+            raise AssertionError(f"Mouse tensors differ for {video_dir}")
+        total_ref += ref_time
+        total_new += new_time
+        print(
+            f"{os.path.basename(video_dir):<12}{len(mouse_moves):>10}"
+            f"{ref_time:>11.3f}s{new_time:>11.3f}s"
+        )
+    print(f"Speedup: {total_ref / total_new:.1f}x (outputs bit-identical)")
+
+
+def run_separate_extractors(video_dir):
+    return (
+        extract_button_inputs.process_video(video_dir, return_tensor=True),
+        extract_mouse_inputs.process_video(video_dir, return_tensor=True),
+    )
+
+
+def bench_combined(video_dirs):
+    print(f"{'session':<12}{'buttons+mouse':>15}{'combined':>12}")
+    total_ref, total_new = 0.0, 0.0
+    for video_dir in video_dirs:
+        (buttons, mouse), ref_time = timed(run_separate_extractors, video_dir)
+        tensors, new_time = timed(
+            lambda video_dir=video_dir: extract_inputs.process_video(
+                video_dir, return_tensor=True
+            )
+        )
+        # Same per-frame values over the frames both cover (the combined
+        # extractor runs to the END frame, and bins buttons with // like mouse)
+        n = min(mouse.shape[0], tensors["mouse"].shape[0])
+        if not torch.equal(
+            mouse[:n].view(torch.int16), tensors["mouse"][:n].view(torch.int16)
+        ):
+            raise AssertionError(f"Mouse tensors differ for {video_dir}")
+        n = min(buttons.shape[0], tensors["buttons"].shape[0])
+        mismatched = (buttons[:n] != tensors["buttons"][:n]).any(dim=1).sum().item()
+        total_ref += ref_time
+        total_new += new_time
+        print(
+            f"{os.path.basename(video_dir):<12}{ref_time:>14.3f}s{new_time:>11.3f}s"
+            f"  ({mismatched} button frames differ)"
+        )
+    print(f"Speedup: {total_ref / total_new:.1f}x")
+
+
+def add_stray_timestamp(video_dir, row, seconds=30.0):
+    """Push one row of a session's inputs.csv `seconds` into the future"""
+    csv_path = os.path.join(video_dir, "inputs.csv")
+    with open(csv_path) as f:
+        lines = f.readlines()
+    timestamp, rest = lines[row + 1].split(",", 1)  # +1 for the header
+    lines[row + 1] = f"{float(timestamp) + seconds},{rest}"
+    with open(csv_path, "w") as f:
+        f.writelines(lines)
+
+
+def run_streaming(video_dir, block_rows):
+    stream = stream_extract.ChunkStream(
+        os.path.join(video_dir, "inputs.csv"), block_rows=block_rows
+    )
+    chunks = [chunk for _, chunk in stream]
+    return {
+        modality: np.concatenate([chunk[modality] for chunk in chunks])
+        for modality in stream.modalities
+    }, stream
+
+
+def bench_streaming(video_dirs, block_rows=10_000):
+    print(f"{'session':<12}{'one pass':>10}{'streaming':>11}")
+    total_ref, total_new = 0.0, 0.0
+    for video_dir in video_dirs:
+        # One stray future timestamp at the end of a block mustn't close the
+        # chunks the rows after it belong to
+        add_stray_timestamp(video_dir, block_rows - 1)
+        expected, ref_time = timed(extract_inputs.extract_arrays, video_dir)
+        (arrays, stream), new_time = timed(run_streaming, video_dir, block_rows)
+        for modality, array in expected.items():
+            if not np.array_equal(array, arrays[modality]):
+                raise AssertionError(f"{modality} arrays differ for {video_dir}")
+        if stream.late_events:
+            raise AssertionError(
+                f"{stream.late_events} events dropped as late for {video_dir}"
+            )
+        total_ref += ref_time
+        total_new += new_time
+        print(f"{os.path.basename(video_dir):<12}{ref_time:>9.3f}s{new_time:>10.3f}s")
+    print(f"Streaming takes {total_new / total_ref:.2f}x as long (outputs identical)")
+
+
+BENCHMARKS = {
+    "frame-reduction": bench_frame_reduction,
+    "mouse-tensor": bench_mouse_tensor,
+    "combined": bench_combined,
+    "streaming": bench_streaming,
+}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the data extractors")
+    parser.add_argument("benchmark", choices=sorted(BENCHMARKS))
+    parser.add_argument("--minutes", type=float, default=10)
+    parser.add_argument("--sessions", type=int, default=3)
+    parser.add_argument("--events-per-second", type=int, default=1000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        video_dirs = []
+        for i in range(args.sessions):
+            video_dir = os.path.join(tmp_dir, f"session_{i:03d}")
+            make_synthetic_session(
+                video_dir, args.minutes, args.events_per_second, seed=i
+            )
+            video_dirs.append(video_dir)
+        BENCHMARKS[args.benchmark](video_dirs)
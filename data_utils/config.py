@@ -2,3 +2,38 @@ FPS = 60  # Controls and mouse vectors are extracted on a per frame basis
 ROOT_DIR = "path/to/data"  # Root path to where all the data (mp4s and csvs) is
 SPLIT_SIZE = 1000  # How big should each tensor be on dim0?
 KEYBINDS = ["W", "A", "S", "D", "LSHIFT", "SPACE", "LCTRL", "F", "R", "E", "LMB", "RMB"]
+
+# Gamepad layouts, in the recorder's stable button/axis ids
+# (crates/input-capture/src/gamepad_capture.rs)
+GAMEPAD_BUTTONS = {
+    1: "SOUTH",
+    2: "EAST",
+    3: "C",
+    4: "NORTH",
+    5: "WEST",
+    6: "Z",
+    7: "LT",
+    8: "RT",
+    9: "LT2",
+    10: "RT2",
+    11: "SELECT",
+    12: "START",
+    13: "MODE",
+    14: "LTHUMB",
+    15: "RTHUMB",
+    16: "DPAD_UP",
+    17: "DPAD_DOWN",
+    18: "DPAD_LEFT",
+    19: "DPAD_RIGHT",
+}
+GAMEPAD_TRIGGERS = {9: "LT2", 10: "RT2"}  # Analog values from GAMEPAD_BUTTON_VALUE
+GAMEPAD_AXES = {
+    1: "LSTICKX",
+    2: "LSTICKY",
+    3: "LEFTZ",
+    4: "RSTICKX",
+    5: "RSTICKY",
+    6: "RIGHTZ",
+    7: "DPADX",
+    8: "DPADY",
+}
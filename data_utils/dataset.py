@@ -0,0 +1,270 @@
+"""
+Random-access windowed reader over extracted sessions
+
+Builds a global frame index across every session under a root directory once,
+then serves (session, start_frame, length) windows of the per-frame tensors.
+Sessions extracted to tensors/ are sliced straight out of their memory maps;
+sessions with splits/ chunks only load the chunks a window overlaps, keeping
+recently used chunks in a size-bounded LRU cache.
+
+The reader is safe to hand to DataLoader workers: caches and open memory maps
+are per process and are dropped when the reader is pickled or forked.
+"""
+
+import bisect
+import os
+import re
+from collections import OrderedDict
+
+import torch
+
+from .config import SPLIT_SIZE
+from .session_tensors import TENSORS_DIR, SessionTensors
+
+DEFAULT_MODALITIES = ("buttons", "mouse")
+DEFAULT_CACHE_BYTES = 256 * 1024 * 1024
+
+SPLIT_PATTERN = re.compile(r"^(\d{8})_(\w+)\.pt$")
+
+
+class ChunkCache:
+    """LRU cache of loaded tensors bounded by their total size in bytes"""
+
+    def __init__(self, max_bytes=DEFAULT_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+
+    def get(self, key, load):
+        if key in self._entries:
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return self._entries[key]
+
+        self.misses += 1
+        value = load()
+        size = value.element_size() * value.nelement()
+        if size <= self.max_bytes:
+            self._entries[key] = value
+            self.current_bytes += size
+            while self.current_bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.current_bytes -= evicted.element_size() * evicted.nelement()
+        return value
+
+    def clear(self):
+        self._entries.clear()
+        self.current_bytes = 0
+
+
+def index_session(video_dir, modalities):
+    """
+    Describe how a session is stored and how many frames each modality has
+
+    Returns None if the session has no extracted outputs for every modality.
+    """
+    tensors_dir = os.path.join(video_dir, TENSORS_DIR)
+    if os.path.exists(os.path.join(tensors_dir, "index.json")):
+        session_tensors = SessionTensors(tensors_dir)
+        if not all(m in session_tensors.modalities for m in modalities):
+            return None
+        frames = {m: session_tensors.num_frames(m) for m in modalities}
+        return {"video_dir": video_dir, "format": "tensors", "frames": frames}
+
+    splits_dir = os.path.join(video_dir, "splits")
+    if not os.path.isdir(splits_dir):
+        return None
+
+    last_chunk = {}
+    for name in os.listdir(splits_dir):
+        match = SPLIT_PATTERN.match(name)
+        if match is None or match.group(2) not in modalities:
+            continue
+        modality, chunk_idx = match.group(2), int(match.group(1))
+        last_chunk[modality] = max(last_chunk.get(modality, -1), chunk_idx)
+    if not all(m in last_chunk for m in modalities):
+        return None
+
+    # Only the last chunk of each modality can be shorter than SPLIT_SIZE
+    frames = {}
+    for modality, chunk_idx in last_chunk.items():
+        chunk = torch.load(os.path.join(splits_dir, f"{chunk_idx:08d}_{modality}.pt"))
+        frames[modality] = chunk_idx + chunk.shape[0]
+    return {"video_dir": video_dir, "format": "splits", "frames": frames}
+
+
+class SessionWindowReader:
+    """
+    Serve windows of per-frame tensors from every extracted session under root_dir
+
+    A session's length is the longest of its modalities; shorter modalities are
+    zero-padded past their last frame. With `window_length` set the reader also
+    acts as a map-style dataset whose items are the windows starting every
+    `stride` frames that fit inside a session.
+
+    Args:
+        root_dir: Directory containing session directories
+        modalities: Which tensors to read
+        cache_bytes: Size bound of the splits/ chunk cache (per process)
+        window_length: Frames per item for __getitem__/__len__
+        stride: Frames between consecutive windows (defaults to window_length)
+    """
+
+    def __init__(
+        self,
+        root_dir,
+        modalities=DEFAULT_MODALITIES,
+        cache_bytes=DEFAULT_CACHE_BYTES,
+        window_length=None,
+        stride=None,
+    ):
+        self.root_dir = root_dir
+        self.modalities = tuple(modalities)
+        self.cache_bytes = cache_bytes
+        self.window_length = window_length
+        self.stride = stride or window_length
+
+        self.sessions = []
+        for name in sorted(os.listdir(root_dir)):
+            session = index_session(os.path.join(root_dir, name), self.modalities)
+            if session is not None:
+                session["name"] = name
+                session["num_frames"] = max(session["frames"].values())
+                self.sessions.append(session)
+
+        # Global frame index: session i covers [frame_offsets[i], frame_offsets[i + 1])
+        self.frame_offsets = [0]
+        for session in self.sessions:
+            self.frame_offsets.append(self.frame_offsets[-1] + session["num_frames"])
+
+        self.window_offsets = [0]
+        if window_length is not None:
+            for session in self.sessions:
+                fitting = session["num_frames"] - window_length
+                count = fitting // self.stride + 1 if fitting >= 0 else 0
+                self.window_offsets.append(self.window_offsets[-1] + count)
+
+        self._reset_process_state()
+
+    def _reset_process_state(self):
+        self._pid = os.getpid()
+        self._cache = ChunkCache(self.cache_bytes)
+        self._open_tensors = {}
+
+    def _check_process(self):
+        # Forked DataLoader workers start with their own, empty caches
+        if self._pid != os.getpid():
+            self._reset_process_state()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        for key in ("_pid", "_cache", "_open_tensors"):
+            state.pop(key, None)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._reset_process_state()
+
+    @property
+    def total_frames(self):
+        return self.frame_offsets[-1]
+
+    @property
+    def cache(self):
+        self._check_process()
+        return self._cache
+
+    def locate(self, global_frame):
+        """Map a global frame index to (session index, frame within session)"""
+        if not 0 <= global_frame < self.total_frames:
+            raise IndexError(f"Frame {global_frame} out of range")
+        session_idx = bisect.bisect_right(self.frame_offsets, global_frame) - 1
+        return session_idx, global_frame - self.frame_offsets[session_idx]
+
+    def _read_modality(self, session, modality, start, stop):
+        available = min(stop, session["frames"][modality])
+        if session["format"] == "tensors":
+            video_dir = session["video_dir"]
+            if video_dir not in self._open_tensors:
+                self._open_tensors[video_dir] = SessionTensors(
+                    os.path.join(video_dir, TENSORS_DIR)
+                )
+            if start >= available:
+                return None
+            return self._open_tensors[video_dir].read_tensor(modality, start, available)
+
+        splits_dir = os.path.join(session["video_dir"], "splits")
+        parts = []
+        for chunk_start in range(start - start % SPLIT_SIZE, available, SPLIT_SIZE):
+            path = os.path.join(splits_dir, f"{chunk_start:08d}_{modality}.pt")
+            chunk = self._cache.get(path, lambda path=path: torch.load(path))
+            lo = max(start, chunk_start) - chunk_start
+            hi = min(available, chunk_start + SPLIT_SIZE) - chunk_start
+            parts.append(chunk[lo:hi])
+        if not parts:
+            return None
+        return parts[0] if len(parts) == 1 else torch.cat(parts)
+
+    def read(self, session_idx, start_frame, length):
+        """
+        Read frames [start_frame, start_frame + length) of one session
+
+        Returns a dict of modality -> tensor of shape (length, ...). Frames past
+        the end of a modality are zeros.
+        """
+        self._check_process()
+        session = self.sessions[session_idx]
+        if start_frame < 0 or start_frame + length > session["num_frames"]:
+            raise IndexError(
+                f"Window [{start_frame}, {start_frame + length}) outside session "
+                f"{session['name']} with {session['num_frames']} frames"
+            )
+
+        window = {}
+        stop = start_frame + length
+        for modality in self.modalities:
+            data = self._read_modality(session, modality, start_frame, stop)
+            if data is None or data.shape[0] < length:
+                padded = torch.zeros(
+                    (length, *self._trailing_shape(session, modality, data)),
+                    dtype=self._dtype(session, modality, data),
+                )
+                if data is not None:
+                    padded[: data.shape[0]] = data
+                data = padded
+            window[modality] = data
+        return window
+
+    def _trailing_shape(self, session, modality, data):
+        if data is not None:
+            return data.shape[1:]
+        return self._probe(session, modality).shape[1:]
+
+    def _dtype(self, session, modality, data):
+        if data is not None:
+            return data.dtype
+        return self._probe(session, modality).dtype
+
+    def _probe(self, session, modality):
+        """Read the first frame of a modality to learn its shape and dtype"""
+        return self._read_modality(session, modality, 0, 1)
+
+    def read_global(self, global_start, length):
+        """Read a window addressed by its global start frame (within one session)"""
+        session_idx, start_frame = self.locate(global_start)
+        return self.read(session_idx, start_frame, length)
+
+    def __len__(self):
+        if self.window_length is None:
+            raise TypeError("Set window_length to use the reader as a dataset")
+        return self.window_offsets[-1]
+
+    def __getitem__(self, index):
+        if not 0 <= index < len(self):
+            raise IndexError(f"Window {index} out of range")
+        session_idx = bisect.bisect_right(self.window_offsets, index) - 1
+        start_frame = (index - self.window_offsets[session_idx]) * self.stride
+        return self.read(session_idx, start_frame, self.window_length)
@@ -0,0 +1,107 @@
+"""
+Shared inputs.csv loading for the one-pass extractors
+
+Sessions can also store their inputs as a binary event log (inputs.evlog, see
+vg_control/data/input_utils/event_log.py); it loads into the same DataFrame
+with the arguments already parsed into numeric "arg0"/"arg1" columns.
+"""
+
+import os
+
+import numpy as np
+import pandas as pd
+
+from vg_control.data.input_utils.event_log import EventLog, is_event_log
+
+from .config import FPS
+
+INPUT_NAMES = ("inputs.csv", "inputs.evlog")
+ARG_COLUMNS = ("arg0", "arg1")
+
+
+def frame_index(timestamps):
+    """
+    Frame each timestamp (seconds since START) falls in
+
+    Every modality is binned with this so they line up frame for frame.
+    """
+    return (np.asarray(timestamps, dtype=np.float64) // (1.0 / FPS)).astype(np.int64)
+
+
+def parse_event_args(event_args, width):
+    """
+    Parse JSON-array event_args of a fixed width into a float64 (n, width) array
+
+    Booleans become 1/0. Much faster than json.loads per row since the whole
+    column is joined and converted to floats in one call.
+    """
+    if len(event_args) == 0:
+        return np.empty((0, width), dtype=np.float64)
+
+    text = ",".join(event_args.str.slice(1, -1))
+    text = text.replace("true", "1").replace("false", "0")
+    values = np.array(text.split(","), dtype=np.float64)
+    if values.size != len(event_args) * width:
+        raise ValueError(f"Expected {width} event args per row")
+    return values.reshape(-1, width)
+
+
+def event_args_array(rows, width):
+    """
+    The first `width` event args of some rows as a float64 (n, width) array
+
+    Uses the pre-parsed columns of an event log when present.
+    """
+    if ARG_COLUMNS[0] in rows:
+        return rows[list(ARG_COLUMNS[:width])].to_numpy(dtype=np.float64)
+    return parse_event_args(rows["event_args"], width)
+
+
+def inputs_path(video_dir):
+    """The session's inputs.csv, or its event log if it only has that"""
+    for name in INPUT_NAMES:
+        path = os.path.join(video_dir, name)
+        if os.path.exists(path):
+            return path
+    return os.path.join(video_dir, INPUT_NAMES[0])
+
+
+def read_events(path, event_args=True):
+    """
+    Load an inputs.csv or event log as the inputs.csv DataFrame
+
+    With event_args=False an event log skips formatting the JSON strings and
+    only has the numeric argument columns.
+    """
+    if is_event_log(path):
+        return EventLog(path).frame(event_args=event_args)
+    return pd.read_csv(path)
+
+
+def load_session_events(csv_path):
+    """
+    Load an inputs.csv (or event log) once, trimmed to the START/END window
+
+    Returns:
+        - DataFrame of events with timestamps relative to START and their frame
+        - Total number of frames in the session
+    """
+    events = read_events(csv_path, event_args=False)
+
+    # Find start time and normalize timestamps
+    head = events.head(1000)
+    start_time = head[head["event_type"] == "START"].iloc[-1]["timestamp"]
+    events = events[events["timestamp"] >= start_time].reset_index(drop=True)
+    events["timestamp"] -= start_time
+
+    # Trim to end event if exists
+    end_rows = events[events["event_type"] == "END"]
+    if not end_rows.empty:
+        end_time = end_rows.iloc[0]["timestamp"]
+        events = events[events["timestamp"] <= end_time].reset_index(drop=True)
+    else:
+        end_time = events["timestamp"].max()
+
+    events["frame"] = frame_index(events["timestamp"].to_numpy())
+    total_frames = int(frame_index(end_time)) + 1
+    return events, total_frames
@@ -0,0 +1,275 @@
+"""
+Sharded training-dataset export
+
+Packs extracted sessions into large tar shards so training can stream them
+with purely sequential reads instead of opening thousands of small files.
+Each session contributes its video, its per-frame tensors (tensors/ if
+present, otherwise splits/) and metadata.json as members named
+"<session>/<file>".
+
+Sessions are assigned to shards up front, in name order, until a shard
+reaches the target size; the plan is saved in the output directory so
+re-running resumes: finished shards are kept, unfinished ones are rebuilt and
+sessions that appeared since are packed into new shards. Shards are written in
+parallel, each to a temporary file that is renamed once complete.
+
+Next to every shard-NNNNNN.tar is shard-NNNNNN.json listing its sessions and
+each member's data offset and size, and index.json lists every shard.
+Planned sessions that were deleted (or lost their tensors) before their shard
+was written are left out of it and listed under "skipped".
+
+Usage:
+    python -m data_utils.export_shards OUTPUT_DIR [--root DIR]
+        [--target-size-mb 1024] [--workers N] [--profile]
+"""
+
+import argparse
+import json
+import os
+import tarfile
+import time
+
+from vg_control import profiling
+
+from .config import ROOT_DIR
+from .extract import run_jobs
+from .session_tensors import TENSORS_DIR
+
+PLAN_NAME = "export_plan.json"
+INDEX_NAME = "index.json"
+
+
+def shard_name(shard_idx):
+    return f"shard-{shard_idx:06d}"
+
+
+def session_members(video_dir):
+    """
+    Files of a session to pack, as (path, member name) pairs
+
+    Returns None if the session has no video, metadata or extracted tensors.
+    """
+    session = os.path.basename(os.path.normpath(video_dir))
+    files = sorted(os.listdir(video_dir))
+    videos = [name for name in files if name.endswith(".mp4")]
+    if not videos or "metadata.json" not in files:
+        return None
+
+    tensors_dir = os.path.join(video_dir, TENSORS_DIR)
+    splits_dir = os.path.join(video_dir, "splits")
+    if os.path.exists(os.path.join(tensors_dir, "index.json")):
+        tensor_dir, tensor_files = TENSORS_DIR, sorted(os.listdir(tensors_dir))
+    elif os.path.isdir(splits_dir):
+        tensor_dir = "splits"
+        tensor_files = sorted(f for f in os.listdir(splits_dir) if f.endswith(".pt"))
+    else:
+        return None
+    if not tensor_files:
+        return None
+
+    # Metadata first so a streaming reader knows what it is looking at
+    members = [(os.path.join(video_dir, "metadata.json"), "metadata.json")]
+    members += [(os.path.join(video_dir, name), name) for name in videos]
+    members += [
+        (os.path.join(video_dir, tensor_dir, name), f"{tensor_dir}/{name}")
+        for name in tensor_files
+    ]
+    return [(path, f"{session}/{name}") for path, name in members]
+
+
+def plan_shards(sessions, target_bytes, plan=None):
+    """
+    Assign sessions to shards, keeping the assignments of an existing plan
+
+    Args:
+        sessions: Mapping of session name to its total size in bytes
+        target_bytes: Start a new shard once this size is reached
+        plan: Previous plan to extend, or None
+    """
+    plan = plan or {"target_bytes": target_bytes, "shards": []}
+    planned = {name for shard in plan["shards"] for name in shard["sessions"]}
+
+    current, current_bytes = [], 0
+    for name in sorted(sessions):
+        if name in planned:
+            continue
+        current.append(name)
+        current_bytes += sessions[name]
+        if current_bytes >= target_bytes:
+            plan["shards"].append({"sessions": current})
+            current, current_bytes = [], 0
+    if current:
+        plan["shards"].append({"sessions": current})
+    return plan
+
+
+def write_shard(output_dir, shard_idx, video_dirs):
+    """
+    Write one shard and its member index; runs in a worker process
+
+    Sessions that are gone or no longer exportable are skipped.
+    """
+    start = time.perf_counter()
+    name = shard_name(shard_idx)
+    tar_path = os.path.join(output_dir, f"{name}.tar")
+    tmp_path = f"{tar_path}.tmp"
+
+    index = {"shard": f"{name}.tar", "sessions": [], "skipped": []}
+    with profiling.phase("write_shard"), tarfile.open(
+        tmp_path, "w", format=tarfile.PAX_FORMAT
+    ) as tar:
+        for video_dir in video_dirs:
+            try:
+                members = session_members(video_dir)
+            except OSError:
+                members = None
+            if members is None:
+                index["skipped"].append(os.path.basename(video_dir))
+                continue
+            entry = {"session": os.path.basename(video_dir), "members": []}
+            for path, arcname in members:
+                tar.add(path, arcname=arcname)
+                # Data is the last thing written, padded to a whole block
+                size = tar.getmember(arcname).size
+                padded = -(-size // tarfile.BLOCKSIZE) * tarfile.BLOCKSIZE
+                entry["members"].append(
+                    {"name": arcname, "offset": tar.offset - padded, "size": size}
+                )
+            index["sessions"].append(entry)
+
+    index["bytes"] = os.path.getsize(tmp_path)
+    with open(os.path.join(output_dir, f"{name}.json.tmp"), "w") as f:
+        json.dump(index, f, indent=4)
+
+    # The tar is renamed last: its presence marks the shard as complete
+    os.replace(
+        os.path.join(output_dir, f"{name}.json.tmp"),
+        os.path.join(output_dir, f"{name}.json"),
+    )
+    os.replace(tmp_path, tar_path)
+    return {
+        "shard": shard_idx,
+        "bytes": index["bytes"],
+        "sessions": len(index["sessions"]),
+        "skipped": len(index["skipped"]),
+        "seconds": time.perf_counter() - start,
+    }
+
+
+def is_shard_complete(output_dir, shard_idx, sessions):
+    """True if the shard was written for exactly these planned sessions"""
+    name = shard_name(shard_idx)
+    tar_path = os.path.join(output_dir, f"{name}.tar")
+    try:
+        with open(os.path.join(output_dir, f"{name}.json")) as f:
+            index = json.load(f)
+    except (OSError, ValueError):
+        return False
+    # Sessions skipped when it was written still count as planned for it
+    written = [entry["session"] for entry in index["sessions"]]
+    return (
+        os.path.exists(tar_path)
+        and sorted(written + index.get("skipped", [])) == sorted(sessions)
+        and os.path.getsize(tar_path) == index["bytes"]
+    )
+
+
+def write_index(output_dir, plan):
+    shards = []
+    for shard_idx in range(len(plan["shards"])):
+        name = shard_name(shard_idx)
+        with open(os.path.join(output_dir, f"{name}.json")) as f:
+            shard_index = json.load(f)
+        shards.append(
+            {
+                "shard": f"{name}.tar",
+                "index": f"{name}.json",
+                "bytes": shard_index["bytes"],
+                "sessions": [entry["session"] for entry in shard_index["sessions"]],
+            }
+        )
+    with open(os.path.join(output_dir, INDEX_NAME), "w") as f:
+        json.dump({"shards": shards}, f, indent=4)
+
+
+def export(root_dir, output_dir, target_bytes, workers=None):
+    os.makedirs(output_dir, exist_ok=True)
+
+    sessions = {}
+    for name in sorted(os.listdir(root_dir)):
+        members = (
+            session_members(os.path.join(root_dir, name))
+            if os.path.isdir(os.path.join(root_dir, name))
+            else None
+        )
+        if members is not None:
+            sessions[name] = sum(os.path.getsize(path) for path, _ in members)
+
+    plan_path = os.path.join(output_dir, PLAN_NAME)
+    plan = None
+    if os.path.exists(plan_path):
+        with open(plan_path) as f:
+            plan = json.load(f)
+    plan = plan_shards(sessions, target_bytes, plan)
+    with open(f"{plan_path}.tmp", "w") as f:
+        json.dump(plan, f, indent=4)
+    os.replace(f"{plan_path}.tmp", plan_path)
+
+    pending = [
+        (shard_idx, shard["sessions"])
+        for shard_idx, shard in enumerate(plan["shards"])
+        if not is_shard_complete(output_dir, shard_idx, shard["sessions"])
+    ]
+    print(
+        f"{len(sessions)} sessions in {len(plan['shards'])} shards, "
+        f"{len(pending)} to write"
+    )
+
+    start = time.perf_counter()
+    written_bytes = 0
+    jobs = [
+        (output_dir, shard_idx, [os.path.join(root_dir, name) for name in names])
+        for shard_idx, names in pending
+    ]
+    for result in run_jobs(write_shard, jobs, workers):
+        written_bytes += result["bytes"]
+        skipped = ""
+        if result["skipped"]:
+            skipped = f" ({result['skipped']} missing sessions skipped)"
+        print(
+            f"Wrote {shard_name(result['shard'])}.tar: {result['sessions']} "
+            f"sessions, {result['bytes'] / (1024 * 1024):.1f} MB "
+            f"in {result['seconds']:.1f}s{skipped}"
+        )
+
+    write_index(output_dir, plan)
+    elapsed = time.perf_counter() - start
+    if pending:
+        written_mb = written_bytes / (1024 * 1024)
+        print(
+            f"Exported {written_mb:.1f} MB in {elapsed:.1f}s "
+            f"({written_mb / elapsed if elapsed > 0 else 0:.1f} MB/s)"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Pack sessions into tar shards")
+    parser.add_argument("output_dir", help="Directory to write shards to")
+    parser.add_argument("--root", default=ROOT_DIR, help="Directory of sessions")
+    parser.add_argument(
+        "--target-size-mb", type=int, default=1024, help="Target shard size"
+    )
+    parser.add_argument(
+        "--workers", type=int, default=os.cpu_count(), help="Worker processes"
+    )
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        help="Write shards in this process and write a per-phase profile report",
+    )
+    args = parser.parse_args()
+
+    with profiling.profile_command("data_utils.export_shards", args.profile):
+        export(
+            args.root, args.output_dir, args.target_size_mb * 1024 * 1024, args.workers
+        )
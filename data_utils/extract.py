@@ -0,0 +1,389 @@
+"""
+Batch extraction CLI
+
+Runs the combined extractor (extract_inputs.py) over every session under
+ROOT_DIR in a process pool. Sessions are skipped when their splits are up to
+date: either the outputs are newer than inputs.csv or the inputs.csv hash
+matches the one recorded by the last extraction. Each session's outputs are written to a
+temporary directory and swapped in at the end, so an interrupted run never
+leaves half-written splits behind.
+
+Outputs are either SPLIT_SIZE chunks in splits/ (the default, torch .pt files)
+or one memory-mappable array per modality in tensors/ (see session_tensors.py),
+which only needs NumPy: --format tensors runs without torch installed.
+With --streaming, splits are written chunk by chunk in bounded memory (see
+stream_extract.py).
+
+Usage:
+    python -m data_utils.extract [--root DIR] [--workers N] [--force]
+        [--modalities buttons mouse scroll gamepad_buttons ...]
+        [--format splits|tensors] [--streaming] [--profile]
+
+With --profile (or OWL_CONTROL_PROFILE=1) sessions are extracted in this
+process instead of the pool, so the per-phase report (see vg_control/profiling.py)
+covers the extraction itself.
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+from vg_control import profiling
+
+from . import extract_inputs, stream_extract
+from .config import FPS, KEYBINDS, ROOT_DIR, SPLIT_SIZE
+from .events import INPUT_NAMES, inputs_path
+from .session_tensors import (
+    INDEX_NAME,
+    SPLIT_PATTERN,
+    TENSORS_DIR,
+    SessionTensors,
+    write_session_tensors,
+)
+
+OUTPUT_DIRS = {
+    "splits": "splits",
+    "tensors": TENSORS_DIR,
+}
+
+MANIFEST_NAME = "extract_manifest.json"
+TMP_PREFIX = ".extract.tmp-"
+OLD_PREFIX = ".extract.old-"
+
+
+def hash_file(path, block_size=1 << 20):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        while block := f.read(block_size):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def extraction_config():
+    """Settings that change the outputs; a mismatch forces re-extraction"""
+    return {
+        "fps": FPS,
+        "split_size": SPLIT_SIZE,
+        "keybinds": KEYBINDS,
+        "frame_binning": "floor",
+    }
+
+
+def read_manifest(output_dir):
+    try:
+        with open(os.path.join(output_dir, MANIFEST_NAME)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def stale_modalities(video_dir, modalities, output_format="splits"):
+    """
+    Return the modalities whose outputs don't match the session's inputs.csv
+
+    Cheap mtime comparison first; if inputs.csv looks newer (e.g. it was copied
+    or touched) fall back to comparing its hash against the recorded one.
+    """
+    output_dir = os.path.join(video_dir, OUTPUT_DIRS[output_format])
+    manifest = read_manifest(output_dir)
+    if manifest is None or manifest.get("config") != extraction_config():
+        return list(modalities)
+
+    recorded = manifest.get("modalities", {})
+    stale = []
+    for modality in modalities:
+        outputs = recorded.get(modality, {}).get("outputs")
+        if not outputs or not all(
+            os.path.exists(os.path.join(output_dir, name)) for name in outputs
+        ):
+            stale.append(modality)
+    if len(stale) == len(modalities):
+        return stale
+
+    csv_path = inputs_path(video_dir)
+    manifest_path = os.path.join(output_dir, MANIFEST_NAME)
+    if os.path.getmtime(manifest_path) >= os.path.getmtime(csv_path):
+        return stale
+
+    inputs_sha256 = hash_file(csv_path)
+    for modality in modalities:
+        if modality in stale:
+            continue
+        if recorded[modality].get("inputs_sha256") != inputs_sha256:
+            stale.append(modality)
+    if not stale:
+        # Contents unchanged; refresh the manifest so the mtime check hits next time
+        os.utime(manifest_path)
+    return stale
+
+
+def cleanup_stale_dirs(video_dir):
+    """Remove temp/old split dirs left behind by an interrupted run"""
+    for name in os.listdir(video_dir):
+        if name.startswith((TMP_PREFIX, OLD_PREFIX)):
+            shutil.rmtree(os.path.join(video_dir, name), ignore_errors=True)
+
+
+def split_modality(name):
+    """Modality of a {chunk_idx:08d}_{modality}.pt chunk name, or None"""
+    match = SPLIT_PATTERN.match(name)
+    return match.group(2) if match else None
+
+
+def unmanaged_outputs(output_dir, recorded, stale):
+    """
+    Files in an existing splits/ that the manifest doesn't list (e.g. chunks
+    written before there was a manifest), except chunks of the modalities
+    being re-extracted; they're carried over rather than deleted
+    """
+    if not os.path.isdir(output_dir):
+        return []
+    managed = {name for entry in recorded.values() for name in entry["outputs"]}
+    return sorted(
+        name
+        for name in os.listdir(output_dir)
+        if name != MANIFEST_NAME
+        and name not in managed
+        and split_modality(name) not in stale
+    )
+
+
+def replace_dir(src, dst):
+    """
+    Move src into place at dst
+
+    os.replace can't overwrite a non-empty directory (and never a directory on
+    Windows), so the old one is renamed aside first and deleted afterwards.
+    """
+    old = None
+    if os.path.exists(dst):
+        old = os.path.join(os.path.dirname(dst), f"{OLD_PREFIX}{uuid.uuid4().hex[:8]}")
+        os.replace(dst, old)
+    os.replace(src, dst)
+    if old is not None:
+        shutil.rmtree(old, ignore_errors=True)
+
+
+def extract_session(
+    video_dir, modalities, force=False, output_format="splits", streaming=False
+):
+    """Extract one session; runs in a worker process"""
+    start = time.perf_counter()
+    csv_path = inputs_path(video_dir)
+    output_dir = os.path.join(video_dir, OUTPUT_DIRS[output_format])
+    result = {
+        "video_dir": video_dir,
+        "status": "skipped",
+        "input_bytes": os.path.getsize(csv_path),
+        "seconds": 0.0,
+    }
+
+    try:
+        cleanup_stale_dirs(video_dir)
+        if force:
+            stale = list(modalities)
+        else:
+            stale = stale_modalities(video_dir, modalities, output_format)
+        if not stale:
+            return result
+
+        with profiling.phase("hash_inputs"):
+            inputs_sha256 = hash_file(csv_path)
+        previous = read_manifest(output_dir) or {}
+        if previous.get("config") != extraction_config():
+            previous = {}
+        recorded = {
+            modality: entry
+            for modality, entry in previous.get("modalities", {}).items()
+            if modality not in stale
+        }
+
+        tmp_dir = os.path.join(video_dir, f"{TMP_PREFIX}{uuid.uuid4().hex[:8]}")
+        os.makedirs(tmp_dir)
+        try:
+            if output_format == "tensors":
+                # All modalities share index.json, so rewrite the whole directory
+                arrays = {}
+                dtypes = extract_inputs.modality_dtypes(stale)
+                # Keep every array that isn't re-extracted, in the manifest or not
+                if os.path.exists(os.path.join(output_dir, INDEX_NAME)):
+                    previous_tensors = SessionTensors(output_dir)
+                    for modality in previous_tensors.modalities:
+                        if modality in stale:
+                            continue
+                        # Copied out of the mapping, which must not outlive output_dir
+                        arrays[modality] = np.array(previous_tensors.read(modality))
+                        dtypes[modality] = previous_tensors.dtype(modality)
+                    del previous_tensors
+                arrays.update(extract_inputs.extract_arrays(video_dir, stale))
+                write_session_tensors(tmp_dir, arrays, dtypes)
+                for modality in stale:
+                    recorded[modality] = {
+                        "inputs_sha256": inputs_sha256,
+                        "outputs": [f"{modality}.npy"],
+                        "extracted_at": time.time(),
+                    }
+            else:
+                # Carry over the outputs of modalities that are still up to date
+                carried = [
+                    name for entry in recorded.values() for name in entry["outputs"]
+                ]
+                carried += unmanaged_outputs(output_dir, recorded, stale)
+                for name in carried:
+                    shutil.copy2(
+                        os.path.join(output_dir, name), os.path.join(tmp_dir, name)
+                    )
+
+                before = set(os.listdir(tmp_dir))
+                if streaming:
+                    stream = stream_extract.process_video(
+                        video_dir, output_dir=tmp_dir, modalities=stale
+                    )
+                    result["late_events"] = stream.late_events
+                else:
+                    extract_inputs.process_video(
+                        video_dir, output_dir=tmp_dir, modalities=stale
+                    )
+                written = set(os.listdir(tmp_dir)) - before
+                for modality in stale:
+                    recorded[modality] = {
+                        "inputs_sha256": inputs_sha256,
+                        "outputs": sorted(
+                            name for name in written if split_modality(name) == modality
+                        ),
+                        "extracted_at": time.time(),
+                    }
+
+            manifest = {"config": extraction_config(), "modalities": recorded}
+            with open(os.path.join(tmp_dir, MANIFEST_NAME), "w") as f:
+                json.dump(manifest, f, indent=4)
+
+            replace_dir(tmp_dir, output_dir)
+        finally:
+            if os.path.exists(tmp_dir):
+                shutil.rmtree(tmp_dir, ignore_errors=True)
+
+        result["status"] = "extracted"
+    except (OSError, ValueError, LookupError, RuntimeError) as e:
+        result["status"] = "failed"
+        result["error"] = f"{type(e).__name__}: {e}"
+    finally:
+        result["seconds"] = time.perf_counter() - start
+
+    return result
+
+
+def run_jobs(fn, jobs, workers):
+    """
+    Yield fn(*job) for every job as it finishes, from a process pool, or one
+    after another in this process while profiling
+    """
+    if profiling.is_enabled():
+        for job in jobs:
+            with profiling.phase(fn.__name__):
+                result = fn(*job)
+            yield result
+        return
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(fn, *job) for job in jobs]
+        for future in as_completed(futures):
+            yield future.result()
+
+
+def find_sessions(root_dir):
+    return sorted(
+        os.path.join(root_dir, name)
+        for name in os.listdir(root_dir)
+        if any(os.path.isfile(os.path.join(root_dir, name, n)) for n in INPUT_NAMES)
+    )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Extract per-frame input tensors")
+    parser.add_argument("--root", default=ROOT_DIR, help="Directory of sessions")
+    parser.add_argument(
+        "--workers", type=int, default=os.cpu_count(), help="Worker processes"
+    )
+    parser.add_argument(
+        "--modalities",
+        nargs="+",
+        choices=extract_inputs.MODALITIES,
+        default=list(extract_inputs.DEFAULT_MODALITIES),
+        help="Which tensors to extract",
+    )
+    parser.add_argument(
+        "--format",
+        choices=sorted(OUTPUT_DIRS),
+        default="splits",
+        help="splits/ chunks or one memory-mappable tensors/ file per modality",
+    )
+    parser.add_argument(
+        "--streaming",
+        action="store_true",
+        help="Write splits chunk by chunk with memory bounded by one chunk",
+    )
+    parser.add_argument(
+        "--force", action="store_true", help="Re-extract up-to-date sessions too"
+    )
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        help="Extract in this process and write a per-phase profile report",
+    )
+    args = parser.parse_args(argv)
+    if args.streaming and args.format != "splits":
+        parser.error("--streaming only supports --format splits")
+
+    with profiling.profile_command("data_utils.extract", args.profile):
+        return run(args)
+
+
+def run(args):
+    video_dirs = find_sessions(args.root)
+    print(f"Found {len(video_dirs)} sessions under {args.root}")
+
+    start = time.perf_counter()
+    counts = {"extracted": 0, "skipped": 0, "failed": 0}
+    extracted_bytes = 0
+
+    jobs = [
+        (video_dir, args.modalities, args.force, args.format, args.streaming)
+        for video_dir in video_dirs
+    ]
+    for done, result in enumerate(
+        run_jobs(extract_session, jobs, args.workers), start=1
+    ):
+        counts[result["status"]] += 1
+        if result["status"] == "extracted":
+            extracted_bytes += result["input_bytes"]
+
+        line = f"[{done}/{len(video_dirs)}] {result['status']:<9} {result['video_dir']}"
+        if result["status"] == "failed":
+            line += f" ({result['error']})"
+        elif result["status"] == "extracted":
+            line += f" in {result['seconds']:.2f}s"
+            if result.get("late_events"):
+                line += f", dropped {result['late_events']} out-of-order events"
+        print(line)
+
+    elapsed = time.perf_counter() - start
+    extracted_mb = extracted_bytes / (1024 * 1024)
+    print(
+        f"Extracted {counts['extracted']}, skipped {counts['skipped']}, "
+        f"failed {counts['failed']} in {elapsed:.1f}s "
+        f"({counts['extracted'] / elapsed if elapsed > 0 else 0:.2f} sessions/s, "
+        f"{extracted_mb / elapsed if elapsed > 0 else 0:.1f} MB/s of inputs)"
+    )
+    return 1 if counts["failed"] else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
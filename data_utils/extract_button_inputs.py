@@ -1,10 +1,12 @@
 import json
-from .config import FPS, ROOT_DIR, SPLIT_SIZE, KEYBINDS
-import pandas as pd
+from .config import FPS, KEYBINDS
+import numpy as np
 import os
-import torch
+
+from .events import inputs_path, read_events
 
 from .keybinds import CODE_TO_KEY
+from .session_tensors import save_splits, storage_to_tensor
 
 
 def get_ascii(keycode_int):
@@ -18,23 +20,123 @@ def get_keycode(ascii_char):
     return None
 
 
-def process_video(video_dir, return_tensor=False):
+def reduce_frame_events(button_data):
     """
-    Process button input data from a video directory containing inputs.csv
-    Extracts per-frame button states and saves as tensor chunks
+    Collapse the DOWN/UP events of every (frame, key) pair into a single event
+
+    The latest event of each pair is kept. It stays a DOWN if it is one, and an
+    UP becomes a TAP when the key was also pressed earlier in that frame. Works
+    on the whole table at once by sorting it and reducing over the sorted runs.
 
     Args:
-        video_dir: Path to directory containing inputs.csv
+        button_data: Events with "timestamp", "frame", "event_args" (key name)
+            and "event_type" ("DOWN" or "UP") columns
+
+    Returns:
+        One row per (frame, key), ordered by frame then key
+    """
+    if button_data.empty:
+        return button_data.reset_index(drop=True)
+
+    button_data = button_data.sort_values(
+        ["frame", "event_args", "timestamp"], kind="stable"
+    ).reset_index(drop=True)
+    frames = button_data["frame"].to_numpy()
+    keys = button_data["event_args"].to_numpy()
+    is_down = (button_data["event_type"] == "DOWN").to_numpy()
+
+    # Each (frame, key) pair is now a contiguous run of rows; find where runs end
+    is_last = np.ones(len(button_data), dtype=bool)
+    is_last[:-1] = (frames[1:] != frames[:-1]) | (keys[1:] != keys[:-1])
+    run_starts = np.flatnonzero(np.r_[True, is_last[:-1]])
+    has_down = np.logical_or.reduceat(is_down, run_starts)
+
+    reduced = button_data[is_last].reset_index(drop=True)
+    reduced["event_type"] = np.where(
+        is_down[is_last], "DOWN", np.where(has_down, "TAP", "UP")
+    )
+    return reduced
+
+
+def button_state_timeline(
+    frames,
+    key_indices,
+    event_types,
+    total_frames,
+    num_keys=None,
+    initial_state=None,
+):
+    """
+    Build the per-frame button state matrix from one reduced event per (frame, key)
+
+    Each key holds the state left by its latest event at or before a frame (DOWN
+    presses it, UP releases it) and a TAP is pressed for its own frame only.
+    Runs in O(total_frames * num_keys) by forward-filling transitions.
+
+    Args:
+        frames: Frame index of each event
+        key_indices: Column of each event (index into KEYBINDS by default)
+        event_types: "DOWN", "UP" or "TAP" for each event
+        total_frames: Number of frames in the output
+        num_keys: Number of columns in the output (len(KEYBINDS) if None)
+        initial_state: State of each key before frame 0 (all released if None)
+    """
+    if num_keys is None:
+        num_keys = len(KEYBINDS)
+    frames = np.asarray(frames, dtype=np.int64)
+    key_indices = np.asarray(key_indices, dtype=np.int64)
+    event_types = np.asarray(event_types)
+
+    # State each transition leaves its key in (-1 = no transition on that frame);
+    # a TAP leaves the key released once its frame is over
+    transitions = np.full((total_frames, num_keys), -1, dtype=np.int8)
+    transitions[frames, key_indices] = np.where(event_types == "DOWN", 1, 0)
+
+    # Forward-fill: every frame looks up the latest transition row at or before it
+    last_row = np.where(
+        transitions >= 0, np.arange(total_frames, dtype=np.int64)[:, None], 0
+    )
+    np.maximum.accumulate(last_row, axis=0, out=last_row)
+    filled = np.take_along_axis(transitions, last_row, axis=0)
+    state = filled == 1
+    if initial_state is not None:
+        # Frames before a key's first transition keep the state it started in
+        state = np.where(filled >= 0, state, np.asarray(initial_state, dtype=bool))
+
+    taps = event_types == "TAP"
+    state[frames[taps], key_indices[taps]] = True
+    return state
+
+
+def final_button_state(key_indices, event_types, initial_state):
+    """
+    State each key is left in after a run of reduced events ordered by frame
+
+    DOWN leaves a key pressed, UP and TAP leave it released, and keys without
+    events keep their initial state.
+    """
+    state = np.array(initial_state, dtype=bool)
+    key_indices = np.asarray(key_indices, dtype=np.int64)
+    if key_indices.size:
+        _, last_from_end = np.unique(key_indices[::-1], return_index=True)
+        latest = key_indices.size - 1 - last_from_end
+        state[key_indices[latest]] = np.asarray(event_types)[latest] == "DOWN"
+    return state
+
+
+def load_button_events(csv_path):
+    """
+    Load the button events of interest from an inputs.csv
+
+    Returns a DataFrame of KEYBINDS events trimmed to the START/END window, with
+    "event_args" holding the key name, "event_type" either "DOWN" or "UP" and
+    the "frame" each event falls in.
     """
     frame_duration = 1.0 / FPS
     valid_codes = [get_keycode(k) for k in KEYBINDS if (k != "LMB") and (k != "RMB")]
 
-    csv_path = os.path.join(video_dir, "inputs.csv")
-    output_dir = os.path.join(video_dir, "splits")
-    os.makedirs(output_dir, exist_ok=True)
-
     # Load and preprocess the CSV data
-    button_data = pd.read_csv(csv_path)
+    button_data = read_events(csv_path)
 
     # Find start time and normalize timestamps
     start_time = button_data.head(1000)[
@@ -122,65 +224,47 @@ def process_video(video_dir, return_tensor=False):
         button_data["event_type"].isin(["KEY_DOWN", "MOUSE_DOWN"]), "event_type"
     ] = "DOWN"
 
-    # Process events within each frame
-    def process_frame_events(group):
-        group = group.sort_values("timestamp")
-        down_events = group[group["event_type"] == "DOWN"]
-        up_events = group[group["event_type"] == "UP"]
-
-        if len(down_events) > 0 and len(up_events) == 0:
-            return down_events.iloc[-1:]
-        elif len(up_events) > 0 and len(down_events) == 0:
-            return up_events.iloc[-1:]
-
-        last_event = group.iloc[-1]
-        if last_event["event_type"] == "DOWN":
-            return pd.DataFrame([last_event])
-        else:
-            if len(down_events) > 0:
-                last_event = last_event.copy()
-                last_event["event_type"] = "TAP"
-                return pd.DataFrame([last_event])
-            else:
-                return pd.DataFrame([last_event])
-
-    # Process events by frame and key
-    button_data = (
-        button_data.groupby(["frame", "event_args"])
-        .apply(process_frame_events)
-        .reset_index(drop=True)
-    )
+    return button_data
 
-    # Convert to tensor
-    total_frames = button_data["frame"].max() + 1
-    button_tensor = torch.zeros((total_frames, len(KEYBINDS)), dtype=torch.bool)
 
-    for _, row in button_data.iterrows():
-        frame_idx = int(row["frame"])
-        key_idx = KEYBINDS.index(row["event_args"])
+def process_video(video_dir, return_tensor=False, output_dir=None):
+    """
+    Process button input data from a video directory containing inputs.csv
+    Extracts per-frame button states and saves as tensor chunks
+
+    Args:
+        video_dir: Path to directory containing inputs.csv
+        return_tensor: Return a torch bool tensor instead of saving chunks
+        output_dir: Where to save the chunks (defaults to video_dir/splits)
+    """
+    csv_path = inputs_path(video_dir)
+    if output_dir is None:
+        output_dir = os.path.join(video_dir, "splits")
 
-        event_type = row["event_type"]
-        if event_type == "DOWN":
-            button_tensor[frame_idx:, key_idx] = True
-        elif event_type == "UP":
-            button_tensor[frame_idx:, key_idx] = False
-        elif event_type == "TAP":
-            button_tensor[frame_idx:, key_idx] = False
-            button_tensor[frame_idx, key_idx] = True
+    button_data = load_button_events(csv_path)
+
+    # Collapse events within each frame
+    button_data = reduce_frame_events(button_data)
+
+    total_frames = button_data["frame"].max() + 1
+    buttons = button_state_timeline(
+        button_data["frame"].to_numpy(),
+        button_data["event_args"].map(KEYBINDS.index).to_numpy(),
+        button_data["event_type"].to_numpy(),
+        total_frames,
+    )
 
     if return_tensor:
-        return button_tensor
+        return storage_to_tensor(buttons, "bool")
 
     # Split into chunks and save
-    for chunk_idx in range(0, total_frames, SPLIT_SIZE):
-        end_idx = min(chunk_idx + SPLIT_SIZE, total_frames)
-        chunk = button_tensor[chunk_idx:end_idx]
-
-        output_path = os.path.join(output_dir, f"{chunk_idx:08d}_buttons.pt")
-        torch.save(chunk, output_path)
+    os.makedirs(output_dir, exist_ok=True)
+    save_splits(output_dir, {"buttons": buttons}, {"buttons": "bool"})
 
 
 if __name__ == "__main__":
-    for path in os.listdir(ROOT_DIR):
-        print(f"Processing {path}")
-        process_video(os.path.join(ROOT_DIR, path))
+    import sys
+
+    from .extract import main
+
+    main(["--modalities", "buttons", *sys.argv[1:]])
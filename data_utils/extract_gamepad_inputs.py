@@ -0,0 +1,180 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+from .config import GAMEPAD_AXES, GAMEPAD_BUTTONS, GAMEPAD_TRIGGERS
+from .events import event_args_array, inputs_path, load_session_events
+from .extract_button_inputs import button_state_timeline, reduce_frame_events
+from .session_tensors import save_splits, storage_to_tensor, to_storage
+
+GAMEPAD_DTYPES = {
+    "gamepad_buttons": "bool",
+    "gamepad_triggers": "float32",
+    "gamepad_axes": "float32",
+}
+
+
+def column_lookup(layout, ids):
+    """Map recorder ids to output columns of a layout (-1 for ids not in it)"""
+    lookup = np.full(max(layout) + 1, -1, dtype=np.int64)
+    lookup[list(layout)] = np.arange(len(layout))
+    ids = np.asarray(ids, dtype=np.int64)
+    in_table = (ids >= 0) & (ids < lookup.size)
+    columns = np.full(ids.shape, -1, dtype=np.int64)
+    columns[in_table] = lookup[ids[in_table]]
+    return columns
+
+
+def forward_fill_values(
+    timestamps, frames, columns, values, total_frames, num_columns, initial_values=None
+):
+    """
+    Per-frame value of each column, holding the latest value until it changes
+
+    The last event within a frame wins; columns start at initial_values (or 0)
+    until their first event. Runs in O(events + total_frames * num_columns).
+    """
+    order = np.argsort(timestamps, kind="stable")
+    frames, columns, values = frames[order], columns[order], values[order]
+
+    # Keep the latest event of each (frame, column)
+    cell = frames * num_columns + columns
+    _, last_from_end = np.unique(cell[::-1], return_index=True)
+    latest = cell.size - 1 - last_from_end
+
+    grid = np.zeros((total_frames, num_columns), dtype=np.float32)
+    has_value = np.zeros((total_frames, num_columns), dtype=bool)
+    grid[frames[latest], columns[latest]] = values[latest]
+    has_value[frames[latest], columns[latest]] = True
+    if initial_values is not None:
+        grid[0] = np.where(has_value[0], grid[0], initial_values)
+
+    # Forward-fill: every frame looks up the latest row that set a value
+    last_row = np.where(has_value, np.arange(total_frames, dtype=np.int64)[:, None], 0)
+    np.maximum.accumulate(last_row, axis=0, out=last_row)
+    # Frames before a column's first event land on row 0, which is still 0 there
+    return np.take_along_axis(grid, last_row, axis=0)
+
+
+def select_events(events, event_type, layout, total_frames):
+    """Parse one gamepad event type and keep the events that map onto layout"""
+    rows = events[events["event_type"] == event_type]
+    args = event_args_array(rows, 2)
+    columns = column_lookup(layout, args[:, 0])
+    frames = rows["frame"].to_numpy()
+    keep = (columns >= 0) & (frames < total_frames)
+    return (
+        rows["timestamp"].to_numpy()[keep],
+        frames[keep],
+        columns[keep],
+        args[keep, 1],
+    )
+
+
+def gamepad_button_events(events, total_frames):
+    """
+    One reduced DOWN/UP/TAP event per (frame, button)
+
+    Returns (frames, column indices, event types), ordered by frame.
+    """
+    timestamps, frames, columns, pressed = select_events(
+        events, "GAMEPAD_BUTTON", GAMEPAD_BUTTONS, total_frames
+    )
+    button_data = pd.DataFrame(
+        {
+            "timestamp": timestamps,
+            "frame": frames,
+            "event_args": columns,
+            "event_type": np.where(pressed != 0, "DOWN", "UP"),
+        }
+    )
+    button_data = reduce_frame_events(button_data)
+    return (
+        button_data["frame"].to_numpy(),
+        button_data["event_args"].to_numpy(),
+        button_data["event_type"].to_numpy(),
+    )
+
+
+def extract_gamepad_buttons(events, total_frames, initial_state=None):
+    """Per-frame GAMEPAD_BUTTONS state (bool), with the keyboard DOWN/UP/TAP rules"""
+    return button_state_timeline(
+        *gamepad_button_events(events, total_frames),
+        total_frames,
+        num_keys=len(GAMEPAD_BUTTONS),
+        initial_state=initial_state,
+    )
+
+
+def extract_gamepad_triggers(events, total_frames, initial_values=None):
+    """Per-frame analog GAMEPAD_TRIGGERS values (float32), forward-filled"""
+    return forward_fill_values(
+        *select_events(events, "GAMEPAD_BUTTON_VALUE", GAMEPAD_TRIGGERS, total_frames),
+        total_frames,
+        len(GAMEPAD_TRIGGERS),
+        initial_values=initial_values,
+    )
+
+
+def extract_gamepad_axes(events, total_frames, initial_values=None):
+    """Per-frame GAMEPAD_AXES values (float32), forward-filled"""
+    return forward_fill_values(
+        *select_events(events, "GAMEPAD_AXIS", GAMEPAD_AXES, total_frames),
+        total_frames,
+        len(GAMEPAD_AXES),
+        initial_values=initial_values,
+    )
+
+
+def process_video(video_dir, return_tensor=False, output_dir=None):
+    """
+    Process gamepad input data from a video directory containing inputs.csv
+    Extracts per-frame button states, trigger values and axis values and saves
+    them as tensor chunks
+
+    Args:
+        video_dir: Path to directory containing inputs.csv (or inputs.evlog)
+        return_tensor: Return {modality: torch tensor} instead of saving chunks
+        output_dir: Where to save the chunks (defaults to video_dir/splits)
+    """
+    csv_path = inputs_path(video_dir)
+    if output_dir is None:
+        output_dir = os.path.join(video_dir, "splits")
+
+    events, total_frames = load_session_events(csv_path)
+    extractors = {
+        "gamepad_buttons": extract_gamepad_buttons,
+        "gamepad_triggers": extract_gamepad_triggers,
+        "gamepad_axes": extract_gamepad_axes,
+    }
+    arrays = {
+        modality: to_storage(extract(events, total_frames), GAMEPAD_DTYPES[modality])
+        for modality, extract in extractors.items()
+    }
+
+    if return_tensor:
+        return {
+            modality: storage_to_tensor(array, GAMEPAD_DTYPES[modality])
+            for modality, array in arrays.items()
+        }
+
+    # Split into chunks and save
+    os.makedirs(output_dir, exist_ok=True)
+    save_splits(output_dir, arrays, GAMEPAD_DTYPES)
+
+
+if __name__ == "__main__":
+    import sys
+
+    from .extract import main
+
+    main(
+        [
+            "--modalities",
+            "gamepad_buttons",
+            "gamepad_triggers",
+            "gamepad_axes",
+            *sys.argv[1:],
+        ]
+    )
@@ -0,0 +1,198 @@
+"""
+One-pass extraction of every input modality of a session
+
+The session's inputs.csv (or inputs.evlog) is loaded once and each modality
+(keyboard/mouse buttons, mouse movement, scroll and, optionally, gamepad
+buttons, triggers and axes) is binned onto the same FPS frame grid. Arrays are
+produced in their stored form (see session_tensors.py) and saved as splits/
+chunks, or handed back as tensors with return_tensor.
+"""
+
+import os
+
+import numpy as np
+import pandas as pd
+
+from vg_control import profiling
+
+from .config import KEYBINDS
+from .events import event_args_array, inputs_path, load_session_events
+from .extract_button_inputs import (
+    button_state_timeline,
+    get_keycode,
+    reduce_frame_events,
+)
+from .extract_gamepad_inputs import (
+    extract_gamepad_axes,
+    extract_gamepad_buttons,
+    extract_gamepad_triggers,
+)
+from .extract_mouse_inputs import mean_movement_per_frame
+from .keybinds import CODE_TO_KEY
+from .session_tensors import save_splits, storage_to_tensor, to_storage
+
+MODALITIES = (
+    "buttons",
+    "mouse",
+    "scroll",
+    "gamepad_buttons",
+    "gamepad_triggers",
+    "gamepad_axes",
+)
+DEFAULT_MODALITIES = ("buttons", "mouse", "scroll")
+MOUSE_BUTTONS = {1: "LMB", 2: "RMB"}
+
+
+def button_events(events, total_frames):
+    """
+    One reduced DOWN/UP/TAP event per (frame, KEYBINDS key)
+
+    Returns (frames, KEYBINDS indices, event types), ordered by frame.
+    """
+    key_names = {get_keycode(k): k for k in KEYBINDS if k in CODE_TO_KEY.values()}
+
+    keyboard = events[events["event_type"] == "KEYBOARD"]
+    keyboard_args = event_args_array(keyboard, 2)
+    mouse = events[events["event_type"] == "MOUSE_BUTTON"]
+    mouse_args = event_args_array(mouse, 2)
+
+    button_data = pd.concat(
+        [
+            pd.DataFrame(
+                {
+                    "timestamp": keyboard["timestamp"].to_numpy(),
+                    "frame": keyboard["frame"].to_numpy(),
+                    "event_args": pd.Series(keyboard_args[:, 0]).map(key_names),
+                    "is_pressed": keyboard_args[:, 1] != 0,
+                }
+            ),
+            pd.DataFrame(
+                {
+                    "timestamp": mouse["timestamp"].to_numpy(),
+                    "frame": mouse["frame"].to_numpy(),
+                    "event_args": pd.Series(mouse_args[:, 0]).map(MOUSE_BUTTONS),
+                    "is_pressed": mouse_args[:, 1] != 0,
+                }
+            ),
+        ],
+        ignore_index=True,
+    )
+    button_data = button_data[
+        button_data["event_args"].notna()
+        & button_data["event_args"].isin(KEYBINDS)
+        & (button_data["frame"] < total_frames)
+    ].reset_index(drop=True)
+    button_data["event_type"] = np.where(button_data["is_pressed"], "DOWN", "UP")
+
+    button_data = reduce_frame_events(button_data)
+    return (
+        button_data["frame"].to_numpy(),
+        button_data["event_args"].map(KEYBINDS.index).to_numpy(dtype=np.int64),
+        button_data["event_type"].to_numpy(),
+    )
+
+
+def extract_buttons(events, total_frames, initial_state=None):
+    """Per-frame KEYBINDS state (bool, shape (total_frames, len(KEYBINDS)))"""
+    return button_state_timeline(
+        *button_events(events, total_frames),
+        total_frames,
+        initial_state=initial_state,
+    )
+
+
+def extract_mouse(events, total_frames):
+    """Per-frame mean mouse dx, dy (float64, shape (total_frames, 2))"""
+    moves = events[events["event_type"] == "MOUSE_MOVE"]
+    deltas = event_args_array(moves, 2)
+    frames = moves["frame"].to_numpy()
+    in_range = frames < total_frames
+    return mean_movement_per_frame(
+        frames[in_range], deltas[in_range, 0], deltas[in_range, 1], total_frames
+    )
+
+
+def extract_scroll(events, total_frames):
+    """Per-frame total scroll amount (int32, shape (total_frames, 1))"""
+    scrolls = events[events["event_type"] == "SCROLL"]
+    amounts = event_args_array(scrolls, 1)[:, 0]
+    frames = scrolls["frame"].to_numpy()
+    in_range = frames < total_frames
+    totals = np.bincount(
+        frames[in_range], weights=amounts[in_range], minlength=total_frames
+    )
+    return totals.astype(np.int32)[:, None]
+
+
+# modality -> (extractor, logical dtype it is stored as; see session_tensors.py)
+EXTRACTORS = {
+    "buttons": (extract_buttons, "bool"),
+    "mouse": (extract_mouse, "bfloat16"),
+    "scroll": (extract_scroll, "int32"),
+    "gamepad_buttons": (extract_gamepad_buttons, "bool"),
+    "gamepad_triggers": (extract_gamepad_triggers, "float32"),
+    "gamepad_axes": (extract_gamepad_axes, "float32"),
+}
+
+
+def modality_dtypes(modalities):
+    return {modality: EXTRACTORS[modality][1] for modality in modalities}
+
+
+def extract_arrays(video_dir, modalities=None):
+    """
+    {modality: NumPy array} for a session in one pass over its log, in stored
+    form (bool, int32, float32, or bfloat16 as uint16 bits); doesn't need torch
+
+    Args:
+        video_dir: Path to directory containing inputs.csv (or inputs.evlog)
+        modalities: Subset of MODALITIES to extract (defaults to DEFAULT_MODALITIES)
+    """
+    modalities = DEFAULT_MODALITIES if modalities is None else modalities
+    with profiling.phase("load_events", trace_memory=True):
+        events, total_frames = load_session_events(inputs_path(video_dir))
+
+    arrays = {}
+    for modality in modalities:
+        extract, dtype = EXTRACTORS[modality]
+        with profiling.phase(f"extract_{modality}", trace_memory=True):
+            arrays[modality] = to_storage(extract(events, total_frames), dtype)
+    return arrays
+
+
+def process_video(video_dir, return_tensor=False, output_dir=None, modalities=None):
+    """
+    Process button, mouse, scroll and (optionally) gamepad data from a video
+    directory containing inputs.csv (or inputs.evlog) in a single pass over the
+    log, with the same frame binning for every modality
+
+    Args:
+        video_dir: Path to directory containing inputs.csv (or inputs.evlog)
+        return_tensor: Return {modality: torch tensor} instead of saving chunks
+        output_dir: Where to save the chunks (defaults to video_dir/splits)
+        modalities: Subset of MODALITIES to extract (defaults to DEFAULT_MODALITIES)
+    """
+    modalities = DEFAULT_MODALITIES if modalities is None else modalities
+    if output_dir is None:
+        output_dir = os.path.join(video_dir, "splits")
+
+    arrays = extract_arrays(video_dir, modalities)
+    dtypes = modality_dtypes(modalities)
+    if return_tensor:
+        return {
+            modality: storage_to_tensor(array, dtypes[modality])
+            for modality, array in arrays.items()
+        }
+
+    # Split into chunks and save
+    os.makedirs(output_dir, exist_ok=True)
+    with profiling.phase("save_chunks"):
+        save_splits(output_dir, arrays, dtypes)
+
+
+if __name__ == "__main__":
+    import sys
+
+    from .extract import main
+
+    main(sys.argv[1:])
@@ -1,26 +1,24 @@
 import json
-from .config import FPS, ROOT_DIR, SPLIT_SIZE
+from .config import FPS
+import numpy as np
 import pandas as pd
 import os
-import torch
 
+from .events import inputs_path, read_events
+from .session_tensors import save_splits, storage_to_tensor, to_storage
 
-def process_video(video_dir, return_tensor=False):
+
+def load_mouse_moves(csv_path):
     """
-    Process mouse movement data from a video directory containing inputs.csv
-    Extracts per-frame mouse delta movements and saves as tensor chunks
+    Load the MOUSE_MOVE events from an inputs.csv
 
-    Args:
-        video_dir: Path to directory containing inputs.csv
+    Returns a DataFrame trimmed to the START/END window with the "frame" each
+    move falls in and its "dx"/"dy" deltas.
     """
     frame_duration = 1.0 / FPS
 
-    csv_path = os.path.join(video_dir, "inputs.csv")
-    output_dir = os.path.join(video_dir, "splits")
-    os.makedirs(output_dir, exist_ok=True)
-
     # Load and preprocess the CSV data
-    mouse_data = pd.read_csv(csv_path)
+    mouse_data = read_events(csv_path)
 
     # Find start time and normalize timestamps
     start_time = mouse_data.head(1000)[
@@ -52,34 +50,74 @@ def process_video(video_dir, return_tensor=False):
         mouse_moves["event_args"].tolist(), index=mouse_moves.index
     )
 
-    # Aggregate by frame
-    frame_data = (
-        mouse_moves.groupby("frame").agg({"dx": "mean", "dy": "mean"}).reset_index()
+    return mouse_moves
+
+
+def mean_movement_per_frame(frames, dx, dy, total_frames):
+    """
+    Average the mouse deltas that fall in each frame
+
+    Sums and counts are accumulated with bincount in one pass over the moves;
+    frames without any movement stay at zero.
+
+    Returns:
+        float64 array of shape (total_frames, 2) with the mean dx, dy per frame
+    """
+    frames = np.asarray(frames, dtype=np.int64)
+    counts = np.bincount(frames, minlength=total_frames)
+    sums = np.stack(
+        [
+            np.bincount(frames, weights=dx, minlength=total_frames),
+            np.bincount(frames, weights=dy, minlength=total_frames),
+        ],
+        axis=1,
     )
 
-    # Convert to tensor
-    total_frames = frame_data["frame"].max() + 1
-    movement_tensor = torch.zeros((total_frames, 2), dtype=torch.bfloat16)
+    means = np.zeros((total_frames, 2), dtype=np.float64)
+    moved = counts > 0
+    means[moved] = sums[moved] / counts[moved, None]
+    return means
 
-    for _, row in frame_data.iterrows():
-        frame_idx = int(row["frame"])
-        movement_tensor[frame_idx] = torch.tensor(
-            [row["dx"], row["dy"]], dtype=torch.bfloat16
-        )
+
+def process_video(video_dir, return_tensor=False, output_dir=None):
+    """
+    Process mouse movement data from a video directory containing inputs.csv
+    Extracts per-frame mouse delta movements and saves as tensor chunks
+
+    Args:
+        video_dir: Path to directory containing inputs.csv
+        return_tensor: Return a torch bfloat16 tensor instead of saving chunks
+        output_dir: Where to save the chunks (defaults to video_dir/splits)
+    """
+    csv_path = inputs_path(video_dir)
+    if output_dir is None:
+        output_dir = os.path.join(video_dir, "splits")
+
+    mouse_moves = load_mouse_moves(csv_path)
+
+    # Aggregate by frame and round to bfloat16 in one go
+    total_frames = mouse_moves["frame"].max() + 1
+    movement = to_storage(
+        mean_movement_per_frame(
+            mouse_moves["frame"].to_numpy(),
+            mouse_moves["dx"].to_numpy(dtype=np.float64),
+            mouse_moves["dy"].to_numpy(dtype=np.float64),
+            total_frames,
+        ),
+        "bfloat16",
+    )
 
     if return_tensor:
-        return movement_tensor
+        return storage_to_tensor(movement, "bfloat16")
 
     # Split into chunks and save
-    for chunk_idx in range(0, total_frames, SPLIT_SIZE):
-        end_idx = min(chunk_idx + SPLIT_SIZE, total_frames)
-        chunk = movement_tensor[chunk_idx:end_idx]
-
-        output_path = os.path.join(output_dir, f"{chunk_idx:08d}_mouse.pt")
-        torch.save(chunk, output_path)
+    os.makedirs(output_dir, exist_ok=True)
+    save_splits(output_dir, {"mouse": movement}, {"mouse": "bfloat16"})
 
 
 if __name__ == "__main__":
-    for path in os.listdir(ROOT_DIR):
-        print(f"Processing {path}")
-        process_video(os.path.join(ROOT_DIR, path))
+    import sys
+
+    from .extract import main
+
+    main(["--modalities", "mouse", *sys.argv[1:]])
@@ -0,0 +1,49 @@
+"""
+Keyframe lookups for clip loaders
+
+Packaging stores a keyframe index (video frame -> byte offset and decode time)
+in each session's metadata.json, read from the mp4's sample tables. Loaders
+that sample clips can use it to seek to the keyframe at or before the first
+frame they need instead of scanning the video.
+"""
+
+import bisect
+import glob
+import json
+import os
+
+from vg_control.data.mp4 import keyframe_index
+
+
+def load_keyframe_index(video_dir):
+    """
+    The session's keyframe index, from metadata.json or (for sessions packaged
+    before it was recorded there) straight from the mp4 header
+    """
+    meta_path = os.path.join(video_dir, "metadata.json")
+    if os.path.exists(meta_path):
+        with open(meta_path) as f:
+            metadata = json.load(f)
+        if "keyframe_index" in metadata:
+            return metadata["keyframe_index"]
+
+    videos = sorted(glob.glob(os.path.join(video_dir, "*.mp4")))
+    if not videos:
+        raise FileNotFoundError(f"No mp4 in {video_dir}")
+    return keyframe_index(videos[0])
+
+
+def keyframe_before(index, frame):
+    """
+    The keyframe to start decoding from to reach `frame` (a video frame number)
+
+    Returns a dict with the keyframe's frame, byte offset and time_ms.
+    """
+    position = bisect.bisect_right(index["frame"], frame) - 1
+    if position < 0:
+        raise ValueError(f"No keyframe at or before frame {frame}")
+    return {
+        "frame": index["frame"][position],
+        "offset": index["offset"][position],
+        "time_ms": index["time_ms"][position],
+    }
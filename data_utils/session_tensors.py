@@ -0,0 +1,304 @@
+"""
+Per-session memory-mapped tensor files
+
+Instead of one small torch.save file per SPLIT_SIZE frames, each modality of a
+session is stored as a single contiguous .npy array under video_dir/tensors/,
+next to an index.json header holding the FPS, keybind layout and each
+modality's file, dtype and shape. Arrays are opened with np.load(mmap_mode="r"),
+so any frame range can be sliced without reading or copying the rest.
+
+bfloat16 has no NumPy dtype, so those arrays are stored as their raw uint16
+bits and reinterpreted on the way out. The extractors produce arrays in this
+stored form directly (see to_storage), so neither extracting nor writing
+tensors/ needs torch; torch is only imported to hand out tensors or to read
+and write the .pt chunks in splits/.
+
+Usage:
+    python -m data_utils.session_tensors convert [--root DIR] [--remove-splits]
+"""
+
+import argparse
+import glob
+import json
+import os
+import re
+import shutil
+
+import numpy as np
+
+from vg_control import profiling
+
+from .config import (
+    FPS,
+    GAMEPAD_AXES,
+    GAMEPAD_BUTTONS,
+    GAMEPAD_TRIGGERS,
+    KEYBINDS,
+    ROOT_DIR,
+    SPLIT_SIZE,
+)
+
+TENSORS_DIR = "tensors"
+INDEX_NAME = "index.json"
+FORMAT_VERSION = 1
+
+COLUMNS = {
+    "buttons": KEYBINDS,
+    "mouse": ["dx", "dy"],
+    "scroll": ["amount"],
+    "gamepad_buttons": list(GAMEPAD_BUTTONS.values()),
+    "gamepad_triggers": list(GAMEPAD_TRIGGERS.values()),
+    "gamepad_axes": list(GAMEPAD_AXES.values()),
+}
+
+SPLIT_PATTERN = re.compile(r"^(\d{8})_(\w+)\.pt$")
+
+# NumPy dtype each logical dtype is stored as
+STORAGE_DTYPES = {
+    "bool": np.bool_,
+    "int32": np.int32,
+    "float32": np.float32,
+    "bfloat16": np.uint16,
+}
+
+
+def float_to_bfloat16_bits(values):
+    """
+    Round float values to bfloat16 and return their uint16 bit patterns
+
+    Rounds to nearest, ties to even, with NaN mapped to the canonical quiet
+    NaN, bit for bit like torch's .to(torch.bfloat16).
+    """
+    with np.errstate(over="ignore"):
+        floats = np.ascontiguousarray(values, dtype=np.float32)
+    bits = floats.view(np.uint32)
+    rounding = ((bits >> 16) & 1) + np.uint32(0x7FFF)
+    rounded = ((bits + rounding) >> 16).astype(np.uint16)
+    return np.where(np.isnan(floats), np.uint16(0x7FC0), rounded)
+
+
+def to_storage(array, dtype):
+    """Cast an extractor's output to the stored form of a logical dtype name"""
+    if dtype == "bfloat16":
+        return float_to_bfloat16_bits(array)
+    return np.ascontiguousarray(array, dtype=STORAGE_DTYPES[dtype])
+
+
+def storage_to_tensor(array, dtype):
+    """Copy a stored array into a torch tensor of its logical dtype"""
+    import torch
+
+    array = np.array(array)
+    if dtype == "bfloat16":
+        return torch.from_numpy(array.view(np.int16)).view(torch.bfloat16)
+    return torch.from_numpy(array)
+
+
+def to_storage_array(tensor, dtype=None):
+    """
+    Convert a tensor/array to (NumPy array to store, logical dtype name)
+
+    NumPy arrays already in stored form pass their logical dtype (needed for
+    bfloat16, whose bits look like uint16).
+    """
+    if isinstance(tensor, np.ndarray):
+        if dtype is not None:
+            return np.ascontiguousarray(tensor, dtype=STORAGE_DTYPES[dtype]), dtype
+        return np.ascontiguousarray(tensor), str(tensor.dtype)
+
+    import torch
+
+    if tensor.dtype == torch.bfloat16:
+        bits = tensor.contiguous().view(torch.int16).numpy().view(np.uint16)
+        return bits, "bfloat16"
+    array = tensor.contiguous().numpy()
+    return array, str(array.dtype)
+
+
+def write_session_tensors(output_dir, tensors, dtypes=None):
+    """
+    Write one .npy per modality plus index.json into output_dir
+
+    Args:
+        output_dir: Directory to write to (created if missing)
+        tensors: Mapping of modality name to a torch tensor or NumPy array with
+            frames on dim0
+        dtypes: Logical dtype name of NumPy arrays given in stored form
+
+    Returns:
+        Names of the files written
+    """
+    os.makedirs(output_dir, exist_ok=True)
+
+    index = {
+        "version": FORMAT_VERSION,
+        "fps": FPS,
+        "keybinds": KEYBINDS,
+        "modalities": {},
+    }
+    written = []
+    for name, tensor in tensors.items():
+        array, dtype = to_storage_array(tensor, (dtypes or {}).get(name))
+        filename = f"{name}.npy"
+        np.save(os.path.join(output_dir, filename), array)
+        index["modalities"][name] = {
+            "file": filename,
+            "dtype": dtype,
+            "shape": list(array.shape),
+            "columns": COLUMNS.get(name),
+        }
+        written.append(filename)
+
+    with open(os.path.join(output_dir, INDEX_NAME), "w") as f:
+        json.dump(index, f, indent=4)
+    written.append(INDEX_NAME)
+    return written
+
+
+class SessionTensors:
+    """
+    Read-only view over a session's tensors/ directory
+
+    Arrays are memory-mapped on first use; slices are views into the mapping.
+    """
+
+    def __init__(self, tensors_dir):
+        self.tensors_dir = tensors_dir
+        with open(os.path.join(tensors_dir, INDEX_NAME)) as f:
+            self.index = json.load(f)
+        self.fps = self.index["fps"]
+        self.keybinds = self.index["keybinds"]
+        self._arrays = {}
+
+    @property
+    def modalities(self):
+        return list(self.index["modalities"])
+
+    def dtype(self, modality):
+        return self.index["modalities"][modality]["dtype"]
+
+    def num_frames(self, modality):
+        return self.index["modalities"][modality]["shape"][0]
+
+    def array(self, modality):
+        if modality not in self._arrays:
+            info = self.index["modalities"][modality]
+            self._arrays[modality] = np.load(
+                os.path.join(self.tensors_dir, info["file"]), mmap_mode="r"
+            )
+        return self._arrays[modality]
+
+    def read(self, modality, start=0, stop=None):
+        """
+        Frames [start, stop) of a modality as a zero-copy NumPy view
+
+        bfloat16 modalities come back as their uint16 bit patterns; use
+        read_tensor (or bfloat16_bits_to_float32) to get values.
+        """
+        return self.array(modality)[start:stop]
+
+    def read_tensor(self, modality, start=0, stop=None):
+        """Frames [start, stop) copied into a torch tensor with the original dtype"""
+        return storage_to_tensor(self.read(modality, start, stop), self.dtype(modality))
+
+
+def bfloat16_bits_to_float32(bits):
+    """Widen stored bfloat16 bit patterns to float32 values (exact)"""
+    return (np.asarray(bits, dtype=np.uint16).astype(np.uint32) << 16).view(np.float32)
+
+
+def open_session(video_dir):
+    return SessionTensors(os.path.join(video_dir, TENSORS_DIR))
+
+
+def save_splits(output_dir, arrays, dtypes, first_frame=0):
+    """
+    Save stored arrays as {chunk_idx:08d}_{modality}.pt chunks of SPLIT_SIZE
+    frames in splits/ form (needs torch)
+
+    Args:
+        output_dir: Directory to write to
+        arrays: Mapping of modality name to array in stored form
+        dtypes: Logical dtype name of each modality
+        first_frame: Frame of the arrays' first row (for streamed chunks)
+    """
+    import torch
+
+    for modality, array in arrays.items():
+        for start in range(0, len(array), SPLIT_SIZE):
+            # Each chunk gets its own storage, so it doesn't serialize the rest
+            rows = array[start : start + SPLIT_SIZE]
+            chunk = storage_to_tensor(rows, dtypes[modality])
+            output_path = os.path.join(
+                output_dir, f"{first_frame + start:08d}_{modality}.pt"
+            )
+            torch.save(chunk, output_path)
+
+
+def load_splits(splits_dir):
+    """Concatenate the .pt chunks of each modality in a splits/ directory"""
+    import torch
+
+    chunks = {}
+    for path in sorted(glob.glob(os.path.join(splits_dir, "*.pt"))):
+        match = SPLIT_PATTERN.match(os.path.basename(path))
+        if match is None:
+            continue
+        chunk_idx, modality = int(match.group(1)), match.group(2)
+        chunks.setdefault(modality, []).append((chunk_idx, path))
+
+    tensors = {}
+    for modality, entries in chunks.items():
+        entries.sort()
+        tensors[modality] = torch.cat([torch.load(path) for _, path in entries])
+    return tensors
+
+
+def convert_splits(video_dir, remove_splits=False):
+    """
+    Convert a session's splits/ chunks into tensors/
+
+    The new directory is written next to the old one and renamed into place,
+    so an interrupted conversion leaves the previous state untouched.
+    """
+    splits_dir = os.path.join(video_dir, "splits")
+    with profiling.phase("load_splits", trace_memory=True):
+        tensors = load_splits(splits_dir)
+    if not tensors:
+        return False
+
+    output_dir = os.path.join(video_dir, TENSORS_DIR)
+    tmp_dir = f"{output_dir}.tmp"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    with profiling.phase("write_session_tensors"):
+        write_session_tensors(tmp_dir, tensors)
+    shutil.rmtree(output_dir, ignore_errors=True)
+    os.replace(tmp_dir, output_dir)
+
+    if remove_splits:
+        shutil.rmtree(splits_dir)
+    return True
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Per-session tensor files")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    convert = subparsers.add_parser("convert", help="Convert splits/ to tensors/")
+    convert.add_argument("--root", default=ROOT_DIR, help="Directory of sessions")
+    convert.add_argument(
+        "--remove-splits", action="store_true", help="Delete splits/ afterwards"
+    )
+    convert.add_argument(
+        "--profile", action="store_true", help="Write a per-phase profile report"
+    )
+    args = parser.parse_args()
+
+    with profiling.profile_command("data_utils.session_tensors", args.profile):
+        for path in sorted(os.listdir(args.root)):
+            video_dir = os.path.join(args.root, path)
+            if not os.path.isdir(os.path.join(video_dir, "splits")):
+                continue
+            if convert_splits(video_dir, remove_splits=args.remove_splits):
+                print(f"Converted {path}")
+            else:
+                print(f"No splits found in {path}")
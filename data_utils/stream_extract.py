@@ -0,0 +1,287 @@
+"""
+Bounded-memory streaming extraction
+
+extract_inputs.process_video loads the whole inputs.csv and builds every
+(total_frames, K) tensor before splitting it, so a multi-hour session (or a
+stray timestamp that inflates total_frames) can exhaust memory. This walks the
+log in blocks of rows instead and writes each SPLIT_SIZE chunk as soon as the
+log has moved past it. Button and gamepad state is carried from one chunk into
+the next, so peak memory is one chunk of tensors plus one block of rows, and
+the chunks are identical to the ones process_video writes.
+
+Event logs (inputs.evlog) are streamed the same way, block by block out of
+their memory-mapped columns.
+
+The recorder writes the log in time order. An event that arrives after its
+chunk has been written (a timestamp that went backwards across a chunk
+boundary) can't be applied any more; it is dropped and counted.
+
+Usage:
+    python -m data_utils.extract --streaming [--root DIR] ...
+"""
+
+import os
+
+import numpy as np
+import pandas as pd
+
+from vg_control import profiling
+from vg_control.data.input_utils.event_log import EventLog, is_event_log
+
+from .config import GAMEPAD_BUTTONS, KEYBINDS, SPLIT_SIZE
+from .events import frame_index, inputs_path
+from .extract_button_inputs import button_state_timeline, final_button_state
+from .extract_gamepad_inputs import (
+    extract_gamepad_axes,
+    extract_gamepad_triggers,
+    gamepad_button_events,
+)
+from .extract_inputs import (
+    DEFAULT_MODALITIES,
+    EXTRACTORS,
+    button_events,
+    extract_mouse,
+    extract_scroll,
+    modality_dtypes,
+)
+from .session_tensors import save_splits, to_storage
+
+DEFAULT_BLOCK_ROWS = 100_000
+TAIL_BYTES = 64 * 1024
+
+
+def stream_buttons(events, num_frames, state, reduce_events, num_keys):
+    if state is None:
+        state = np.zeros(num_keys, dtype=bool)
+    frames, key_indices, event_types = reduce_events(events, num_frames)
+    timeline = button_state_timeline(
+        frames, key_indices, event_types, num_frames, num_keys, initial_state=state
+    )
+    return timeline, final_button_state(key_indices, event_types, state)
+
+
+def stream_values(events, num_frames, state, extract):
+    values = extract(events, num_frames, initial_values=state)
+    return values, values[-1].copy()
+
+
+def stream_stateless(events, num_frames, state, extract):
+    return extract(events, num_frames), None
+
+
+# modality -> fn(events, num_frames, carried state) -> (array, state to carry on)
+STREAMERS = {
+    "buttons": lambda events, n, state: stream_buttons(
+        events, n, state, button_events, len(KEYBINDS)
+    ),
+    "mouse": lambda events, n, state: stream_stateless(events, n, state, extract_mouse),
+    "scroll": lambda events, n, state: stream_stateless(
+        events, n, state, extract_scroll
+    ),
+    "gamepad_buttons": lambda events, n, state: stream_buttons(
+        events, n, state, gamepad_button_events, len(GAMEPAD_BUTTONS)
+    ),
+    "gamepad_triggers": lambda events, n, state: stream_values(
+        events, n, state, extract_gamepad_triggers
+    ),
+    "gamepad_axes": lambda events, n, state: stream_values(
+        events, n, state, extract_gamepad_axes
+    ),
+}
+
+
+def read_blocks(csv_path, block_rows):
+    """Yield the rows of an inputs.csv or event log as DataFrames of block_rows"""
+    if is_event_log(csv_path):
+        log = EventLog(csv_path)
+        for start in range(0, len(log), block_rows):
+            yield log.frame(start, start + block_rows, event_args=False)
+    else:
+        yield from pd.read_csv(csv_path, chunksize=block_rows)
+
+
+def find_start_time(csv_path):
+    """Timestamp of the last START in the first 1000 rows (as load_session_events)"""
+    head = next(read_blocks(csv_path, 1000))
+    return head[head["event_type"] == "START"].iloc[-1]["timestamp"]
+
+
+def find_end_time(csv_path, start_time, tail_bytes=TAIL_BYTES):
+    """
+    Timestamp of the END event
+
+    The tail of the file is read first; if END isn't there, the event columns
+    are scanned block by block. Returns None if the log has no END; the session
+    then runs to its latest event, as in load_session_events.
+    """
+    if is_event_log(csv_path):
+        log = EventLog(csv_path)
+        is_end = log.type_names[log.column("event_type")] == "END"
+        end_times = log.timestamps[is_end]
+        end_times = end_times[end_times >= start_time]
+        return float(end_times[0]) if end_times.size else None
+
+    with open(csv_path, "rb") as f:
+        f.seek(0, os.SEEK_END)
+        size = f.tell()
+        f.seek(max(0, size - tail_bytes))
+        tail = f.read().decode("utf-8", errors="replace")
+
+    for line in tail.splitlines():
+        fields = line.split(",", 2)
+        if len(fields) < 2 or fields[1] != "END":
+            continue
+        try:
+            timestamp = float(fields[0])
+        except ValueError:
+            continue
+        if timestamp >= start_time:
+            return timestamp
+    return scan_end_time(csv_path, start_time)
+
+
+def scan_end_time(csv_path, start_time, block_rows=DEFAULT_BLOCK_ROWS):
+    """Timestamp of the first END at or after start_time, from a full scan"""
+    blocks = pd.read_csv(
+        csv_path, usecols=["timestamp", "event_type"], chunksize=block_rows
+    )
+    for block in blocks:
+        is_end = (block["event_type"] == "END") & (block["timestamp"] >= start_time)
+        if is_end.any():
+            return float(block.loc[is_end, "timestamp"].iloc[0])
+    return None
+
+
+class ChunkStream:
+    """
+    Iterate over (chunk_start, {modality: array}) for one inputs.csv, with the
+    arrays in stored form (see session_tensors.to_storage)
+
+    Chunks are SPLIT_SIZE frames (the last one may be shorter) and come out in
+    order. After iteration, total_frames holds the session length and
+    late_events the number of events dropped for arriving after their chunk.
+
+    Args:
+        csv_path: Path to inputs.csv or inputs.evlog
+        modalities: Subset of extract_inputs.MODALITIES
+        block_rows: Rows of the log to read at a time
+    """
+
+    def __init__(
+        self, csv_path, modalities=DEFAULT_MODALITIES, block_rows=DEFAULT_BLOCK_ROWS
+    ):
+        self.csv_path = csv_path
+        self.modalities = tuple(modalities)
+        self.block_rows = block_rows
+        self.total_frames = None
+        self.late_events = 0
+
+    def __iter__(self):
+        start_time = find_start_time(self.csv_path)
+        end_time = find_end_time(self.csv_path, start_time)
+        total_frames = None
+        if end_time is not None:
+            total_frames = int(frame_index(end_time - start_time)) + 1
+
+        states = dict.fromkeys(self.modalities)
+        pending = []
+        next_chunk = 0
+        last_frame = -1
+
+        for block in read_blocks(self.csv_path, self.block_rows):
+            in_window = block["timestamp"] >= start_time
+            if end_time is not None:
+                in_window &= block["timestamp"] <= end_time
+            block = block[in_window].reset_index(drop=True)
+            if block.empty:
+                continue
+            block["timestamp"] -= start_time
+            block["frame"] = frame_index(block["timestamp"].to_numpy())
+
+            late = block["frame"] < next_chunk
+            if late.any():
+                self.late_events += int(late.sum())
+                block = block[~late]
+                if block.empty:
+                    continue
+            last_frame = max(last_frame, int(block["frame"].max()))
+            pending.append(block)
+
+            # Every frame before the latest rows' is complete. Take the lowest
+            # frame in the later half of the block, so that one stray future
+            # timestamp can't close chunks the rows after it still belong to
+            complete = int(block["frame"].iloc[len(block) // 2 :].min())
+            if total_frames is not None:
+                complete = min(complete, total_frames)
+            while next_chunk + SPLIT_SIZE <= complete:
+                pending, chunk = self._emit(pending, next_chunk, SPLIT_SIZE, states)
+                yield next_chunk, chunk
+                next_chunk += SPLIT_SIZE
+
+        if total_frames is None:
+            total_frames = last_frame + 1
+        self.total_frames = total_frames
+        while next_chunk < total_frames:
+            length = min(SPLIT_SIZE, total_frames - next_chunk)
+            pending, chunk = self._emit(pending, next_chunk, length, states)
+            yield next_chunk, chunk
+            next_chunk += length
+
+    def _emit(self, pending, chunk_start, length, states):
+        """Build one chunk from the pending rows; returns (rows left, chunk)"""
+        with profiling.phase("stream_chunk", trace_memory=True):
+            return self._build_chunk(pending, chunk_start, length, states)
+
+    def _build_chunk(self, pending, chunk_start, length, states):
+        events = pd.concat(pending, ignore_index=True) if pending else None
+        if events is None or events.empty:
+            events = pd.DataFrame(
+                {
+                    "timestamp": pd.Series(dtype=np.float64),
+                    "event_type": pd.Series(dtype=object),
+                    "event_args": pd.Series(dtype=object),
+                    "frame": pd.Series(dtype=np.int64),
+                }
+            )
+        in_chunk = events["frame"] < chunk_start + length
+        rest = events[~in_chunk]
+        events = events[in_chunk].reset_index(drop=True)
+        events["frame"] -= chunk_start
+
+        chunk = {}
+        for modality in self.modalities:
+            array, states[modality] = STREAMERS[modality](
+                events, length, states[modality]
+            )
+            chunk[modality] = to_storage(array, EXTRACTORS[modality][1])
+        return [rest] if not rest.empty else [], chunk
+
+
+def process_video(
+    video_dir, output_dir=None, modalities=None, block_rows=DEFAULT_BLOCK_ROWS
+):
+    """
+    Streaming counterpart of extract_inputs.process_video: writes the same
+    {chunk_idx:08d}_{modality}.pt chunks, one chunk at a time
+
+    Args:
+        video_dir: Path to directory containing inputs.csv
+        output_dir: Where to save the chunks (defaults to video_dir/splits)
+        modalities: Subset of MODALITIES to extract (defaults to DEFAULT_MODALITIES)
+        block_rows: Rows of the log to read at a time
+
+    Returns:
+        The ChunkStream, for its total_frames and late_events
+    """
+    modalities = DEFAULT_MODALITIES if modalities is None else modalities
+    csv_path = inputs_path(video_dir)
+    if output_dir is None:
+        output_dir = os.path.join(video_dir, "splits")
+    os.makedirs(output_dir, exist_ok=True)
+
+    stream = ChunkStream(csv_path, modalities, block_rows)
+    dtypes = modality_dtypes(modalities)
+    for chunk_idx, chunk in stream:
+        with profiling.phase("save_chunks"):
+            save_splits(output_dir, chunk, dtypes, first_frame=chunk_idx)
+    return stream
@@ -12,6 +12,7 @@ import {
 } from "electron";
 import * as path from "path";
 import * as fs from "fs";
+import * as os from "os";
 import { spawn, SpawnOptionsWithoutStdio } from "child_process";
 import { join } from "path";
 
@@ -871,6 +872,10 @@ function setupIpcHandlers() {
     try {
       console.log("Starting upload with progress tracking");
 
+      // Names this run's session leases and progress file, so it doesn't
+      // collide with an upload that is still running
+      const runId = `${Date.now()}-${Math.random().toString(16).slice(2, 8)}`;
+
       const uploadProcess = spawnUv(
         [
           "run",
@@ -879,6 +884,8 @@ function setupIpcHandlers() {
           "--api-token",
           options.apiToken,
           "--progress", // Add progress flag for detailed output
+          "--run-id",
+          runId,
         ],
         {
           cwd: rootDir(),
@@ -942,6 +949,16 @@ function setupIpcHandlers() {
       uploadProcess.on("close", (code: number) => {
         console.log(`Upload process exited with code ${code}`);
 
+        // The run's progress file is only read while it runs
+        try {
+          fs.rmSync(
+            path.join(os.tmpdir(), `owl-control-upload-progress-${runId}.json`),
+            { force: true },
+          );
+        } catch (error) {
+          console.error("Error removing upload progress file:", error);
+        }
+
         // Send completion message with captured stats
         const completionData = {
           success: code === 0,
@@ -960,7 +977,7 @@ function setupIpcHandlers() {
         }
       });
 
-      return { success: true, processId: processId };
+      return { success: true, processId: processId, runId: runId };
     } catch (error) {
       console.error("Error starting upload with progress:", error);
       return { success: false, error: String(error) };
@@ -114,6 +114,13 @@ export class UploadService {
 
       if (result.success && result.processId) {
         this.uploadProcess = result.processId;
+        if (result.runId) {
+          // Each run writes its own progress file
+          this.progressFilePath = path.join(
+            os.tmpdir(),
+            `owl-control-upload-progress-${result.runId}.json`,
+          );
+        }
 
         // Listen for progress updates
         if (progressCallback) {
@@ -0,0 +1,357 @@
+"""
+Corpus-level statistics over recorded sessions
+
+filter_invalid_sample stores each session's input_stats in its metadata.json.
+Rather than re-reading thousands of those files for every question, their
+fields are consolidated into one SQLite table (by default .corpus_stats.sqlite
+in ROOT_DIR) with a row per session. The table is refreshed incrementally:
+only sessions whose metadata.json or markers changed are re-read.
+
+Each row holds the recorder's metadata (game_exe, start/end timestamps,
+duration), the session's state (valid, invalid or unvalidated; pending,
+uploaded or evicted) and one column per input stat.
+
+Usage:
+    python -m vg_control.data.corpus_stats [--root DIR] [--by game_exe date validity]
+        [--game EXE] [--validity valid] [--since YYYY-MM-DD] [--until YYYY-MM-DD]
+        [--percentiles wasd_apm] [--json]
+"""
+
+import json
+import os
+import sqlite3
+import time
+
+from ..constants import ROOT_DIR
+from .disk_budget import EVICTED_MARKER
+
+STORE_NAME = ".corpus_stats.sqlite"
+STORE_VERSION = 1
+MARKERS = (".uploaded", ".invalid", EVICTED_MARKER)
+
+# input_stats keys written by filter_invalid_sample
+STAT_COLUMNS = (
+    "wasd_apm",
+    "unique_keys",
+    "button_diversity",
+    "total_keyboard_events",
+    "mouse_movement_std",
+    "mouse_x_std",
+    "mouse_y_std",
+    "mouse_max_movement",
+    "mouse_max_x",
+    "mouse_max_y",
+    "gamepad_button_apm",
+    "gamepad_unique_buttons",
+    "gamepad_button_diversity",
+    "gamepad_total_events",
+    "gamepad_axis_activity",
+    "gamepad_max_axis_movement",
+)
+
+GROUP_COLUMNS = {
+    "game_exe": "game_exe",
+    "date": "date",
+    "validity": "validity",
+    "status": "status",
+}
+
+# Aggregates reported for every group
+SUMMARY = (
+    ("sessions", "COUNT(*)"),
+    ("hours", "COALESCE(SUM(duration), 0) / 3600.0"),
+    ("mean_wasd_apm", "AVG(wasd_apm)"),
+    ("mean_gamepad_apm", "AVG(gamepad_button_apm)"),
+    (
+        "gamepad_only",
+        (
+            "SUM(COALESCE(gamepad_total_events, 0) > 0 "
+            "AND COALESCE(total_keyboard_events, 0) = 0)"
+        ),
+    ),
+    (
+        "keyboard_only",
+        (
+            "SUM(COALESCE(gamepad_total_events, 0) = 0 "
+            "AND COALESCE(total_keyboard_events, 0) > 0)"
+        ),
+    ),
+)
+
+PERCENTILES = (10, 50, 90)
+
+
+def store_path(root_dir=ROOT_DIR):
+    return os.path.join(root_dir, STORE_NAME)
+
+
+def open_store(path):
+    """Open (and create or migrate) the stats store"""
+    connection = sqlite3.connect(path)
+    if connection.execute("PRAGMA user_version").fetchone()[0] != STORE_VERSION:
+        connection.execute("DROP TABLE IF EXISTS sessions")
+        stat_columns = ", ".join(f"{name} REAL" for name in STAT_COLUMNS)
+        connection.execute(
+            f"""
+            CREATE TABLE sessions (
+                root TEXT PRIMARY KEY,
+                signature TEXT NOT NULL,
+                game_exe TEXT,
+                session_id TEXT,
+                start_timestamp INTEGER,
+                end_timestamp INTEGER,
+                date TEXT,
+                duration REAL,
+                validity TEXT NOT NULL,
+                status TEXT NOT NULL,
+                {stat_columns}
+            )
+            """
+        )
+        connection.execute(f"PRAGMA user_version = {STORE_VERSION}")
+        connection.commit()
+    return connection
+
+
+def scan_corpus(root_dir):
+    """
+    Yield (session dir, signature, markers) for every directory under root_dir
+    with a metadata.json
+
+    The signature changes whenever metadata.json or the session's markers do.
+    """
+    pending = [root_dir]
+    while pending:
+        directory = pending.pop()
+        try:
+            entries = list(os.scandir(directory))
+        except OSError:
+            continue
+
+        metadata_stat = None
+        markers = []
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                pending.append(entry.path)
+            elif entry.name == "metadata.json":
+                metadata_stat = entry.stat()
+            elif entry.name in MARKERS:
+                markers.append(entry.name)
+
+        if metadata_stat is not None:
+            markers.sort()
+            stat = f"{metadata_stat.st_size}:{metadata_stat.st_mtime_ns}"
+            signature = f"{stat}:{','.join(markers)}"
+            yield directory, signature, markers
+
+
+def session_row(root, signature, markers):
+    """Read a session's metadata.json into a row of the sessions table"""
+    try:
+        with open(os.path.join(root, "metadata.json")) as f:
+            metadata = json.load(f)
+    except (OSError, ValueError):
+        metadata = {}
+    stats = metadata.get("input_stats") or {}
+
+    if ".invalid" in markers:
+        validity = "invalid"
+    elif stats:
+        validity = "valid"
+    else:
+        validity = "unvalidated"
+    if EVICTED_MARKER in markers:
+        status = "evicted"
+    elif ".uploaded" in markers:
+        status = "uploaded"
+    else:
+        status = "pending"
+
+    start_timestamp = metadata.get("start_timestamp")
+    date = None
+    if isinstance(start_timestamp, (int, float)):
+        date = time.strftime("%Y-%m-%d", time.localtime(start_timestamp))
+
+    def number(value):
+        return value if isinstance(value, (int, float)) else None
+
+    return (
+        root,
+        signature,
+        metadata.get("game_exe"),
+        metadata.get("session_id"),
+        number(start_timestamp),
+        number(metadata.get("end_timestamp")),
+        date,
+        number(metadata.get("duration")),
+        validity,
+        status,
+        *(number(stats.get(name)) for name in STAT_COLUMNS),
+    )
+
+
+def refresh_store(connection, root_dir=ROOT_DIR):
+    """
+    Bring the store up to date with the sessions under root_dir
+
+    Returns (sessions re-read, sessions removed).
+    """
+    known = dict(connection.execute("SELECT root, signature FROM sessions"))
+    changed = []
+    seen = set()
+    for root, signature, markers in scan_corpus(root_dir):
+        seen.add(root)
+        if known.get(root) != signature:
+            changed.append(session_row(root, signature, markers))
+    removed = [(root,) for root in known if root not in seen]
+
+    placeholders = ", ".join("?" * (10 + len(STAT_COLUMNS)))
+    with connection:
+        connection.executemany(
+            f"INSERT OR REPLACE INTO sessions VALUES ({placeholders})", changed
+        )
+        connection.executemany("DELETE FROM sessions WHERE root = ?", removed)
+    return len(changed), len(removed)
+
+
+def query(
+    connection,
+    group_by=(),
+    game=None,
+    validity=None,
+    status=None,
+    since=None,
+    until=None,
+    percentiles=(),
+):
+    """
+    Aggregate the stored sessions
+
+    Args:
+        connection: Store from open_store
+        group_by: Any of "game_exe", "date", "validity", "status"
+        game, validity, status: Only include sessions with this value
+        since, until: Only include sessions recorded from/until these dates
+            (YYYY-MM-DD, inclusive)
+        percentiles: Stat columns to report the 10th/50th/90th percentiles of
+
+    Returns:
+        One dict per group with the group's values and the SUMMARY aggregates
+    """
+    for name in group_by:
+        if name not in GROUP_COLUMNS:
+            raise ValueError(
+                f"Cannot group by {name!r}; use one of {list(GROUP_COLUMNS)}"
+            )
+    for name in percentiles:
+        if name not in STAT_COLUMNS:
+            raise ValueError(f"Unknown stat {name!r}")
+
+    conditions, params = [], []
+    filters = (("game_exe", game), ("validity", validity), ("status", status))
+    for column, value in filters:
+        if value is not None:
+            conditions.append(f"{column} = ?")
+            params.append(value)
+    if since is not None:
+        conditions.append("date >= ?")
+        params.append(since)
+    if until is not None:
+        conditions.append("date <= ?")
+        params.append(until)
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+
+    keys = [GROUP_COLUMNS[name] for name in group_by]
+    select = keys + [f"{expression} AS {name}" for name, expression in SUMMARY]
+    sql = f"SELECT {', '.join(select)} FROM sessions {where}"
+    if keys:
+        sql += f" GROUP BY {', '.join(keys)} ORDER BY {', '.join(keys)}"
+
+    columns = list(group_by) + [name for name, _ in SUMMARY]
+    results = [dict(zip(columns, row)) for row in connection.execute(sql, params)]
+
+    for name in percentiles:
+        # SQLite has no percentile aggregate; pull the sorted values per group
+        values = {}
+        rows = connection.execute(
+            f"SELECT {', '.join(keys + [name])} FROM sessions {where} "
+            f"{'AND' if where else 'WHERE'} {name} IS NOT NULL ORDER BY {name}",
+            params,
+        )
+        for row in rows:
+            values.setdefault(tuple(row[:-1]), []).append(row[-1])
+        for result in results:
+            group = values.get(tuple(result[key] for key in group_by), [])
+            for p in PERCENTILES:
+                result[f"{name}_p{p}"] = (
+                    group[min(len(group) - 1, int(p / 100 * len(group)))]
+                    if group
+                    else None
+                )
+    return results
+
+
+def format_table(results):
+    if not results:
+        return "No sessions"
+    columns = list(results[0])
+
+    def cell(value):
+        if isinstance(value, float):
+            return f"{value:.2f}"
+        return "-" if value is None else str(value)
+
+    rows = [[cell(result[column]) for column in columns] for result in results]
+    widths = [
+        max(len(column), *(len(row[i]) for row in rows))
+        for i, column in enumerate(columns)
+    ]
+    lines = [columns] + rows
+    return "\n".join(
+        "  ".join(value.ljust(width) for value, width in zip(line, widths)).rstrip()
+        for line in lines
+    )
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Query statistics over all sessions")
+    parser.add_argument("--root", default=ROOT_DIR, help="Directory of sessions")
+    parser.add_argument("--store", help=f"Stats store (defaults to ROOT/{STORE_NAME})")
+    parser.add_argument(
+        "--by", nargs="+", default=[], choices=sorted(GROUP_COLUMNS), help="Group by"
+    )
+    parser.add_argument("--game", help="Only this game_exe")
+    parser.add_argument("--validity", choices=["valid", "invalid", "unvalidated"])
+    parser.add_argument("--status", choices=["pending", "uploaded", "evicted"])
+    parser.add_argument("--since", help="First recording date (YYYY-MM-DD)")
+    parser.add_argument("--until", help="Last recording date (YYYY-MM-DD)")
+    parser.add_argument(
+        "--percentiles",
+        nargs="+",
+        default=[],
+        choices=STAT_COLUMNS,
+        metavar="STAT",
+        help="Report the 10th/50th/90th percentiles of these input stats",
+    )
+    parser.add_argument(
+        "--no-refresh", action="store_true", help="Query the store as it is"
+    )
+    parser.add_argument("--json", action="store_true", help="Print JSON")
+    args = parser.parse_args()
+
+    connection = open_store(args.store or store_path(args.root))
+    if not args.no_refresh:
+        refresh_store(connection, args.root)
+    results = query(
+        connection,
+        group_by=args.by,
+        game=args.game,
+        validity=args.validity,
+        status=args.status,
+        since=args.since,
+        until=args.until,
+        percentiles=args.percentiles,
+    )
+    print(json.dumps(results, indent=4) if args.json else format_table(results))
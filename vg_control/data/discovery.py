@@ -0,0 +1,219 @@
+"""
+Session discovery across recording roots
+
+Recordings can live under several roots (e.g. one per drive). Each root is
+walked on its own I/O thread with os.scandir, whose directory entries carry
+the file type (and, on Windows, the size and mtime) without an extra stat call
+per file. The per-root results are merged into one work queue ordered by
+recording time, oldest first.
+
+Usage:
+    python -m vg_control.data.discovery scan ROOT [ROOT ...]
+    python -m vg_control.data.discovery benchmark [--roots 4] [--sessions 2000]
+"""
+
+import heapq
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from .input_utils.event_log import is_event_log
+
+
+def session_from_entries(directory, entries):
+    """
+    The pending session in a directory, given its file entries, or None
+
+    A session has an .mp4, inputs as a .csv or a binary event log, and a
+    metadata.json, and no .uploaded or .invalid marker yet.
+    """
+    names = [entry.name for entry in entries]
+    if ".uploaded" in names or ".invalid" in names or "metadata.json" not in names:
+        return None
+
+    mp4 = next((entry for entry in entries if entry.name.endswith(".mp4")), None)
+    csv = next((entry for entry in entries if entry.name.endswith(".csv")), None)
+    if csv is None:
+        csv = next((entry for entry in entries if is_event_log(entry.name)), None)
+    if mp4 is None or csv is None:
+        return None
+
+    mp4_stat = mp4.stat()
+    csv_stat = csv.stat()
+    return {
+        "root": directory,
+        "mp4_file": mp4.name,
+        "csv_file": csv.name,
+        "mp4_path": mp4.path,
+        "csv_path": csv.path,
+        "meta_path": os.path.join(directory, "metadata.json"),
+        # Size and mtime as of the scan, from the directory entries
+        "stat": {
+            "mp4": (mp4_stat.st_size, mp4_stat.st_mtime_ns),
+            "csv": (csv_stat.st_size, csv_stat.st_mtime_ns),
+        },
+    }
+
+
+def scan_root(root):
+    """Pending sessions under one root, ordered by recording time"""
+    sessions = []
+    pending = [root]
+    while pending:
+        directory = pending.pop()
+        try:
+            with os.scandir(directory) as it:
+                entries = list(it)
+        except OSError:
+            continue
+
+        files = []
+        for entry in entries:
+            try:
+                # Like os.walk, don't descend into symlinked directories; a
+                # link or loop would list the same session under every alias
+                if entry.is_dir(follow_symlinks=False):
+                    pending.append(entry.path)
+                elif entry.is_file():
+                    files.append(entry)
+            except OSError:
+                continue
+
+        try:
+            session = session_from_entries(directory, files)
+        except OSError:
+            continue  # A file vanished mid-scan
+        if session is not None:
+            sessions.append(session)
+
+    sessions.sort(key=_recording_order)
+    return sessions
+
+
+def _recording_order(session):
+    return session["stat"]["mp4"][1], session["mp4_path"]
+
+
+def distinct_roots(roots):
+    """The roots without repeats and without roots nested inside another one"""
+    resolved = []
+    for root in roots:
+        path = os.path.realpath(root)
+        if path not in (other for _, other in resolved):
+            resolved.append((root, path))
+    return [
+        root
+        for root, path in resolved
+        if not any(
+            other != path and path.startswith(os.path.join(other, ""))
+            for _, other in resolved
+        )
+    ]
+
+
+def discover_sessions(roots, threads=None):
+    """
+    Pending sessions under every root, scanning each root on its own thread
+
+    Returns one list ordered by recording time across all roots. Repeated and
+    nested roots are scanned once.
+    """
+    roots = distinct_roots(roots)
+    if len(roots) == 1:
+        per_root = [scan_root(roots[0])]
+    else:
+        with ThreadPoolExecutor(
+            max_workers=threads or len(roots), thread_name_prefix="owl-scan"
+        ) as pool:
+            per_root = list(pool.map(scan_root, roots))
+
+    return list(heapq.merge(*per_root, key=_recording_order))
+
+
+def walk_sessions(roots):
+    """The previous discovery, one os.walk per root in turn (for benchmarks)"""
+    sessions = []
+    for root_dir in roots:
+        for root, dirs, files in os.walk(root_dir):
+            if ".uploaded" in files or ".invalid" in files:
+                continue
+            has_mp4 = any(fname.endswith(".mp4") for fname in files)
+            has_csv = any(fname.endswith(".csv") for fname in files)
+            has_event_log = any(is_event_log(fname) for fname in files)
+            has_metadata = any(fname == "metadata.json" for fname in files)
+            if has_mp4 and (has_csv or has_event_log) and has_metadata:
+                mp4_file = next(f for f in files if f.endswith(".mp4"))
+                sessions.append(
+                    {"root": root, "mp4_path": os.path.join(root, mp4_file)}
+                )
+                # Session sizes and the worker's cache signature stat'ed the
+                # recorded files afterwards
+                csv_file = next(
+                    f for f in files if f.endswith(".csv") or is_event_log(f)
+                )
+                os.stat(os.path.join(root, mp4_file))
+                os.stat(os.path.join(root, csv_file))
+    return sessions
+
+
+def make_synthetic_tree(base_dir, roots=4, sessions=2000, uploaded_share=0.5):
+    """
+    Write `sessions` small fake sessions spread over `roots` roots under
+    base_dir, nested game/date/session like real recordings; returns the roots
+    """
+    root_dirs = [os.path.join(base_dir, f"root_{i}") for i in range(roots)]
+    for i in range(sessions):
+        game, day = f"game_{i % 7}", f"day_{i % 31:02d}"
+        session_dir = os.path.join(root_dirs[i % roots], game, day, f"session_{i:06d}")
+        os.makedirs(session_dir)
+        for name in ("recording.mp4", "inputs.csv", "metadata.json"):
+            with open(os.path.join(session_dir, name), "w") as f:
+                f.write("x")
+        if (i * 7919) % 100 < uploaded_share * 100:
+            with open(os.path.join(session_dir, ".uploaded"), "w") as f:
+                f.write("")
+    return root_dirs
+
+
+def benchmark(roots=4, sessions=2000, repeats=3):
+    """
+    Time the os.walk discovery against the threaded scandir one
+
+    The tree is freshly written, so both run against a warm page cache; on
+    separate physical drives the threads also overlap the disks' latency.
+    """
+    import tempfile
+
+    with tempfile.TemporaryDirectory() as base_dir:
+        root_dirs = make_synthetic_tree(base_dir, roots, sessions)
+        print(f"{sessions} sessions over {roots} roots")
+        methods = (("os.walk", walk_sessions), ("scandir threads", discover_sessions))
+        for name, fn in methods:
+            times = []
+            for _ in range(repeats):
+                start = time.perf_counter()
+                found = fn(root_dirs)
+                times.append(time.perf_counter() - start)
+            print(f"{name:<16} {len(found)} pending, best {min(times) * 1000:.1f} ms")
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Find pending sessions")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    scan = subparsers.add_parser("scan", help="List pending sessions")
+    scan.add_argument("roots", nargs="+", help="Recording roots")
+    bench = subparsers.add_parser(
+        "benchmark", help="Time discovery on a synthetic tree"
+    )
+    bench.add_argument("--roots", type=int, default=4)
+    bench.add_argument("--sessions", type=int, default=2000)
+    bench.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args()
+
+    if args.command == "scan":
+        for session in discover_sessions(args.roots):
+            print(session["root"])
+    else:
+        benchmark(args.roots, args.sessions, args.repeats)
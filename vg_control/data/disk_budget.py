@@ -0,0 +1,288 @@
+"""
+Disk budget for recorded sessions
+
+Sessions stay under ROOT_DIR after they are uploaded. A budget caps the space
+they take, either as an absolute size ("50GB": all sessions together) or as a
+share of the disk to keep free ("20%"). When the budget is exceeded, uploaded
+sessions are evicted oldest upload first until it is met again. Pending and
+invalid sessions are never touched.
+
+Evicting a session deletes its files but leaves the directory with its
+`.uploaded` marker, its metadata.json and an `.evicted` tombstone recording
+what was removed, so it is never picked up for upload again and its stats stay
+available.
+
+Usage:
+    python -m vg_control.data.disk_budget BUDGET [--dry-run]
+"""
+
+import json
+import os
+import re
+import shutil
+import time
+
+from ..constants import ROOT_DIR
+
+EVICTED_MARKER = ".evicted"
+KEEP_FILES = (".uploaded", EVICTED_MARKER, "metadata.json")
+
+UNITS = {
+    "": 1,
+    "B": 1,
+    "KB": 1000,
+    "MB": 1000**2,
+    "GB": 1000**3,
+    "TB": 1000**4,
+    "KIB": 1024,
+    "MIB": 1024**2,
+    "GIB": 1024**3,
+    "TIB": 1024**4,
+}
+BUDGET_PATTERN = re.compile(r"^\s*(\d+(?:\.\d+)?)\s*([a-zA-Z%]*)\s*$")
+
+
+def parse_budget(text):
+    """
+    Parse a budget such as "50GB", "500 MiB", "1073741824" or "20%"
+
+    Returns ("bytes", size) for an absolute budget or ("percent_free", percent)
+    for a share of the disk to keep free.
+    """
+    match = BUDGET_PATTERN.match(str(text))
+    if not match:
+        raise ValueError(f"Invalid disk budget: {text!r}")
+    number, unit = float(match.group(1)), match.group(2).upper()
+    if unit == "%":
+        if not 0 <= number < 100:
+            raise ValueError(f"Free space percentage must be below 100: {text!r}")
+        return ("percent_free", number)
+    if unit not in UNITS:
+        raise ValueError(f"Unknown size unit in disk budget: {text!r}")
+    return ("bytes", int(number * UNITS[unit]))
+
+
+def format_bytes(size):
+    for unit in ("B", "KB", "MB", "GB"):
+        if abs(size) < 1000:
+            return f"{size:.1f} {unit}" if unit != "B" else f"{size} B"
+        size /= 1000
+    return f"{size:.1f} TB"
+
+
+def scan_sessions(root_dir=ROOT_DIR):
+    """
+    Walk root_dir and return (total bytes of every file, evictable sessions)
+
+    Evictable sessions are the ones with an `.uploaded` marker and no
+    `.invalid` one that haven't been evicted yet, oldest upload first, as dicts
+    with the session's root, upload time, files and their size.
+    """
+    total_bytes = 0
+    evictable = []
+    for root, dirs, files in os.walk(root_dir):
+        sizes = {}
+        for name in files:
+            try:
+                sizes[name] = os.path.getsize(os.path.join(root, name))
+            except OSError:
+                sizes[name] = 0
+        total_bytes += sum(sizes.values())
+
+        if ".uploaded" not in files or ".invalid" in files or EVICTED_MARKER in files:
+            continue
+        removable = [name for name in files if name not in KEEP_FILES]
+        if not removable:
+            continue
+        try:
+            uploaded_at = os.path.getmtime(os.path.join(root, ".uploaded"))
+        except OSError:
+            continue
+        evictable.append(
+            {
+                "root": root,
+                "uploaded_at": uploaded_at,
+                "files": removable,
+                "bytes": sum(sizes[name] for name in removable),
+            }
+        )
+
+    evictable.sort(key=lambda session: (session["uploaded_at"], session["root"]))
+    return total_bytes, evictable
+
+
+def bytes_to_free(budget, root_dir=ROOT_DIR, total_bytes=None):
+    """How many bytes must be reclaimed to meet the budget (0 if it is met)"""
+    kind, amount = budget
+    if kind == "bytes":
+        if total_bytes is None:
+            total_bytes, _ = scan_sessions(root_dir)
+        return max(0, total_bytes - amount)
+
+    usage = shutil.disk_usage(root_dir)
+    wanted_free = usage.total * amount / 100
+    return max(0, int(wanted_free - usage.free))
+
+
+def evict_session(session):
+    """Delete an uploaded session's files, leaving its tombstone; returns bytes freed"""
+    freed = 0
+    removed = []
+    for name in session["files"]:
+        path = os.path.join(session["root"], name)
+        try:
+            size = os.path.getsize(path)
+            os.remove(path)
+        except OSError:
+            continue
+        freed += size
+        removed.append(name)
+
+    with open(os.path.join(session["root"], EVICTED_MARKER), "w") as f:
+        json.dump(
+            {
+                "evicted_at": time.time(),
+                "uploaded_at": session["uploaded_at"],
+                "files": removed,
+                "bytes": freed,
+            },
+            f,
+        )
+    return freed
+
+
+def evict_oldest(evictable, needed, dry_run=False):
+    """
+    Evict sessions in order until `needed` bytes are reclaimed
+
+    Returns the evicted session roots and the bytes reclaimed.
+    """
+    evicted = []
+    reclaimed = 0
+    for session in evictable:
+        if reclaimed >= needed:
+            break
+        freed = session["bytes"] if dry_run else evict_session(session)
+        reclaimed += freed
+        evicted.append(session["root"])
+    return evicted, reclaimed
+
+
+def enforce_disk_budget(budget, root_dir=ROOT_DIR, dry_run=False):
+    """
+    Evict uploaded sessions, oldest upload first, until the budget is met
+
+    Args:
+        budget: Budget string (see parse_budget) or an already parsed tuple
+        root_dir: Directory of sessions
+        dry_run: Only report what would be evicted
+
+    Returns:
+        Report dict with the sessions evicted, bytes reclaimed and whether the
+        budget is met (it can't be if pending/invalid sessions alone exceed it)
+    """
+    if isinstance(budget, str):
+        budget = parse_budget(budget)
+    if not os.path.isdir(root_dir):
+        return {
+            "budget": list(budget),
+            "evicted": [],
+            "bytes_reclaimed": 0,
+            "budget_met": True,
+        }
+
+    total_bytes, evictable = scan_sessions(root_dir)
+    needed = bytes_to_free(budget, root_dir, total_bytes)
+    evicted, reclaimed = evict_oldest(evictable, needed, dry_run)
+
+    return {
+        "budget": list(budget),
+        "evicted": evicted,
+        "bytes_reclaimed": reclaimed,
+        "budget_met": reclaimed >= needed,
+    }
+
+
+def enforce_free_space(budget, roots, dry_run=False):
+    """
+    Enforce a free space budget on recording roots that share one disk
+
+    The disk's deficit is measured once and uploaded sessions are evicted
+    across all the roots, oldest upload first, so the space isn't reclaimed
+    once per root.
+    """
+    sessions = {}
+    for root in roots:
+        for session in scan_sessions(root)[1]:
+            sessions[session["root"]] = session  # Nested roots list it twice
+    evictable = sorted(
+        sessions.values(), key=lambda session: (session["uploaded_at"], session["root"])
+    )
+    needed = bytes_to_free(budget, roots[0])
+    evicted, reclaimed = evict_oldest(evictable, needed, dry_run)
+    return {
+        "budget": list(budget),
+        "evicted": evicted,
+        "bytes_reclaimed": reclaimed,
+        "budget_met": reclaimed >= needed,
+    }
+
+
+def enforce_disk_budgets(budget, roots, dry_run=False):
+    """
+    Enforce the budget on each recording root (a size budget caps every root
+    separately, a free space budget applies once to each disk holding roots);
+    returns one combined report
+    """
+    if isinstance(budget, str):
+        budget = parse_budget(budget)
+    if budget[0] == "bytes":
+        reports = [enforce_disk_budget(budget, root, dry_run) for root in roots]
+    else:
+        disks = {}
+        for root in roots:
+            if os.path.isdir(root):
+                disks.setdefault(os.stat(root).st_dev, []).append(root)
+        reports = [
+            enforce_free_space(budget, disk_roots, dry_run)
+            for disk_roots in disks.values()
+        ]
+    return {
+        "budget": list(budget),
+        "evicted": [root for report in reports for root in report["evicted"]],
+        "bytes_reclaimed": sum(report["bytes_reclaimed"] for report in reports),
+        "budget_met": all(report["budget_met"] for report in reports),
+    }
+
+
+def print_report(report, dry_run=False):
+    action = "Would evict" if dry_run else "Evicted"
+    print(
+        f"Disk budget: {action} {len(report['evicted'])} uploaded sessions, "
+        f"reclaiming {format_bytes(report['bytes_reclaimed'])}"
+    )
+    if not report["budget_met"]:
+        print("Disk budget: still over budget; only uploaded sessions are evicted")
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Evict uploaded sessions")
+    parser.add_argument(
+        "budget", help='Total size ("50GB") or free space to keep ("20%%")'
+    )
+    parser.add_argument("--root", default=ROOT_DIR, help="Directory of sessions")
+    parser.add_argument(
+        "--dry-run", action="store_true", help="Only list what would be evicted"
+    )
+    args = parser.parse_args()
+    try:
+        budget = parse_budget(args.budget)
+    except ValueError as e:
+        parser.error(str(e))
+
+    report = enforce_disk_budget(budget, args.root, dry_run=args.dry_run)
+    for root in report["evicted"]:
+        print(root)
+    print_report(report, dry_run=args.dry_run)
@@ -4,8 +4,8 @@ Button presses
 
 import json
 import numpy as np
-import pandas as pd
 
+from .event_log import read_inputs
 from .keybinds import CODE_TO_KEY
 
 
@@ -36,8 +36,8 @@ def get_button_stats(csv_path):
         get_keycode("D"),
     ]
 
-    # Load and preprocess the CSV data
-    button_data = pd.read_csv(csv_path)
+    # Load and preprocess the CSV data (or the equivalent binary event log)
+    button_data = read_inputs(csv_path)
 
     # Find start time and normalize timestamps
     start_time = button_data.head(1000)[
@@ -0,0 +1,365 @@
+"""
+Compact binary event log
+
+A columnar alternative to inputs.csv. Every row of the CSV becomes one entry
+in a handful of typed columns:
+
+- event_type: uint8 index into the header's table of event types
+- timestamp_delta: difference between consecutive timestamps' float64 bit
+  patterns (lossless, and small because the log is in time order)
+- arg0, arg1: integer/boolean event arguments (key codes, press states, mouse
+  deltas, scroll amounts), stored in the narrowest integer type that fits
+- value: the analog argument of the rows that have one (gamepad triggers and
+  axes), one entry per such row
+
+The file is a magic string, a JSON header and the columns, each aligned so it
+can be opened with numpy.memmap without reading the rest of the file.
+
+Usage:
+    python -m vg_control.data.input_utils.event_log convert PATH [PATH ...]
+"""
+
+import json
+import os
+import struct
+
+import numpy as np
+import pandas as pd
+
+from ... import profiling
+
+MAGIC = b"OWLEVLOG"
+FORMAT_VERSION = 1
+EVENT_LOG_SUFFIX = ".evlog"
+ALIGNMENT = 64
+INT_DTYPES = (np.int8, np.int16, np.int32, np.int64)
+
+
+def is_event_log(path):
+    return str(path).endswith(EVENT_LOG_SUFFIX)
+
+
+def narrowest_int(values):
+    """Cast integer values to the smallest signed dtype that holds them"""
+    values = np.asarray(values, dtype=np.int64)
+    if values.size == 0:
+        return values.astype(np.int8)
+    low, high = values.min(), values.max()
+    for dtype in INT_DTYPES:
+        info = np.iinfo(dtype)
+        if info.min <= low and high <= info.max:
+            return values.astype(dtype)
+    return values
+
+
+def _parse_args(event_args):
+    """
+    Parse the event_args of rows that share an event type
+
+    Returns (kinds, values): one of "int", "bool" or "float" per argument and
+    the float64 (n, width) array of arguments.
+    """
+    first = event_args.iloc[0]
+    width = 0 if first.strip() == "[]" else first.count(",") + 1
+    if width == 0:
+        return [], np.empty((len(event_args), 0))
+
+    tokens = np.array(",".join(event_args.str.slice(1, -1)).replace(" ", "").split(","))
+    if tokens.size != len(event_args) * width:
+        raise ValueError(f"Expected {width} event args per row")
+    tokens = tokens.reshape(-1, width)
+
+    kinds = []
+    values = np.empty(tokens.shape, dtype=np.float64)
+    for i in range(width):
+        column = tokens[:, i]
+        is_true = column == "true"
+        if np.all(is_true | (column == "false")):
+            kinds.append("bool")
+            values[:, i] = is_true
+            continue
+        values[:, i] = column.astype(np.float64)
+        is_integral = not np.any(
+            (np.char.find(column, ".") >= 0) | (np.char.find(column, "e") >= 0)
+        )
+        kinds.append("int" if is_integral else "float")
+    return kinds, values
+
+
+def encode_events(events):
+    """
+    Build the header fields and columns of an event log from an inputs.csv
+    DataFrame (timestamp, event_type, event_args)
+    """
+    n = len(events)
+    timestamps = events["timestamp"].to_numpy(dtype=np.float64)
+    bits = timestamps.view(np.int64)
+    base = int(bits[0]) if n else 0
+    deltas = np.diff(bits, prepend=np.int64(base))
+    if deltas.size and np.abs(deltas).max() <= np.iinfo(np.int32).max:
+        deltas = deltas.astype(np.int32)
+
+    type_names = events["event_type"].to_numpy(dtype=str)
+    names, codes = np.unique(type_names, return_inverse=True)
+    if len(names) > 256:
+        raise ValueError(f"Too many event types for an event log: {len(names)}")
+
+    arg0 = np.zeros(n, dtype=np.int64)
+    arg1 = np.zeros(n, dtype=np.int64)
+    value = np.zeros(n, dtype=np.float64)
+    has_value = np.zeros(n, dtype=bool)
+    event_types = []
+
+    event_args = events["event_args"].astype(str)
+    for code, name in enumerate(names):
+        rows = np.flatnonzero(codes == code)
+        kinds, args = _parse_args(event_args.iloc[rows])
+        if len(kinds) > 2 or kinds.count("float") > 1:
+            raise ValueError(f"Unsupported event args for {name}: {kinds}")
+
+        for i, kind in enumerate(kinds):
+            if kind == "float":
+                value[rows] = args[:, i]
+                has_value[rows] = True
+            else:
+                (arg0, arg1)[i][rows] = args[:, i].astype(np.int64)
+        event_types.append({"name": str(name), "args": kinds})
+
+    value = value[has_value]
+    if np.array_equal(value.astype(np.float32), value):
+        value = value.astype(np.float32)
+
+    header = {
+        "version": FORMAT_VERSION,
+        "rows": n,
+        "timestamp_base": base,
+        "event_types": event_types,
+    }
+    columns = {
+        "event_type": codes.astype(np.uint8),
+        "timestamp_delta": deltas,
+        "arg0": narrowest_int(arg0),
+        "arg1": narrowest_int(arg1),
+        "value": value,
+    }
+    return header, columns
+
+
+def write_event_log(events, path):
+    """Write an inputs.csv DataFrame as an event log (atomically)"""
+    header, columns = encode_events(events)
+
+    # Lay the columns out after the header, each on an aligned offset
+    def layout(header_bytes):
+        offset = len(MAGIC) + 8 + len(header_bytes)
+        entries = {}
+        for name, array in columns.items():
+            offset += -offset % ALIGNMENT
+            entries[name] = {
+                "dtype": array.dtype.str,
+                "offset": offset,
+                "length": int(array.size),
+            }
+            offset += array.nbytes
+        return entries
+
+    # Offsets depend on the header's size, which depends on the offsets
+    header["columns"] = {}
+    header_bytes = b""
+    while True:
+        header["columns"] = layout(header_bytes)
+        encoded = json.dumps(header).encode()
+        if len(encoded) <= len(header_bytes):
+            break
+        header_bytes = encoded + b" " * 16
+    header_bytes = json.dumps(header).encode().ljust(len(header_bytes))
+
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(MAGIC)
+        f.write(struct.pack("<Q", len(header_bytes)))
+        f.write(header_bytes)
+        for name, array in columns.items():
+            f.write(b"\0" * (header["columns"][name]["offset"] - f.tell()))
+            f.write(np.ascontiguousarray(array).tobytes())
+    os.replace(tmp_path, path)
+
+
+def convert_csv(csv_path, output_path=None):
+    """Convert an inputs.csv to an event log next to it; returns the new path"""
+    if output_path is None:
+        output_path = os.path.splitext(csv_path)[0] + EVENT_LOG_SUFFIX
+    write_event_log(pd.read_csv(csv_path), output_path)
+    return output_path
+
+
+class EventLog:
+    """
+    Read-only, memory-mapped view of an event log
+
+    Columns are mapped lazily by numpy.memmap; frame() decodes a row range back
+    into the inputs.csv layout.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                raise ValueError(f"{path} is not an event log")
+            (header_length,) = struct.unpack("<Q", f.read(8))
+            self.header = json.loads(f.read(header_length))
+        if self.header["version"] != FORMAT_VERSION:
+            raise ValueError(f"Unsupported event log version {self.header['version']}")
+
+        self.event_types = self.header["event_types"]
+        self.type_names = np.array([t["name"] for t in self.event_types], dtype=object)
+        self._columns = {}
+        self._timestamps = None
+
+        # Rows whose type has an analog argument index into the value column
+        self._value_types = np.array(
+            ["float" in t["args"] for t in self.event_types] or [False], dtype=bool
+        )
+        value_positions = [
+            t["args"].index("float") if "float" in t["args"] else 0
+            for t in self.event_types
+        ]
+        self._value_positions = np.array(value_positions or [0])
+
+    def __len__(self):
+        return self.header["rows"]
+
+    def column(self, name):
+        if name not in self._columns:
+            info = self.header["columns"][name]
+            if info["length"] == 0:
+                self._columns[name] = np.empty(0, dtype=np.dtype(info["dtype"]))
+            else:
+                self._columns[name] = np.memmap(
+                    self.path,
+                    dtype=np.dtype(info["dtype"]),
+                    mode="r",
+                    offset=info["offset"],
+                    shape=(info["length"],),
+                )
+        return self._columns[name]
+
+    @property
+    def timestamps(self):
+        """All timestamps, decoded once and cached"""
+        if self._timestamps is None:
+            self._timestamps = self._decode_timestamps(
+                self.column("timestamp_delta"), self.header["timestamp_base"]
+            )
+        return self._timestamps
+
+    @staticmethod
+    def _decode_timestamps(deltas, base):
+        bits = np.cumsum(deltas, dtype=np.int64) + np.int64(base)
+        return bits.view(np.float64)
+
+    def event_type_names(self, start=0, stop=None):
+        return self.type_names[self.column("event_type")[start:stop]]
+
+    def args(self, start=0, stop=None):
+        """Arguments of rows [start, stop) as a float64 (n, 2) array (bools as 1/0)"""
+        codes = np.asarray(self.column("event_type")[start:stop])
+        args = np.stack(
+            [
+                np.asarray(self.column("arg0")[start:stop], dtype=np.float64),
+                np.asarray(self.column("arg1")[start:stop], dtype=np.float64),
+            ],
+            axis=1,
+        )
+
+        has_value = self._value_types[codes]
+        if has_value.any():
+            earlier = self.column("event_type")[:start]
+            first = np.count_nonzero(self._value_types[earlier])
+            values = self.column("value")[first : first + np.count_nonzero(has_value)]
+            rows = np.flatnonzero(has_value)
+            args[rows, self._value_positions[codes[rows]]] = values
+        return args
+
+    def frame(self, start=0, stop=None, event_args=True):
+        """
+        Rows [start, stop) as a DataFrame with the inputs.csv columns
+
+        The numeric "arg0"/"arg1" columns are always included; formatting the
+        JSON "event_args" strings can be skipped when they aren't needed.
+        """
+        stop = len(self) if stop is None else min(stop, len(self))
+        timestamps = self.timestamps[start:stop]
+        codes = np.asarray(self.column("event_type")[start:stop])
+        args = self.args(start, stop)
+        frame = pd.DataFrame(
+            {
+                "timestamp": timestamps,
+                "event_type": self.type_names[codes],
+            }
+        )
+        if event_args:
+            frame["event_args"] = self._format_args(codes, args)
+        frame["arg0"] = args[:, 0]
+        frame["arg1"] = args[:, 1]
+        return frame
+
+    def _format_args(self, codes, args):
+        formatted = np.empty(len(codes), dtype=object)
+        for code, event_type in enumerate(self.event_types):
+            rows = np.flatnonzero(codes == code)
+            if rows.size == 0:
+                continue
+            kinds = event_type["args"]
+
+            # Logs repeat a small set of argument tuples, so format each only once
+            key = np.zeros(rows.size, dtype=np.int64)
+            values = []
+            for i in range(len(kinds)):
+                unique, inverse = np.unique(args[rows, i], return_inverse=True)
+                key = key * len(unique) + inverse
+                values.append(unique)
+            unique_keys, inverse = np.unique(key, return_inverse=True)
+
+            texts = []
+            for unique_key in unique_keys:
+                parts = []
+                for unique, kind in reversed(list(zip(values, kinds))):
+                    unique_key, index = divmod(int(unique_key), len(unique))
+                    parts.append(_format_arg(unique[index], kind))
+                texts.append("[" + ", ".join(reversed(parts)) + "]")
+            formatted[rows] = np.array(texts, dtype=object)[inverse]
+        return formatted
+
+
+def _format_arg(value, kind):
+    if kind == "bool":
+        return "true" if value else "false"
+    if kind == "int":
+        return str(int(value))
+    return repr(float(value))
+
+
+def read_inputs(path):
+    """Load an inputs.csv or an event log as the inputs.csv DataFrame"""
+    with profiling.phase("read_inputs", trace_memory=True):
+        if is_event_log(path):
+            return EventLog(path).frame()
+        return pd.read_csv(path)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Binary event logs")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    convert = subparsers.add_parser("convert", help="Convert inputs.csv files")
+    convert.add_argument("paths", nargs="+", help="inputs.csv files to convert")
+    args = parser.parse_args()
+
+    for csv_path in args.paths:
+        output_path = convert_csv(csv_path)
+        print(
+            f"{csv_path}: {os.path.getsize(csv_path) / 1024:.0f} KB -> "
+            f"{output_path}: {os.path.getsize(output_path) / 1024:.0f} KB"
+        )
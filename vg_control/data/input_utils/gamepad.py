@@ -4,7 +4,8 @@ Gamepad inputs
 
 import json
 import numpy as np
-import pandas as pd
+
+from .event_log import read_inputs
 
 
 def get_gamepad_stats(csv_path):
@@ -17,8 +18,8 @@ def get_gamepad_stats(csv_path):
     - Axis movement statistics
     - Button value changes (analog buttons like triggers)
     """
-    # Load and preprocess the CSV data
-    gamepad_data = pd.read_csv(csv_path)
+    # Load and preprocess the CSV data (or the equivalent binary event log)
+    gamepad_data = read_inputs(csv_path)
 
     # Find start time and normalize timestamps
     start_time = gamepad_data.head(1000)[
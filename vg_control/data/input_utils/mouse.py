@@ -6,6 +6,7 @@ import json
 import pandas as pd
 
 from ...constants import FPS
+from .event_log import read_inputs
 
 
 def get_mouse_stats(csv_path):
@@ -18,8 +19,8 @@ def get_mouse_stats(csv_path):
     """
     frame_duration = 1.0 / FPS
 
-    # Load and preprocess the CSV data
-    mouse_data = pd.read_csv(csv_path)
+    # Load and preprocess the CSV data (or the equivalent binary event log)
+    mouse_data = read_inputs(csv_path)
 
     # Find start time and normalize timestamps
     start_time = mouse_data.head(1000)[
@@ -0,0 +1,301 @@
+"""
+Sampled input statistics with confidence intervals
+
+The session is cut into equal time strata and one window of window_seconds is
+read from each, at a random position (stratified block sampling). Only those
+windows are parsed: inputs.csv is read through its time index sidecar (see
+time_index.py), event logs through their memory-mapped columns.
+
+Statistics are estimated from the windows with a confidence interval:
+
+- totals (event counts) and rates (actions per minute) scale the mean count
+  per window up to the whole session, with the usual sampling variance
+- means over events (axis activity) use a ratio estimator
+- maxima are bounded from below only: the largest sampled value is a lower
+  bound and the upper bound is infinite. An upper threshold on a maximum
+  (mouse overall_max, gamepad max_axis_movement) can therefore be found
+  exceeded but never ruled out, so samples alone can show mouse and gamepad
+  input invalid but never valid; only the keyboard checks can settle a
+  session as valid without an exact pass
+- unique counts, diversities and standard deviations are point estimates from
+  the pooled samples (no validation threshold depends on them)
+
+The result has the same keys as get_button_stats, get_mouse_stats and
+get_gamepad_stats, plus the intervals, so the validate_*_inputs checks can
+tell whether a threshold is decided by the samples.
+"""
+
+import itertools
+import math
+import os
+
+import numpy as np
+import pandas as pd
+
+from ...constants import FPS
+from .event_log import EventLog, is_event_log
+from .keybinds import CODE_TO_KEY
+from .time_index import load_time_index, read_window
+
+DEFAULT_WINDOWS = 24
+DEFAULT_WINDOW_SECONDS = 10.0
+CONFIDENCE_Z = 2.576  # 99% two-sided normal interval
+MIN_SAMPLED_BYTES = 16 * 1024 * 1024  # Smaller logs are cheaper to read in full
+
+WASD_CODES = [code for code, key in CODE_TO_KEY.items() if key in ("W", "A", "S", "D")]
+GAMEPAD_EVENT_TYPES = ("GAMEPAD_BUTTON", "GAMEPAD_BUTTON_VALUE", "GAMEPAD_AXIS")
+
+
+def _session_bounds(path):
+    """
+    (start, end) timestamps by the rules of the stats functions: the last
+    START in the first 1000 rows and the first END after it (or the last event)
+    """
+    if is_event_log(path):
+        log = EventLog(path)
+        timestamps = log.timestamps
+        names = log.type_names[log.column("event_type")]
+        start = timestamps[: min(1000, len(log))][names[:1000] == "START"][-1]
+        after = timestamps >= start
+        ends = timestamps[after & (names == "END")]
+        end = ends[0] if ends.size else timestamps[after].max()
+        return float(start), float(end)
+
+    index = load_time_index(path)
+    if index["start"] is None:
+        raise ValueError(f"{path} has no START event")
+    start = index["start"]["timestamp"]
+    if index["end"] is not None and index["end"]["timestamp"] >= start:
+        return start, index["end"]["timestamp"]
+    # No END: the session runs to its latest event, in the index's last interval
+    times = index["times"]
+    last = read_window(path, times[-2], times[-1], index=index)
+    return start, float(last["timestamp"].max())
+
+
+def _read_window(path, t0, t1, log=None):
+    if log is not None:
+        timestamps = log.timestamps
+        rows = np.flatnonzero((timestamps >= t0) & (timestamps < t1))
+        if rows.size == 0:
+            return log.frame(0, 0, event_args=False)
+        events = log.frame(int(rows[0]), int(rows[-1]) + 1, event_args=False)
+        return events[(events["timestamp"] >= t0) & (events["timestamp"] < t1)]
+
+    events = read_window(path, t0, t1)
+    # Two-argument rows ("[a, b]") are all the stats need
+    args = events["event_args"].astype(str).str.strip("[]")
+    parts = args.str.split(",", n=1, expand=True)
+    for i in range(2):
+        column = parts[i] if i in parts else pd.Series("", index=events.index)
+        column = column.fillna("").str.strip().replace({"true": "1", "false": "0"})
+        events[f"arg{i}"] = pd.to_numeric(column, errors="coerce")
+    return events
+
+
+def sample_windows(
+    path, windows=DEFAULT_WINDOWS, window_seconds=DEFAULT_WINDOW_SECONDS, seed=0
+):
+    """
+    Read one random window from each of `windows` equal time strata
+
+    Returns (duration in seconds, number of windows the session spans,
+    list of DataFrames with timestamps relative to START), or None when the
+    session is too short for sampling to read less than half of it.
+    """
+    start, end = _session_bounds(path)
+    duration = end - start
+    slots = int(duration // window_seconds)
+    if slots < 2 * windows:
+        return None
+
+    log = EventLog(path) if is_event_log(path) else None
+    rng = np.random.default_rng(seed)
+    edges = np.linspace(0, slots, windows + 1).astype(int)
+    samples = []
+    for low, high in itertools.pairwise(edges):
+        t0 = start + int(rng.integers(low, high)) * window_seconds
+        events = _read_window(path, t0, t0 + window_seconds, log).copy()
+        events["timestamp"] -= start
+        samples.append(events)
+    return duration, duration / window_seconds, samples
+
+
+def _total(counts, population):
+    """Estimated population total and interval from per-window counts"""
+    counts = np.asarray(counts, dtype=np.float64)
+    n = counts.size
+    estimate = population * counts.mean()
+    fpc = max(0.0, 1 - n / population)
+    se = population * math.sqrt(fpc * counts.var(ddof=1) / n) if n > 1 else 0.0
+    margin = CONFIDENCE_Z * se
+    return estimate, (max(0.0, estimate - margin), estimate + margin)
+
+
+def _ratio(sums, counts, population):
+    """Ratio estimate sum(sums) / sum(counts) and its interval"""
+    sums = np.asarray(sums, dtype=np.float64)
+    counts = np.asarray(counts, dtype=np.float64)
+    if counts.sum() == 0:
+        return 0.0, (0.0, 0.0)
+    n = sums.size
+    ratio = sums.sum() / counts.sum()
+    residuals = sums - ratio * counts
+    fpc = max(0.0, 1 - n / population)
+    se = math.sqrt(fpc * residuals.var(ddof=1) / n) / counts.mean() if n > 1 else 0.0
+    return ratio, (max(0.0, ratio - CONFIDENCE_Z * se), ratio + CONFIDENCE_Z * se)
+
+
+def _diversity(values):
+    """Unique count and normalized entropy of pooled values (as the stats functions)"""
+    if len(values) == 0:
+        return 0, 0.0
+    _, counts = np.unique(values, return_counts=True)
+    probs = counts / counts.sum()
+    entropy = -(probs * np.log2(probs)).sum()
+    max_entropy = np.log2(len(counts))
+    return len(counts), float(entropy / max_entropy) if max_entropy > 0 else 0.0
+
+
+def _std(values):
+    # Sample standard deviation, as pandas computes it
+    return float(values.std(ddof=1)) if values.size > 1 else float("nan")
+
+
+def _keyboard(samples, duration, population):
+    wasd, events, pressed_keys = [], [], []
+    for window in samples:
+        rows = window[window["event_type"] == "KEYBOARD"]
+        pressed = rows["arg1"].to_numpy() != 0
+        codes = rows["arg0"].to_numpy()
+        wasd.append(np.count_nonzero(pressed & np.isin(codes, WASD_CODES)))
+        events.append(len(rows))
+        pressed_keys.append(codes[pressed])
+
+    wasd_total, wasd_interval = _total(wasd, population)
+    minutes = duration / 60
+    total_events, events_interval = _total(events, population)
+    unique_keys, diversity = _diversity(np.concatenate(pressed_keys))
+    return {
+        "wasd_apm": wasd_total / minutes,
+        "unique_keys": unique_keys,
+        "button_diversity": diversity,
+        "total_keyboard_events": total_events,
+        "intervals": {
+            "wasd_apm": (wasd_interval[0] / minutes, wasd_interval[1] / minutes),
+            "total_keyboard_events": events_interval,
+        },
+    }
+
+
+def _mouse(samples):
+    frame_duration = 1.0 / FPS
+    dx, dy = [], []
+    for window in samples:
+        rows = window[window["event_type"] == "MOUSE_MOVE"]
+        if rows.empty:
+            continue
+        frames = (rows["timestamp"].to_numpy() // frame_duration).astype(np.int64)
+        _, inverse, counts = np.unique(frames, return_inverse=True, return_counts=True)
+        dx.append(np.bincount(inverse, weights=rows["arg0"].to_numpy()) / counts)
+        dy.append(np.bincount(inverse, weights=rows["arg1"].to_numpy()) / counts)
+
+    if not dx:
+        stats = dict.fromkeys(
+            ("overall_std", "x_std", "y_std", "overall_max", "max_x", "max_y"), 0.0
+        )
+        stats["intervals"] = {"overall_max": (0.0, math.inf)}
+        return stats
+
+    dx, dy = np.concatenate(dx), np.concatenate(dy)
+    magnitude = np.hypot(dx, dy)
+    return {
+        "overall_std": _std(magnitude),
+        "x_std": _std(dx),
+        "y_std": _std(dy),
+        "overall_max": float(magnitude.max()),
+        "max_x": float(np.abs(dx).max()),
+        "max_y": float(np.abs(dy).max()),
+        # A sampled maximum only bounds the true one from below
+        "intervals": {"overall_max": (float(magnitude.max()), math.inf)},
+    }
+
+
+def _gamepad(samples, duration, population):
+    presses, button_events, events, axis_sums, axis_counts = [], [], [], [], []
+    pressed_buttons, axis_max = [], 0.0
+    for window in samples:
+        event_types = window["event_type"]
+        buttons = window[event_types == "GAMEPAD_BUTTON"]
+        axes = window[event_types == "GAMEPAD_AXIS"]
+        pressed = buttons["arg1"].to_numpy() != 0
+        presses.append(np.count_nonzero(pressed))
+        pressed_buttons.append(buttons["arg0"].to_numpy()[pressed])
+        button_events.append(
+            len(buttons) + np.count_nonzero(event_types == "GAMEPAD_BUTTON_VALUE")
+        )
+        events.append(np.count_nonzero(event_types.isin(GAMEPAD_EVENT_TYPES)))
+        values = np.abs(axes["arg1"].to_numpy(dtype=np.float64))
+        axis_sums.append(values.sum())
+        axis_counts.append(values.size)
+        if values.size:
+            axis_max = max(axis_max, float(values.max()))
+
+    minutes = duration / 60
+    press_total, press_interval = _total(presses, population)
+    button_total, _ = _total(button_events, population)
+    events_total, events_interval = _total(events, population)
+    axis_activity, axis_interval = _ratio(axis_sums, axis_counts, population)
+    unique_buttons, diversity = _diversity(np.concatenate(pressed_buttons))
+    return {
+        "button_apm": press_total / minutes if minutes > 0 else 0,
+        "unique_buttons": unique_buttons,
+        "button_diversity": diversity,
+        "total_button_events": button_total,
+        "axis_activity": axis_activity,
+        "max_axis_movement": axis_max,
+        "total_gamepad_events": events_total,
+        "intervals": {
+            "button_apm": (press_interval[0] / minutes, press_interval[1] / minutes)
+            if minutes > 0
+            else (0.0, 0.0),
+            "axis_activity": axis_interval,
+            "max_axis_movement": (axis_max, math.inf),
+            "total_gamepad_events": events_interval,
+        },
+    }
+
+
+def estimate_input_stats(
+    path,
+    windows=DEFAULT_WINDOWS,
+    window_seconds=DEFAULT_WINDOW_SECONDS,
+    seed=0,
+    min_bytes=MIN_SAMPLED_BYTES,
+):
+    """
+    Estimate the keyboard, mouse and gamepad stats of an inputs.csv or event
+    log from sampled windows
+
+    Returns {"keyboard": ..., "mouse": ..., "gamepad": ..., "sampling": ...},
+    each stats dict carrying its "intervals", or None when the log is small or
+    short enough that reading it in full is the better choice.
+    """
+    if os.path.getsize(path) < min_bytes:
+        return None
+    sampled = sample_windows(path, windows, window_seconds, seed)
+    if sampled is None:
+        return None
+    duration, population, samples = sampled
+
+    return {
+        "keyboard": _keyboard(samples, duration, population),
+        "mouse": _mouse(samples),
+        "gamepad": _gamepad(samples, duration, population),
+        "sampling": {
+            "windows": len(samples),
+            "window_seconds": window_seconds,
+            "sampled_fraction": len(samples) / population,
+            "confidence_z": CONFIDENCE_Z,
+        },
+    }
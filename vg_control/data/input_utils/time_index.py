@@ -0,0 +1,263 @@
+"""
+Seekable time index for inputs.csv
+
+A small JSON sidecar (inputs.index.json next to inputs.csv) with the byte
+offsets of the log at regular time intervals and of its START/END events, so
+the events of a [t0, t1) window can be read without parsing the whole file.
+
+The log is written in time order, but a timestamp can occasionally go
+backwards. Each boundary therefore stores two offsets: where to start reading
+(no earlier row is at or after the boundary) and where to stop reading (no
+later row is before it), which are the same for a sorted log.
+
+Malformed rows (blank lines, rows without a timestamp and event type, or a
+last line cut off without its newline when the recorder stopped) are left out
+of the index, as sync_check does, and a cut-off last line is never read.
+
+Usage:
+    python -m vg_control.data.input_utils.time_index build PATH [PATH ...]
+    python -m vg_control.data.input_utils.time_index window PATH T0 T1 [--relative]
+"""
+
+import csv
+import io
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+INDEX_VERSION = 2
+INDEX_SUFFIX = ".index.json"
+DEFAULT_INTERVAL = 1.0  # seconds
+BLOCK_SIZE = 16 * 1024 * 1024
+
+
+def index_path(csv_path):
+    return os.path.splitext(csv_path)[0] + INDEX_SUFFIX
+
+
+def _row_offsets(csv_path):
+    """
+    Byte offset where each line after the header starts, plus the file size
+    and where the last complete (newline-terminated) line ends
+    """
+    offsets = []
+    position = 0
+    with open(csv_path, "rb") as f:
+        while block := f.read(BLOCK_SIZE):
+            newlines = np.flatnonzero(np.frombuffer(block, dtype=np.uint8) == 10)
+            offsets.append(newlines + position + 1)
+            position += len(block)
+
+    offsets = np.concatenate(offsets) if offsets else np.empty(0, dtype=np.int64)
+    data_bytes = int(offsets[-1]) if offsets.size else position
+    if offsets.size == 0 or offsets[-1] != position:
+        # No trailing newline: the last row ends at the end of the file
+        offsets = np.append(offsets, position)
+    return offsets.astype(np.int64), position, data_bytes
+
+
+def _file_signature(csv_path):
+    stat = os.stat(csv_path)
+    return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+
+def build_time_index(csv_path, interval=DEFAULT_INTERVAL):
+    """
+    Scan an inputs.csv once and build its time index
+
+    Returns the index as a dict (see write_time_index to save it).
+    """
+    # One row per line, blank and malformed ones included, so rows line up
+    # with their offsets; event_args (quoted, with commas) is split but unused
+    events = pd.read_csv(
+        csv_path,
+        usecols=[0, 1],
+        quoting=csv.QUOTE_NONE,
+        skip_blank_lines=False,
+        dtype={"event_type": str},
+    )
+    line_offsets, file_size, data_bytes = _row_offsets(csv_path)
+    if line_offsets.size != len(events) + 1:
+        raise ValueError(
+            f"{csv_path}: found {line_offsets.size - 1} lines but {len(events)} rows"
+        )
+
+    timestamps = pd.to_numeric(events["timestamp"], errors="coerce").to_numpy()
+    valid = ~np.isnan(timestamps) & events["event_type"].notna().to_numpy()
+    valid &= line_offsets[1:] <= data_bytes  # Not the cut-off last line
+    rows = np.flatnonzero(valid)
+    timestamps = timestamps[rows]
+    event_types = events["event_type"].to_numpy()[rows]
+    # Offset of each well-formed row, then where the readable data ends
+    offsets = np.append(line_offsets[rows], data_bytes)
+
+    index = {
+        "version": INDEX_VERSION,
+        "file": _file_signature(csv_path),
+        "interval": interval,
+        "header_bytes": int(line_offsets[0]) if len(events) else file_size,
+        "data_bytes": data_bytes,
+        "rows": int(timestamps.size),
+        "start": None,
+        "end": None,
+        "times": [],
+        "start_offsets": [],
+        "stop_offsets": [],
+    }
+    if timestamps.size == 0:
+        return index
+
+    # Same START/END rules as the stats functions (rows are line numbers)
+    start_rows = np.flatnonzero((event_types == "START") & (rows < 1000))
+    if start_rows.size:
+        i = int(start_rows[-1])
+        index["start"] = {
+            "row": int(rows[i]),
+            "offset": int(offsets[i]),
+            "timestamp": float(timestamps[i]),
+        }
+    end_rows = np.flatnonzero(event_types == "END")
+    if end_rows.size:
+        i = int(end_rows[0])
+        index["end"] = {
+            "row": int(rows[i]),
+            "offset": int(offsets[i]),
+            "timestamp": float(timestamps[i]),
+        }
+
+    first = np.floor(timestamps.min() / interval) * interval
+    count = int(np.floor((timestamps.max() - first) / interval)) + 2
+    times = first + interval * np.arange(count)
+
+    # Rows before a start offset are all earlier than its boundary, and rows
+    # from a stop offset on are all at or after it
+    running_max = np.maximum.accumulate(timestamps)
+    suffix_min = np.minimum.accumulate(timestamps[::-1])[::-1]
+    start_rows = np.searchsorted(running_max, times, side="left")
+    stop_rows = np.searchsorted(suffix_min, times, side="left")
+
+    index["times"] = times.tolist()
+    index["start_offsets"] = offsets[start_rows].tolist()
+    index["stop_offsets"] = offsets[stop_rows].tolist()
+    return index
+
+
+def write_time_index(csv_path, index):
+    path = index_path(csv_path)
+    with open(f"{path}.tmp", "w") as f:
+        json.dump(index, f)
+    os.replace(f"{path}.tmp", path)
+    return path
+
+
+def load_time_index(csv_path, interval=DEFAULT_INTERVAL, build=True):
+    """
+    Load the sidecar index of an inputs.csv
+
+    An index that is missing, or stale because the CSV changed since it was
+    built, is rebuilt and saved (or None is returned when build is False).
+    """
+    try:
+        with open(index_path(csv_path)) as f:
+            index = json.load(f)
+        current = index.get("file") == _file_signature(csv_path)
+        if index.get("version") == INDEX_VERSION and current:
+            return index
+    except (OSError, ValueError):
+        pass
+
+    if not build:
+        return None
+    index = build_time_index(csv_path, interval=interval)
+    write_time_index(csv_path, index)
+    return index
+
+
+def session_bounds(csv_path, index=None):
+    """START and END timestamps of a session (None for a missing event)"""
+    index = index or load_time_index(csv_path)
+    start = index["start"]["timestamp"] if index["start"] else None
+    end = index["end"]["timestamp"] if index["end"] else None
+    return start, end
+
+
+def window_byte_range(index, t0, t1):
+    """Byte range [begin, end) of the file with every row where t0 <= timestamp < t1"""
+    times = index["times"]
+    if not times:
+        return index["header_bytes"], index["header_bytes"]
+
+    # Last boundary at or before t0, first boundary at or after t1
+    k0 = int(np.searchsorted(times, t0, side="right")) - 1
+    k1 = int(np.searchsorted(times, t1, side="left"))
+    begin = index["start_offsets"][k0] if k0 >= 0 else index["header_bytes"]
+    end = index["stop_offsets"][k1] if k1 < len(times) else index["data_bytes"]
+    return begin, max(begin, end)
+
+
+def read_window(csv_path, t0, t1, relative=False, index=None):
+    """
+    Events with t0 <= timestamp < t1, reading only the part of the file that
+    can contain them
+
+    Args:
+        csv_path: Path to inputs.csv
+        t0, t1: Window bounds (unix time, or seconds since START if relative)
+        relative: Interpret t0/t1 relative to the START event
+        index: Preloaded index (loaded or built if None)
+
+    Returns:
+        DataFrame with the inputs.csv columns, timestamps unchanged
+    """
+    index = index or load_time_index(csv_path)
+    if relative:
+        if index["start"] is None:
+            raise ValueError(f"{csv_path} has no START event")
+        t0 += index["start"]["timestamp"]
+        t1 += index["start"]["timestamp"]
+
+    begin, end = window_byte_range(index, t0, t1)
+    with open(csv_path, "rb") as f:
+        header = f.read(index["header_bytes"])
+        f.seek(begin)
+        body = f.read(end - begin)
+
+    events = pd.read_csv(io.BytesIO(header + body))
+    # A malformed row makes the column strings; it never falls in the window
+    events["timestamp"] = pd.to_numeric(events["timestamp"], errors="coerce")
+    in_window = (events["timestamp"] >= t0) & (events["timestamp"] < t1)
+    return events[in_window].reset_index(drop=True)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Time index for inputs.csv")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    build = subparsers.add_parser("build", help="Build (or refresh) indexes")
+    build.add_argument("paths", nargs="+", help="inputs.csv files")
+    build.add_argument(
+        "--interval",
+        type=float,
+        default=DEFAULT_INTERVAL,
+        help="Seconds between entries",
+    )
+    window = subparsers.add_parser("window", help="Print the events of a window")
+    window.add_argument("path", help="inputs.csv file")
+    window.add_argument("t0", type=float)
+    window.add_argument("t1", type=float)
+    window.add_argument(
+        "--relative", action="store_true", help="t0/t1 are seconds since START"
+    )
+    args = parser.parse_args()
+
+    if args.command == "build":
+        for csv_path in args.paths:
+            index = build_time_index(csv_path, interval=args.interval)
+            path = write_time_index(csv_path, index)
+            print(f"{csv_path}: {len(index['times'])} entries -> {path}")
+    else:
+        events = read_window(args.path, args.t0, args.t1, relative=args.relative)
+        print(events.to_string())
@@ -0,0 +1,403 @@
+"""
+Header-only MP4 (ISO-BMFF) reader
+
+Reads the real duration, resolution, frame rate, codec and sample count of a
+recording from its `moov` box, without ffmpeg and without touching the media
+data: top-level boxes are walked by their headers and `mdat` is seeked past.
+Fragmented MP4s (where samples are described by `moof` boxes) are supported
+by reading the fragment headers as well.
+
+keyframe_index() also decodes the sync-sample, time-to-sample and chunk
+tables into a keyframe -> (byte offset, timestamp) map, so clip loaders can
+seek straight to the keyframe before a frame window.
+"""
+
+import struct
+
+import numpy as np
+
+# Boxes whose payload is just more boxes
+CONTAINER_BOXES = {
+    b"moov",
+    b"trak",
+    b"mdia",
+    b"minf",
+    b"stbl",
+    b"mvex",
+    b"moof",
+    b"traf",
+    b"edts",
+    b"dinf",
+}
+
+# Sample table boxes kept as raw payloads for later decoding
+SAMPLE_TABLES = (b"stts", b"stss", b"stsc", b"stsz", b"stco", b"co64")
+
+CODEC_NAMES = {
+    "avc1": "h264",
+    "avc3": "h264",
+    "hvc1": "hevc",
+    "hev1": "hevc",
+    "av01": "av1",
+    "vp09": "vp9",
+}
+
+
+class MP4Error(ValueError):
+    """The file is not a readable MP4 (e.g. a recording cut off before its moov)"""
+
+
+def read_top_level_boxes(f):
+    """
+    Walk the top-level boxes of an open file by their headers only
+
+    Returns (moov payload, [moof payloads]); everything else, mdat included,
+    is skipped with a seek.
+    """
+    f.seek(0, 2)
+    file_size = f.tell()
+    position = 0
+    moov = None
+    moofs = []
+
+    while position + 8 <= file_size:
+        f.seek(position)
+        size, box_type = struct.unpack(">I4s", f.read(8))
+        header_size = 8
+        if size == 1:
+            (size,) = struct.unpack(">Q", f.read(8))
+            header_size = 16
+        elif size == 0:
+            size = file_size - position
+        if size < header_size or position + size > file_size:
+            # Truncated box, usually a recording that was never finalized
+            break
+
+        if box_type == b"moov":
+            moov = f.read(size - header_size)
+        elif box_type == b"moof":
+            moofs.append(f.read(size - header_size))
+        position += size
+
+    if moov is None:
+        raise MP4Error("No moov box found")
+    return moov, moofs
+
+
+def iter_boxes(data, start=0, end=None):
+    """Yield (type, payload start, payload end) for the boxes in data[start:end]"""
+    end = len(data) if end is None else end
+    position = start
+    while position + 8 <= end:
+        size, box_type = struct.unpack_from(">I4s", data, position)
+        header_size = 8
+        if size == 1:
+            (size,) = struct.unpack_from(">Q", data, position + 8)
+            header_size = 16
+        elif size == 0:
+            size = end - position
+        if size < header_size or position + size > end:
+            raise MP4Error(f"Malformed {box_type!r} box")
+        yield box_type, position + header_size, position + size
+        position += size
+
+
+def find_boxes(data, path, start=0, end=None):
+    """All boxes reached by following a path of box types, e.g. [b"trak", b"mdia"]"""
+    found = []
+    for box_type, payload_start, payload_end in iter_boxes(data, start, end):
+        if box_type != path[0]:
+            continue
+        if len(path) == 1:
+            found.append((payload_start, payload_end))
+        elif box_type in CONTAINER_BOXES:
+            found.extend(find_boxes(data, path[1:], payload_start, payload_end))
+    return found
+
+
+def find_box(data, path, start=0, end=None):
+    boxes = find_boxes(data, path, start, end)
+    return boxes[0] if boxes else None
+
+
+def _timescale_and_duration(data, start):
+    """Parse an mvhd/mdhd payload"""
+    version = data[start]
+    if version == 1:
+        timescale, duration = struct.unpack_from(">IQ", data, start + 4 + 16)
+    else:
+        timescale, duration = struct.unpack_from(">II", data, start + 4 + 8)
+    return timescale, duration
+
+
+def _track_id(data, tkhd_start):
+    version = data[tkhd_start]
+    offset = tkhd_start + 4 + (16 if version == 1 else 8)
+    return struct.unpack_from(">I", data, offset)[0]
+
+
+def read_video_track(path):
+    """
+    Parse the video track of an MP4's header
+
+    Returns a dict with the track id, media timescale and duration, the movie
+    duration, the sample entry's codec tag and size, the raw sample tables
+    (stts, stss, ...) and, for fragmented files, the fragment headers.
+    """
+    with open(path, "rb") as f:
+        moov, moofs = read_top_level_boxes(f)
+
+    mvhd = find_box(moov, [b"mvhd"])
+    if mvhd is None:
+        raise MP4Error("No mvhd box in moov")
+    movie_timescale, movie_duration = _timescale_and_duration(moov, mvhd[0])
+
+    for trak_start, trak_end in find_boxes(moov, [b"trak"]):
+        hdlr = find_box(moov, [b"mdia", b"hdlr"], trak_start, trak_end)
+        if hdlr is None or moov[hdlr[0] + 8 : hdlr[0] + 12] != b"vide":
+            continue
+
+        tkhd = find_box(moov, [b"tkhd"], trak_start, trak_end)
+        mdhd = find_box(moov, [b"mdia", b"mdhd"], trak_start, trak_end)
+        stbl = find_box(moov, [b"mdia", b"minf", b"stbl"], trak_start, trak_end)
+        if tkhd is None or mdhd is None or stbl is None:
+            raise MP4Error("Incomplete video track")
+        timescale, duration = _timescale_and_duration(moov, mdhd[0])
+
+        stsd = find_box(moov, [b"stsd"], *stbl)
+        if stsd is None:
+            raise MP4Error("No stsd box in video track")
+        # First sample entry: size, fourcc, 6 reserved, data_reference_index,
+        # 16 bytes of pre_defined/reserved, then width and height
+        entry = stsd[0] + 8
+        codec_tag = moov[entry + 4 : entry + 8].decode("ascii", errors="replace")
+        width, height = struct.unpack_from(">HH", moov, entry + 8 + 24)
+
+        tables = {}
+        for name in SAMPLE_TABLES:
+            box = find_box(moov, [name], *stbl)
+            if box is not None:
+                tables[name.decode()] = moov[box[0] : box[1]]
+
+        return {
+            "track_id": _track_id(moov, tkhd[0]),
+            "timescale": timescale,
+            "duration": duration,
+            "movie_timescale": movie_timescale,
+            "movie_duration": movie_duration,
+            "codec_tag": codec_tag,
+            "width": width,
+            "height": height,
+            "tables": tables,
+            "trex": _read_trex(moov),
+            "moofs": moofs,
+        }
+
+    raise MP4Error("No video track found")
+
+
+def _read_trex(moov):
+    """Default sample duration/size per track id from mvex/trex"""
+    defaults = {}
+    for start, _ in find_boxes(moov, [b"mvex", b"trex"]):
+        track_id, _, duration, size = struct.unpack_from(">IIII", moov, start + 4)
+        defaults[track_id] = {"duration": duration, "size": size}
+    return defaults
+
+
+def table_array(payload, header_words, columns, dtype=">u4"):
+    """Decode a full-box table: version/flags, header words, then rows of columns"""
+    count = struct.unpack_from(">I", payload, 4 + 4 * (header_words - 1))[0]
+    start = 4 + 4 * header_words
+    array = np.frombuffer(payload, dtype=dtype, count=count * columns, offset=start)
+    return array.astype(np.int64).reshape(count, columns)
+
+
+def sample_durations(track):
+    """
+    Duration of every sample of a track in media timescale units
+
+    Comes from stts, or for fragmented files from the trun boxes of every moof.
+    """
+    stts = track["tables"].get("stts")
+    if stts is not None:
+        entries = table_array(stts, 1, 2)
+        if entries.size:
+            return np.repeat(entries[:, 1], entries[:, 0])
+
+    durations = []
+    default = track["trex"].get(track["track_id"], {}).get("duration", 0)
+    for moof in track["moofs"]:
+        for traf_start, traf_end in find_boxes(moof, [b"traf"]):
+            tfhd = find_box(moof, [b"tfhd"], traf_start, traf_end)
+            if tfhd is None:
+                continue
+            flags = int.from_bytes(moof[tfhd[0] + 1 : tfhd[0] + 4], "big")
+            if struct.unpack_from(">I", moof, tfhd[0] + 4)[0] != track["track_id"]:
+                continue
+
+            # tfhd optional fields, in order, after the track id
+            offset = tfhd[0] + 8
+            offset += 8 if flags & 0x01 else 0  # base_data_offset
+            offset += 4 if flags & 0x02 else 0  # sample_description_index
+            fragment_default = default
+            if flags & 0x08:
+                (fragment_default,) = struct.unpack_from(">I", moof, offset)
+
+            for trun_start, _ in find_boxes(moof, [b"trun"], traf_start, traf_end):
+                durations.append(_trun_durations(moof, trun_start, fragment_default))
+    return np.concatenate(durations) if durations else np.empty(0, dtype=np.int64)
+
+
+def _trun_durations(data, start, default_duration):
+    flags = int.from_bytes(data[start + 1 : start + 4], "big")
+    (count,) = struct.unpack_from(">I", data, start + 4)
+    if not flags & 0x100:
+        return np.full(count, default_duration, dtype=np.int64)
+
+    offset = start + 8
+    offset += 4 if flags & 0x01 else 0  # data_offset
+    offset += 4 if flags & 0x04 else 0  # first_sample_flags
+    fields = sum(4 for bit in (0x100, 0x200, 0x400, 0x800) if flags & bit)
+    rows = np.frombuffer(data, dtype=">u4", count=count * fields // 4, offset=offset)
+    return rows.reshape(count, fields // 4)[:, 0].astype(np.int64)
+
+
+def load_video_track(path):
+    """read_video_track, with a malformed header raised as MP4Error"""
+    try:
+        return read_video_track(path)
+    except (struct.error, ValueError) as e:
+        raise MP4Error(f"Malformed header: {e}") from e
+
+
+def probe_video(path, track=None):
+    """
+    Real properties of an MP4's video track, read from its header only
+
+    Args:
+        path: The .mp4
+        track: load_video_track(path), if already read
+
+    Returns:
+        dict with duration_ms, width, height, fps, codec (e.g. "h264"),
+        codec_tag (the sample entry fourcc, e.g. "avc1") and sample_count
+
+    Raises:
+        MP4Error if the file has no readable header or video track
+    """
+    try:
+        if track is None:
+            track = read_video_track(path)
+        durations = sample_durations(track)
+    except MP4Error:
+        raise
+    except (struct.error, ValueError) as e:
+        raise MP4Error(f"Malformed header: {e}") from e
+    media_ticks = int(durations.sum()) if durations.size else track["duration"]
+
+    if media_ticks and track["timescale"]:
+        duration_ms = 1000 * media_ticks / track["timescale"]
+    else:
+        duration_ms = 1000 * track["movie_duration"] / max(track["movie_timescale"], 1)
+
+    fps = 0.0
+    if durations.size and media_ticks:
+        fps = durations.size * track["timescale"] / media_ticks
+
+    return {
+        "duration_ms": round(duration_ms),
+        "width": track["width"],
+        "height": track["height"],
+        "fps": round(fps, 3),
+        "codec": CODEC_NAMES.get(track["codec_tag"], track["codec_tag"]),
+        "codec_tag": track["codec_tag"],
+        "sample_count": int(durations.size),
+    }
+
+
+def sample_offsets(track):
+    """Byte offset of every sample in the file, from stsc, stsz and stco/co64"""
+    tables = track["tables"]
+    stsz = tables["stsz"]
+    uniform_size, count = struct.unpack_from(">II", stsz, 4)
+    if uniform_size:
+        sizes = np.full(count, uniform_size, dtype=np.int64)
+    else:
+        sizes = np.frombuffer(stsz, dtype=">u4", count=count, offset=12)
+        sizes = sizes.astype(np.int64)
+
+    if "co64" in tables:
+        chunk_offsets = table_array(tables["co64"], 1, 1, dtype=">u8")[:, 0]
+    else:
+        chunk_offsets = table_array(tables["stco"], 1, 1)[:, 0]
+
+    # stsc runs: chunks from first_chunk (1-based) to the next run's first chunk
+    # hold samples_per_chunk each
+    runs = table_array(tables["stsc"], 1, 3)
+    run_ends = np.append(runs[1:, 0], chunk_offsets.size + 1)
+    samples_per_chunk = np.repeat(runs[:, 1], run_ends - runs[:, 0])
+
+    chunk_of_sample = np.repeat(np.arange(chunk_offsets.size), samples_per_chunk)
+    chunk_of_sample = chunk_of_sample[:count]
+    before_sample = np.cumsum(sizes) - sizes
+    chunk_first_sample = np.cumsum(samples_per_chunk) - samples_per_chunk
+    return (
+        chunk_offsets[chunk_of_sample]
+        + before_sample
+        - before_sample[np.minimum(chunk_first_sample[chunk_of_sample], count - 1)]
+    )
+
+
+def keyframe_index(path, track=None):
+    """
+    Keyframes of an MP4's video track, read from its header only
+
+    Args:
+        path: The .mp4
+        track: load_video_track(path), if already read
+
+    Returns:
+        dict with the track timescale, sample_count and parallel lists:
+        frame (0-based sample number), offset (byte offset of the sample in
+        the file) and time_ms (decode time)
+
+    Raises:
+        MP4Error if the header can't be read or has no sample tables (as in
+        fragmented MP4s, whose samples are described per fragment)
+    """
+    try:
+        if track is None:
+            track = read_video_track(path)
+        tables = track["tables"]
+        if "stsz" not in tables or not ("stco" in tables or "co64" in tables):
+            raise MP4Error("No sample tables in video track")
+
+        durations = sample_durations(track)
+        offsets = sample_offsets(track)
+        if durations.size != offsets.size or offsets.size == 0:
+            raise MP4Error("No samples in video track sample tables")
+
+        # Without stss every sample is a sync sample
+        if "stss" in tables:
+            frames = table_array(tables["stss"], 1, 1)[:, 0] - 1
+            if frames.size and (frames.min() < 0 or frames.max() >= offsets.size):
+                raise MP4Error("Sync sample numbers outside the sample tables")
+        else:
+            frames = np.arange(offsets.size)
+        if not track["timescale"]:
+            raise MP4Error("Video track has no timescale")
+    except MP4Error:
+        raise
+    except (struct.error, ValueError, KeyError) as e:
+        raise MP4Error(f"Malformed sample tables: {e}") from e
+
+    decode_times = np.cumsum(durations) - durations
+    time_ms = 1000 * decode_times[frames] / track["timescale"]
+    return {
+        "timescale": track["timescale"],
+        "sample_count": int(offsets.size),
+        "frame": frames.tolist(),
+        "offset": offsets[frames].tolist(),
+        "time_ms": np.round(time_ms, 3).tolist(),
+    }
@@ -3,6 +3,8 @@ from dotenv import load_dotenv
 import os
 import tarfile
 import json
+import math
+import time
 
 from ..constants import (
     ROOT_DIR,
@@ -16,22 +18,48 @@ from ..constants import (
 from .input_utils.buttons import get_button_stats
 from .input_utils.mouse import get_mouse_stats
 from .input_utils.gamepad import get_gamepad_stats
-from .uploader import upload_archive
+from .input_utils.event_log import EVENT_LOG_SUFFIX, convert_csv, is_event_log
+from .input_utils.sampled_stats import estimate_input_stats
+from .discovery import discover_sessions
+from .disk_budget import EVICTED_MARKER, enforce_disk_budgets, print_report
+from .mp4 import MP4Error, keyframe_index, load_video_track, probe_video
+from .session_lock import LeaseLost, LeaseManager
+from .sync_check import check_sync
+from .uploader import progress_path, upload_archive
+from .. import profiling
 
 load_dotenv()
 
+# Whether to upload the binary event log: not at all, next to the CSV, or instead of it
+EVENT_LOG_MODES = ("off", "alongside", "instead")
+
+# Sessions up to BUNDLE_SESSION_MAX_BYTES can share one upload, up to
+# BUNDLE_MAX_SESSIONS/BUNDLE_MAX_BYTES per bundle
+BUNDLE_SESSION_MAX_BYTES = 32 * 1024 * 1024
+BUNDLE_MAX_BYTES = 256 * 1024 * 1024
+BUNDLE_MAX_SESSIONS = 16
+BUNDLE_MANIFEST_NAME = "manifest.json"
+BUNDLE_MANIFEST_VERSION = 1
+
 # Directory structure might be nested, but the root dirs will always have a .mp4 and .csv
 
 
-def validate_video_metadata(vid_path, meta_path) -> list[str]:
+def validate_video_metadata(vid_path, video=None) -> list[str]:
     """
-    Validate basic video metadata (duration, file size).
+    Validate basic video metadata (duration, frame rate), read from the MP4 header.
+
+    video is probe_video(vid_path), if already read.
 
     Return value is a list of reasons for invalidity. If empty, the metadata is valid.
     """
-    with open(meta_path) as f:
-        metadata = json.load(f)
-    duration = float(metadata["duration"])
+    if video is None:
+        try:
+            video = probe_video(vid_path)
+        except MP4Error as e:
+            # Typically a recording that was cut off before OBS wrote its header
+            return [f"Could not read video header: {e}"]
+
+    duration = video["duration_ms"] / 1000
 
     invalid_reasons = []
 
@@ -40,22 +68,82 @@ def validate_video_metadata(vid_path, meta_path) -> list[str]:
     if duration > MAX_FOOTAGE + 10:
         invalid_reasons.append(f"Video length {duration:.2f} too long.")
 
-    bitrate = 2  # mbps
-    # Get video file size in MB
-    vid_size = os.path.getsize(vid_path) / (1024 * 1024)
-    vid_size *= 8  # megabits
-    expected_bits = bitrate * duration
-
-    if (
-        vid_size < 0.25 * expected_bits
-    ):  # Less than quarter of expected size is unlikely
+    if video["sample_count"] == 0:
+        invalid_reasons.append("Video has no frames.")
+    elif video["fps"] < 0.5 * FPS:  # Less than half the recording frame rate
         invalid_reasons.append(
-            f"Video size {vid_size:.2f} Mb too small compared to expected {expected_bits:.2f} Mb"
+            f"Video frame rate {video['fps']:.1f} too low compared to expected {FPS}"
         )
 
     return invalid_reasons
 
 
+# (stat, comparison, threshold, reason) checks on the get_*_stats results; a
+# check that holds makes that input type invalid
+KEYBOARD_CHECKS = (
+    # Less than 10 actions per minute is likely AFK/inactive
+    ("wasd_apm", "<", 10, "WASD actions per minute too low: {:.1f}"),
+    # Too few keyboard events overall
+    ("total_keyboard_events", "<", 50, "Too few keyboard events: {}"),
+)
+MOUSE_CHECKS = (
+    # Very little mouse movement
+    ("overall_max", "<", 0.05, "Mouse movement too small: {:.3f}"),
+    # Unreasonably large mouse movements
+    ("overall_max", ">", 10_000, "Mouse movement too large: {:.1f}"),
+)
+GAMEPAD_CHECKS = (
+    # Too few gamepad events overall
+    ("total_gamepad_events", "<", 20, "Too few gamepad events: {}"),
+    # Less than 5 button presses per minute
+    ("button_apm", "<", 5, "Gamepad button actions per minute too low: {:.1f}"),
+    # Very little axis movement
+    ("axis_activity", "<", 0.01, "Gamepad axis activity too low: {:.3f}"),
+    # Unreasonably large axis movements
+    ("max_axis_movement", ">", 2.0, "Gamepad axis movement too large: {:.3f}"),
+)
+
+# get_*_stats keys -> input_stats keys stored in metadata.json
+KEYBOARD_STAT_NAMES = {
+    "wasd_apm": "wasd_apm",
+    "unique_keys": "unique_keys",
+    "button_diversity": "button_diversity",
+    "total_keyboard_events": "total_keyboard_events",
+}
+MOUSE_STAT_NAMES = {
+    "overall_std": "mouse_movement_std",
+    "x_std": "mouse_x_std",
+    "y_std": "mouse_y_std",
+    "overall_max": "mouse_max_movement",
+    "max_x": "mouse_max_x",
+    "max_y": "mouse_max_y",
+}
+GAMEPAD_STAT_NAMES = {
+    "button_apm": "gamepad_button_apm",
+    "unique_buttons": "gamepad_unique_buttons",
+    "button_diversity": "gamepad_button_diversity",
+    "total_gamepad_events": "gamepad_total_events",
+    "axis_activity": "gamepad_axis_activity",
+    "max_axis_movement": "gamepad_max_axis_movement",
+}
+
+
+def failed_checks(stats, checks) -> list[str]:
+    """Reasons for every check that holds for the given stats"""
+    reasons = []
+    for stat, comparison, threshold, reason in checks:
+        value = stats[stat]
+        if value < threshold if comparison == "<" else value > threshold:
+            reasons.append(reason.format(value))
+    return reasons
+
+
+def validate_inputs(stats, checks, stat_names) -> tuple[list[str], dict]:
+    return failed_checks(stats, checks), {
+        name: stats[stat] for stat, name in stat_names.items()
+    }
+
+
 def validate_keyboard_inputs(csv_path) -> tuple[list[str], dict]:
     """
     Validate keyboard inputs.
@@ -64,32 +152,9 @@ def validate_keyboard_inputs(csv_path) -> tuple[list[str], dict]:
         - List of reasons for invalidity (empty if valid)
         - Dictionary of keyboard statistics
     """
-    invalid_reasons = []
-
-    btn_stats = get_button_stats(csv_path)
-
-    # Filter out samples with too little keyboard activity
-    if (
-        btn_stats["wasd_apm"] < 10
-    ):  # Less than 10 actions per minute is likely AFK/inactive
-        invalid_reasons.append(
-            f"WASD actions per minute too low: {btn_stats['wasd_apm']:.1f}"
-        )
-
-    if btn_stats["total_keyboard_events"] < 50:  # Too few keyboard events overall
-        invalid_reasons.append(
-            f"Too few keyboard events: {btn_stats['total_keyboard_events']}"
-        )
-
-    # Keyboard stats
-    keyboard_stats = {
-        "wasd_apm": btn_stats["wasd_apm"],
-        "unique_keys": btn_stats["unique_keys"],
-        "button_diversity": btn_stats["button_diversity"],
-        "total_keyboard_events": btn_stats["total_keyboard_events"],
-    }
-
-    return invalid_reasons, keyboard_stats
+    return validate_inputs(
+        get_button_stats(csv_path), KEYBOARD_CHECKS, KEYBOARD_STAT_NAMES
+    )
 
 
 def validate_mouse_inputs(csv_path) -> tuple[list[str], dict]:
@@ -100,32 +165,7 @@ def validate_mouse_inputs(csv_path) -> tuple[list[str], dict]:
         - List of reasons for invalidity (empty if valid)
         - Dictionary of mouse statistics
     """
-    invalid_reasons = []
-
-    mouse_stats = get_mouse_stats(csv_path)
-
-    # Filter out samples with abnormal mouse behavior
-    if mouse_stats["overall_max"] < 0.05:  # Very little mouse movement
-        invalid_reasons.append(
-            f"Mouse movement too small: {mouse_stats['overall_max']:.3f}"
-        )
-
-    if mouse_stats["overall_max"] > 10_000:  # Unreasonably large mouse movements
-        invalid_reasons.append(
-            f"Mouse movement too large: {mouse_stats['overall_max']:.1f}"
-        )
-
-    # Mouse stats
-    mouse_input_stats = {
-        "mouse_movement_std": mouse_stats["overall_std"],
-        "mouse_x_std": mouse_stats["x_std"],
-        "mouse_y_std": mouse_stats["y_std"],
-        "mouse_max_movement": mouse_stats["overall_max"],
-        "mouse_max_x": mouse_stats["max_x"],
-        "mouse_max_y": mouse_stats["max_y"],
-    }
-
-    return invalid_reasons, mouse_input_stats
+    return validate_inputs(get_mouse_stats(csv_path), MOUSE_CHECKS, MOUSE_STAT_NAMES)
 
 
 def validate_gamepad_inputs(csv_path) -> tuple[list[str], dict]:
@@ -136,65 +176,148 @@ def validate_gamepad_inputs(csv_path) -> tuple[list[str], dict]:
         - List of reasons for invalidity (empty if valid)
         - Dictionary of gamepad statistics
     """
-    invalid_reasons = []
-
-    gamepad_stats = get_gamepad_stats(csv_path)
+    return validate_inputs(
+        get_gamepad_stats(csv_path), GAMEPAD_CHECKS, GAMEPAD_STAT_NAMES
+    )
 
-    # Filter out samples with too little gamepad activity
-    if gamepad_stats["total_gamepad_events"] < 20:  # Too few gamepad events overall
-        invalid_reasons.append(
-            f"Too few gamepad events: {gamepad_stats['total_gamepad_events']}"
-        )
-
-    if gamepad_stats["button_apm"] < 5:  # Less than 5 button presses per minute
-        invalid_reasons.append(
-            f"Gamepad button actions per minute too low: {gamepad_stats['button_apm']:.1f}"
-        )
 
-    # Filter out samples with abnormal axis behavior
-    if gamepad_stats["axis_activity"] < 0.01:  # Very little axis movement
-        invalid_reasons.append(
-            f"Gamepad axis activity too low: {gamepad_stats['axis_activity']:.3f}"
-        )
-
-    if gamepad_stats["max_axis_movement"] > 2.0:  # Unreasonably large axis movements
-        invalid_reasons.append(
-            f"Gamepad axis movement too large: {gamepad_stats['max_axis_movement']:.3f}"
+def check_intervals(intervals, checks):
+    """
+    Decide an input type from sampled intervals: True if some check holds for
+    its whole interval (invalid), False if every check fails for its whole
+    interval (valid), None if an interval straddles a threshold
+    """
+    decided = True
+    for stat, comparison, threshold, _ in checks:
+        low, high = intervals[stat]
+        holds, fails = (
+            (high < threshold, low >= threshold)
+            if comparison == "<"
+            else (low > threshold, high <= threshold)
         )
+        if holds:
+            return True
+        decided = decided and fails
+    return False if decided else None
 
-    # Add gamepad-specific stats
-    gamepad_input_stats = {
-        "gamepad_button_apm": gamepad_stats["button_apm"],
-        "gamepad_unique_buttons": gamepad_stats["unique_buttons"],
-        "gamepad_button_diversity": gamepad_stats["button_diversity"],
-        "gamepad_total_events": gamepad_stats["total_gamepad_events"],
-        "gamepad_axis_activity": gamepad_stats["axis_activity"],
-        "gamepad_max_axis_movement": gamepad_stats["max_axis_movement"],
-    }
-
-    return invalid_reasons, gamepad_input_stats
 
-
-def filter_invalid_sample(vid_path, csv_path, meta_path) -> list[str]:
+def validate_inputs_sampled(csv_path):
+    """
+    Validate keyboard, mouse and gamepad inputs from sampled windows (see
+    input_utils/sampled_stats.py), computing the exact stats of an input type
+    only when its interval straddles a threshold and the session's validity
+    depends on it.
+
+    Returns [(reasons, stats)] for keyboard, mouse and gamepad and the
+    sampling details for metadata.json, or None if the log is too small to
+    be worth sampling.
+    """
+    estimates = estimate_input_stats(csv_path)
+    if estimates is None:
+        return None
+
+    input_types = (
+        ("keyboard", KEYBOARD_CHECKS, KEYBOARD_STAT_NAMES, get_button_stats),
+        ("mouse", MOUSE_CHECKS, MOUSE_STAT_NAMES, get_mouse_stats),
+        ("gamepad", GAMEPAD_CHECKS, GAMEPAD_STAT_NAMES, get_gamepad_stats),
+    )
+    decisions = {}
+    for name, checks, _, _ in input_types:
+        intervals = {
+            stat: estimates[name]["intervals"].get(stat, (value, value))
+            for stat, value in estimates[name].items()
+            if stat != "intervals"
+        }
+        decisions[name] = check_intervals(intervals, checks)
+
+    # One valid input type makes the session valid (see filter_invalid_sample)
+    session_decided = False in decisions.values()
+
+    results = []
+    sampling = {**estimates["sampling"], "exact": [], "intervals": {}}
+    for name, checks, stat_names, get_stats in input_types:
+        if decisions[name] is None and not session_decided:
+            with profiling.phase(f"validate_{name}_exact", trace_memory=True):
+                stats = get_stats(csv_path)
+            sampling["exact"].append(name)
+        else:
+            stats = estimates[name]
+            for stat, interval in stats["intervals"].items():
+                sampling["intervals"][stat_names[stat]] = [
+                    interval[0],
+                    None if math.isinf(interval[1]) else interval[1],
+                ]
+        results.append(validate_inputs(stats, checks, stat_names))
+    return results, sampling
+
+
+def filter_invalid_sample(
+    vid_path, csv_path, meta_path, sampled_validation=False
+) -> list[str]:
     """
     Detect invalid videos.
 
+    The video and input log must also cover the same span (see
+    sync_check.py); the measured offset (or why it couldn't be measured) is
+    stored under "av_sync".
+
+    With sampled_validation, long input logs are validated from sampled
+    windows (see validate_inputs_sampled); the stats stored for them are then
+    estimates, with their intervals under "input_stats_sampling".
+
     Return value is a list of reasons for invalidity. If empty, the sample is valid.
     """
     invalid_reasons = []
 
+    # The MP4 header is parsed once and shared by the checks below
+    track = video = None
+    try:
+        track = load_video_track(vid_path)
+        video = probe_video(vid_path, track=track)
+    except MP4Error:
+        pass  # Reported by validate_video_metadata
+
     # First validate basic video metadata
-    metadata_reasons = validate_video_metadata(vid_path, meta_path)
+    with profiling.phase("validate_video"):
+        metadata_reasons = validate_video_metadata(vid_path, video=video)
     invalid_reasons.extend(metadata_reasons)
 
-    # Validate keyboard inputs
-    keyboard_reasons, keyboard_stats = validate_keyboard_inputs(csv_path)
-
-    # Validate mouse inputs
-    mouse_reasons, mouse_stats = validate_mouse_inputs(csv_path)
-
-    # Validate gamepad inputs
-    gamepad_reasons, gamepad_stats = validate_gamepad_inputs(csv_path)
+    # Video and inputs must cover the same span (headers and boundary rows only)
+    try:
+        with profiling.phase("validate_sync"):
+            sync_reasons, sync = check_sync(vid_path, csv_path, video=video)
+        invalid_reasons.extend(sync_reasons)
+    except (MP4Error, ValueError, OSError) as e:
+        # An unreadable header or log is reported by the other checks
+        sync = {"error": str(e)}
+
+    # Long logs can be validated from samples, reading them in full only if needed
+    sampled = None
+    if sampled_validation:
+        with profiling.phase("validate_sampled", trace_memory=True):
+            sampled = validate_inputs_sampled(csv_path)
+
+    if sampled is not None:
+        results, sampling = sampled
+        (
+            (keyboard_reasons, keyboard_stats),
+            (mouse_reasons, mouse_stats),
+            (gamepad_reasons, gamepad_stats),
+        ) = results
+    else:
+        sampling = None
+
+        # Validate keyboard inputs
+        with profiling.phase("validate_keyboard", trace_memory=True):
+            keyboard_reasons, keyboard_stats = validate_keyboard_inputs(csv_path)
+
+        # Validate mouse inputs
+        with profiling.phase("validate_mouse", trace_memory=True):
+            mouse_reasons, mouse_stats = validate_mouse_inputs(csv_path)
+
+        # Validate gamepad inputs
+        with profiling.phase("validate_gamepad", trace_memory=True):
+            gamepad_reasons, gamepad_stats = validate_gamepad_inputs(csv_path)
 
     # Only invalidate if all three input types are invalid
     if (
@@ -218,134 +341,483 @@ def filter_invalid_sample(vid_path, csv_path, meta_path) -> list[str]:
         }
     }
 
-    if "input_stats" not in metadata:
-        metadata.update(extra_metadata)
+    if sampling is not None:
+        extra_metadata["input_stats_sampling"] = sampling
+    extra_metadata["av_sync"] = sync
+
+    # Keyframe -> byte offset/timestamp map so clip loaders can seek without decoding
+    if track is not None:
+        try:
+            with profiling.phase("keyframe_index"):
+                extra_metadata["keyframe_index"] = keyframe_index(vid_path, track=track)
+        except MP4Error:
+            pass  # e.g. fragmented recordings, which have no sample tables in moov
+
+    missing_metadata = {k: v for k, v in extra_metadata.items() if k not in metadata}
+    if missing_metadata:
+        metadata.update(missing_metadata)
         with open(meta_path, "w") as f:
             json.dump(metadata, f, indent=4)
 
     return invalid_reasons
 
 
+def session_size(session):
+    # The recorded files' sizes were cached when the session was discovered
+    sizes = [size for size, _ in session["stat"].values()]
+    return sum(sizes) + os.path.getsize(session["meta_path"])
+
+
 class OWLDataManager:
-    def __init__(self, token, progress_mode=False):
+    def __init__(
+        self,
+        token,
+        progress_mode=False,
+        event_log="off",
+        bundle=False,
+        sampled_validation=False,
+        roots=None,
+        governor=None,
+        leases=None,
+        run_id=None,
+    ):
+        if event_log not in EVENT_LOG_MODES:
+            raise ValueError(f"event_log must be one of {EVENT_LOG_MODES}")
+        self.event_log = event_log
+        self.bundle = bundle
+        self.sampled_validation = sampled_validation
+        self.roots = list(roots) if roots else [ROOT_DIR]
+        self.governor = governor  # ResourceGovernor gating each step, if any
+        self.leases = leases  # LeaseManager shared with concurrent runs, if any
+        self.sessions_skipped = 0  # Sessions another run had leased
         self.staged_files = []
         self.staging_dir = "staging"
+        self.converted = []  # Event logs converted into staging for the next tar
         self.current_tar_uuid = None
         self.token = token
         self.progress_mode = progress_mode
+        self.progress_file = progress_path(run_id)
         self.total_duration = 0.0  # Track total duration of uploaded videos
         self.total_bytes = 0  # Track total bytes of files
         self.staged_bytes = 0  # Track bytes staged so far
         os.makedirs(self.staging_dir, exist_ok=True)
 
+    def find_pending_sessions(self):
+        """
+        Scan the recording roots (each on its own thread) and return every
+        session that has not been uploaded or marked invalid yet, oldest
+        recording first, as a list of dicts with the session's file paths.
+        Sessions may have their inputs as a .csv or as a binary event log.
+        """
+        with profiling.phase("find_sessions"):
+            return discover_sessions(self.roots)
+
+    def claim(self, session):
+        """
+        Lease a session for this run; False if another run is working on it
+        or has finished it since the scan
+        """
+        if self.leases is None:
+            return True
+        root = session["root"]
+        if not self.leases.acquire(root):
+            self.sessions_skipped += 1
+            return False
+        if os.path.exists(os.path.join(root, ".uploaded")) or os.path.exists(
+            os.path.join(root, ".invalid")
+        ):
+            self.leases.release(root)
+            return False
+        return True
+
+    def release(self, session):
+        if self.leases is not None:
+            self.leases.release(session["root"])
+
+    def check_leases(self, sessions):
+        """Raise LeaseLost if another run took over any of the sessions"""
+        if self.leases is not None:
+            for session in sessions:
+                self.leases.check(session["root"])
+
+    def checkpoint(self, step, cancel_event=None):
+        """Let the governor pause or throttle before a step; returns the rate limit"""
+        if self.governor is None:
+            return None
+        return self.governor.checkpoint(step, cancel_event)
+
+    def validate_session(self, session, verbose=False, cancel_event=None) -> list[str]:
+        """
+        Check a session's validity, writing an `.invalid` marker with the
+        reasons if it fails.
+
+        Return value is a list of reasons for invalidity. If empty, the session
+        is valid.
+        """
+        mp4_path = session["mp4_path"]
+        self.checkpoint("validate", cancel_event)
+
+        invalid_reasons = []
+        try:
+            invalid_reasons = filter_invalid_sample(
+                mp4_path,
+                session["csv_path"],
+                session["meta_path"],
+                sampled_validation=self.sampled_validation,
+            )
+        except Exception as e:
+            invalid_reasons.append(f"Error checking validity: {e}")
+
+        if len(invalid_reasons) > 0:
+            invalid_path = os.path.join(session["root"], ".invalid")
+
+            if not verbose:
+                print(
+                    f"Failed to process {os.path.abspath(mp4_path)}; "
+                    f"see {os.path.abspath(invalid_path)} for details"
+                )
+            else:
+                print(f"Failed to process {os.path.abspath(mp4_path)}:")
+                for reason in invalid_reasons:
+                    print(f"  - {reason}")
+
+            with open(invalid_path, "w") as f:
+                for reason in invalid_reasons:
+                    f.write(reason + "\n")
+
+        return invalid_reasons
+
+    def prepare_session(self, session):
+        """
+        Gather what uploading a validated session needs: its archive members as
+        (path, arcname) pairs and the video fields sent with the upload request.
+        Also adds the session to the duration and byte totals.
+
+        An event log converted from the CSV is written to the staging directory,
+        not the recording's, and removed by remove_converted() once tarred.
+        """
+        mp4_file = session["mp4_file"]
+        csv_file = session["csv_file"]
+        mp4_path = session["mp4_path"]
+        csv_path = session["csv_path"]
+        meta_path = session["meta_path"]
+
+        # Read duration from metadata and track bytes
+        metadata_dict = {}
+        try:
+            with open(meta_path) as f:
+                metadata_dict = json.load(f)
+            duration = float(metadata_dict.get("duration", 0))
+            self.total_duration += duration
+        except Exception as e:
+            print(f"Warning: Could not read duration from {meta_path}: {e}")
+
+        # Real video properties from the MP4 header, or the recording defaults
+        video = None
+        try:
+            video = probe_video(mp4_path)
+        except MP4Error as e:
+            print(f"Warning: Could not read video header of {mp4_path}: {e}")
+
+        # Optionally ship the compact binary event log with or instead of the CSV
+        control_files = [(csv_path, csv_file)]
+        if self.event_log != "off" and not is_event_log(csv_file):
+            import uuid
+
+            log_file = os.path.splitext(csv_file)[0] + EVENT_LOG_SUFFIX
+            log_path = os.path.join(
+                self.staging_dir, f"{uuid.uuid4().hex[:16]}{EVENT_LOG_SUFFIX}"
+            )
+            self.converted.append(log_path)
+            with profiling.phase("convert_event_log", trace_memory=True):
+                convert_csv(csv_path, log_path)
+            if self.event_log == "instead":
+                control_files = [(log_path, log_file)]
+            else:
+                control_files.append((log_path, log_file))
+
+        # Track file sizes for statistics
+        mp4_size = os.path.getsize(mp4_path)
+        control_size = sum(os.path.getsize(path) for path, _ in control_files)
+        meta_size = os.path.getsize(meta_path)
+        self.total_bytes += mp4_size + control_size + meta_size
+
+        members = [(mp4_path, mp4_file), *control_files, (meta_path, "metadata.json")]
+        fields = {
+            "video_filename": mp4_file,
+            "control_filename": control_files[0][1],
+            "video_duration_seconds": video["duration_ms"] / 1000
+            if video
+            else metadata_dict.get("duration")
+            if metadata_dict
+            else None,
+            "video_width": video["width"] if video else RECORDING_WIDTH,
+            "video_height": video["height"] if video else RECORDING_HEIGHT,
+            "video_fps": video["fps"] if video else FPS,
+            "video_codec": video["codec"] if video else None,
+        }
+        return members, fields
+
+    def remove_converted(self):
+        for path in self.converted:
+            if os.path.exists(path):
+                os.remove(path)
+        self.converted = []
+
+    def mark_uploaded(self, session):
+        with open(os.path.join(session["root"], ".uploaded"), "w") as f:
+            f.write("")
+        self.staged_files.append(session["root"])
+        self.release(session)
+
+    def upload_session(
+        self, session, http_session=None, progress_callback=None, cancel_event=None
+    ):
+        """Tar a single validated session, upload it and mark it as uploaded."""
+        self.checkpoint("tar", cancel_event)
+        self.check_leases([session])
+        # Create tar for this single session
+        import uuid
+
+        tar_name = f"{uuid.uuid4().hex[:16]}.tar"
+
+        try:
+            members, fields = self.prepare_session(session)
+            with profiling.phase("tar"), tarfile.open(tar_name, "w") as tar:
+                for path, arcname in members:
+                    tar.add(path, arcname=arcname)
+        finally:
+            self.remove_converted()
+
+        # Upload immediately with metadata
+        try:
+            limit_rate = self.checkpoint("upload", cancel_event)
+            self.check_leases([session])
+            with profiling.phase("upload"):
+                upload_archive(
+                    self.token,
+                    tar_name,
+                    progress_mode=self.progress_mode,
+                    **fields,
+                    session=http_session,
+                    progress_callback=progress_callback,
+                    cancel_event=cancel_event,
+                    limit_rate=limit_rate,
+                    progress_file=self.progress_file,
+                )
+            self.mark_uploaded(session)
+        finally:
+            if os.path.exists(tar_name):
+                os.remove(tar_name)
+
+    def upload_bundle(
+        self, sessions, http_session=None, progress_callback=None, cancel_event=None
+    ):
+        """
+        Tar several validated sessions into one archive, upload it and mark
+        them all as uploaded once it succeeds.
+
+        Each session's files go under "session_NNN/" and manifest.json, the
+        first member, maps every session to its members and video fields so
+        the server can split the bundle.
+        """
+        self.checkpoint("tar", cancel_event)
+        self.check_leases(sessions)
+        try:
+            manifest = {"version": BUNDLE_MANIFEST_VERSION, "sessions": []}
+            members = []
+            for i, session in enumerate(sessions):
+                session_members, fields = self.prepare_session(session)
+                prefix = f"session_{i:03d}"
+                session_members = [
+                    (path, f"{prefix}/{arcname}") for path, arcname in session_members
+                ]
+                members.extend(session_members)
+                manifest["sessions"].append(
+                    {
+                        "prefix": prefix,
+                        "members": [arcname for _, arcname in session_members],
+                        **fields,
+                        "video_filename": f"{prefix}/{fields['video_filename']}",
+                        "control_filename": f"{prefix}/{fields['control_filename']}",
+                    }
+                )
+
+            import io
+            import uuid
+
+            tar_name = f"{uuid.uuid4().hex[:16]}.tar"
+            manifest_bytes = json.dumps(manifest, indent=4).encode()
+
+            with profiling.phase("tar"), tarfile.open(tar_name, "w") as tar:
+                info = tarfile.TarInfo(BUNDLE_MANIFEST_NAME)
+                info.size = len(manifest_bytes)
+                info.mtime = int(time.time())
+                tar.addfile(info, io.BytesIO(manifest_bytes))
+                for path, arcname in members:
+                    tar.add(path, arcname=arcname)
+        finally:
+            self.remove_converted()
+
+        durations = [
+            entry["video_duration_seconds"]
+            for entry in manifest["sessions"]
+            if entry["video_duration_seconds"] is not None
+        ]
+        try:
+            limit_rate = self.checkpoint("upload", cancel_event)
+            self.check_leases(sessions)
+            with profiling.phase("upload"):
+                upload_archive(
+                    self.token,
+                    tar_name,
+                    tags=["bundle"],
+                    progress_mode=self.progress_mode,
+                    control_filename=BUNDLE_MANIFEST_NAME,
+                    video_duration_seconds=sum(durations) if durations else None,
+                    bundle_sessions=len(sessions),
+                    session=http_session,
+                    progress_callback=progress_callback,
+                    cancel_event=cancel_event,
+                    limit_rate=limit_rate,
+                    progress_file=self.progress_file,
+                )
+            # Only a successful upload marks the bundled sessions as uploaded
+            for session in sessions:
+                self.mark_uploaded(session)
+        finally:
+            if os.path.exists(tar_name):
+                os.remove(tar_name)
+
+    def plan_uploads(self, sessions):
+        """
+        Group validated sessions into uploads: large sessions on their own,
+        small ones bundled together when bundling is enabled.
+
+        Returns a list of session lists, in the original order of their first session.
+        """
+        if not self.bundle:
+            return [[session] for session in sessions]
+
+        uploads = []
+        bundle, bundle_bytes = None, 0
+        for session in sessions:
+            size = session_size(session)
+            if size > BUNDLE_SESSION_MAX_BYTES:
+                uploads.append([session])
+                continue
+            if (
+                bundle is None
+                or len(bundle) >= BUNDLE_MAX_SESSIONS
+                or bundle_bytes + size > BUNDLE_MAX_BYTES
+            ):
+                bundle, bundle_bytes = [], 0
+                uploads.append(bundle)
+            bundle.append(session)
+            bundle_bytes += size
+        return uploads
+
+    def upload(
+        self, sessions, http_session=None, progress_callback=None, cancel_event=None
+    ):
+        """
+        Upload one planned group of sessions, bundled if there are several.
+
+        Returns False, leaving the group to the other run, if another run took
+        over one of their leases first.
+        """
+        try:
+            if len(sessions) == 1:
+                self.upload_session(
+                    sessions[0], http_session, progress_callback, cancel_event
+                )
+            else:
+                self.upload_bundle(
+                    sessions, http_session, progress_callback, cancel_event
+                )
+        except LeaseLost as e:
+            print(f"Skipping upload: {e}")
+            for session in sessions:
+                self.release(session)
+            return False
+        return True
+
     def process_individual_sessions(self, verbose=False):
-        """Process each session as an individual tar file and upload immediately."""
+        """
+        Validate every pending session and upload the valid ones, each as its
+        own tar file uploaded immediately, or small ones bundled together.
+        Sessions leased by a concurrent run are left to it.
+        """
         sessions_processed = 0
 
-        for root, dirs, files in os.walk(ROOT_DIR):
-            if ".uploaded" in files or ".invalid" in files:
+        valid_sessions = []
+        for session in self.find_pending_sessions():
+            if not self.claim(session):
                 continue
-
-            has_mp4 = any([fname.endswith(".mp4") for fname in files])
-            has_csv = any([fname.endswith(".csv") for fname in files])
-            has_metadata = any([fname == "metadata.json" for fname in files])
-
-            if has_mp4 and has_csv and has_metadata:
-                mp4_file = next(f for f in files if f.endswith(".mp4"))
-                csv_file = next(f for f in files if f.endswith(".csv"))
-
-                mp4_path = os.path.join(root, mp4_file)
-                csv_path = os.path.join(root, csv_file)
-                meta_path = os.path.join(root, "metadata.json")
-
-                # Check validity
-                invalid_reasons = []
-                try:
-                    invalid_reasons = filter_invalid_sample(
-                        mp4_path, csv_path, meta_path
-                    )
-                except Exception as e:
-                    invalid_reasons.append(f"Error checking validity: {e}")
-
-                if len(invalid_reasons) > 0:
-                    invalid_path = os.path.join(root, ".invalid")
-
-                    if not verbose:
-                        print(
-                            f"Failed to process {os.path.abspath(mp4_path)}; see {os.path.abspath(invalid_path)} for details"
-                        )
-                    else:
-                        print(f"Failed to process {os.path.abspath(mp4_path)}:")
-                        for reason in invalid_reasons:
-                            print(f"  - {reason}")
-
-                    with open(invalid_path, "w") as f:
-                        for reason in invalid_reasons:
-                            f.write(reason + "\n")
-
-                    continue
-
-                # Read duration from metadata and track bytes
-                metadata_dict = {}
-                try:
-                    with open(meta_path) as f:
-                        metadata_dict = json.load(f)
-                    duration = float(metadata_dict.get("duration", 0))
-                    self.total_duration += duration
-                except Exception as e:
-                    print(f"Warning: Could not read duration from {meta_path}: {e}")
-
-                # Track file sizes for statistics
-                mp4_size = os.path.getsize(mp4_path)
-                csv_size = os.path.getsize(csv_path)
-                meta_size = os.path.getsize(meta_path)
-                self.total_bytes += mp4_size + csv_size + meta_size
-
-                # Create tar for this single session
-                import uuid
-
-                tar_name = f"{uuid.uuid4().hex[:16]}.tar"
-
-                with tarfile.open(tar_name, "w") as tar:
-                    tar.add(mp4_path, arcname=mp4_file)
-                    tar.add(csv_path, arcname=csv_file)
-                    tar.add(meta_path, arcname="metadata.json")
-
-                # Upload immediately with metadata
-                try:
-                    upload_archive(
-                        self.token,
-                        tar_name,
-                        progress_mode=self.progress_mode,
-                        video_filename=mp4_file,
-                        control_filename=csv_file,
-                        video_duration_seconds=metadata_dict.get("duration")
-                        if metadata_dict
-                        else None,
-                        video_width=RECORDING_WIDTH,
-                        video_height=RECORDING_HEIGHT,
-                        video_fps=FPS,
-                        # video_codec not set here since it depends on user's OBS settings
-                    )
-                    with open(os.path.join(root, ".uploaded"), "w") as f:
-                        f.write("")
-                    self.staged_files.append(root)
+            if len(self.validate_session(session, verbose=verbose)) > 0:
+                self.release(session)
+                continue
+            if not self.bundle:
+                if self.upload([session]):
                     sessions_processed += 1
-                finally:
-                    if os.path.exists(tar_name):
-                        os.remove(tar_name)
+            else:
+                valid_sessions.append(session)
+
+        # Bundles are planned once every session is validated
+        for sessions in self.plan_uploads(valid_sessions):
+            if self.upload(sessions):
+                sessions_processed += len(sessions)
 
         return sessions_processed > 0
 
     def clear_upload_status(self):
-        for root, dirs, files in os.walk(ROOT_DIR):
-            if ".uploaded" in files:
-                os.remove(os.path.join(root, ".uploaded"))
-
+        for root_dir in self.roots:
+            for root, dirs, files in os.walk(root_dir):
+                # Evicted sessions have nothing left to upload
+                if ".uploaded" in files and EVICTED_MARKER not in files:
+                    os.remove(os.path.join(root, ".uploaded"))
+
+
+def upload_all_files(
+    token,
+    progress_mode=False,
+    event_log="off",
+    disk_budget=None,
+    bundle=False,
+    sampled_validation=False,
+    roots=None,
+    governor=None,
+    run_id=None,
+):
+    """
+    Upload every pending session under the recording roots (ROOT_DIR by
+    default), bundling small ones if asked, then (if a disk budget is given,
+    see disk_budget.py) evict uploaded sessions until each root meets it.
+    A ResourceGovernor (see governor.py) can pause or throttle each step.
+
+    Each session is leased while this run works on it (see session_lock.py),
+    so concurrent runs split the pending sessions instead of uploading them
+    twice. Progress mode writes to this run's own progress file,
+    progress_path(run_id).
+    """
+    with LeaseManager(run_id) as leases:
+        manager = OWLDataManager(
+            token,
+            progress_mode=progress_mode,
+            event_log=event_log,
+            bundle=bundle,
+            sampled_validation=sampled_validation,
+            roots=roots,
+            governor=governor,
+            leases=leases,
+            run_id=run_id,
+        )
+        has_files = manager.process_individual_sessions()
 
-def upload_all_files(token, progress_mode=False):
-    manager = OWLDataManager(token, progress_mode=progress_mode)
-    has_files = manager.process_individual_sessions()
+    budget_report = None
+    if disk_budget is not None:
+        budget_report = enforce_disk_budgets(disk_budget, manager.roots)
+        print_report(budget_report)
 
     # Output final stats for the main process to capture
     if progress_mode:
@@ -354,12 +826,17 @@ def upload_all_files(token, progress_mode=False):
             "total_files_uploaded": len(manager.staged_files),
             "total_duration_uploaded": manager.total_duration,
             "total_bytes_uploaded": manager.total_bytes,
+            "sessions_skipped": manager.sessions_skipped,
         }
+        if budget_report is not None:
+            final_stats["sessions_evicted"] = len(budget_report["evicted"])
+            final_stats["bytes_reclaimed"] = budget_report["bytes_reclaimed"]
         print(f"FINAL_STATS: {json.dumps(final_stats)}")
 
     return {
         "files_uploaded": len(manager.staged_files) if has_files else 0,
         "total_duration": manager.total_duration,
+        "disk_budget": budget_report,
     }
 
 
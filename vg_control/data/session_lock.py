@@ -0,0 +1,250 @@
+"""
+Per-session leases shared between concurrent upload runs
+
+The Electron app can start an upload while an earlier upload_bridge process
+(or a worker) is still going. Both find the same pending sessions, so before
+validating or uploading a session a run claims it with a lease: a .lease file
+in the session directory, created atomically (O_CREAT | O_EXCL), naming the
+run that holds it. A run that finds someone else's lease skips the session, so
+concurrent runs split the pending work between them.
+
+The lease's mtime is its heartbeat: a background thread touches every held
+lease every heartbeat_seconds. A lease whose heartbeat is older than
+lease_seconds, or whose process is gone (same host), is stale, and the next
+run to claim the session takes it over. Takeover renames the stale file aside
+first so only one of several runs can win it.
+
+A run that stalls long enough to lose a lease notices on its next heartbeat or
+check() and stops working on that session (LeaseLost).
+"""
+
+import json
+import os
+import socket
+import threading
+import time
+import uuid
+
+import psutil
+
+LEASE_NAME = ".lease"
+LEASE_SECONDS = 120.0
+HEARTBEAT_SECONDS = 20.0
+
+
+class LeaseLost(Exception):
+    """Raised when another run has taken over a session this run had leased"""
+
+
+def new_run_id():
+    return uuid.uuid4().hex[:12]
+
+
+def lease_path(root):
+    return os.path.join(root, LEASE_NAME)
+
+
+def read_lease(root):
+    """The lease dict in a session directory (with its heartbeat age), or None"""
+    path = lease_path(root)
+    try:
+        with open(path) as f:
+            lease = json.load(f)
+        lease["heartbeat_age"] = time.time() - os.path.getmtime(path)
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError):
+        # Half-written or unreadable: only its age can tell whether it's live
+        try:
+            lease = {"heartbeat_age": time.time() - os.path.getmtime(path)}
+        except OSError:
+            return None
+    return lease if isinstance(lease, dict) else None
+
+
+class LeaseManager:
+    """
+    Claims, heartbeats and releases this run's session leases
+
+    Args:
+        run_id: This run's identifier (a new random one by default)
+        lease_seconds: Heartbeat age after which a lease is stale
+        heartbeat_seconds: How often held leases are refreshed
+    """
+
+    def __init__(
+        self,
+        run_id=None,
+        lease_seconds=LEASE_SECONDS,
+        heartbeat_seconds=HEARTBEAT_SECONDS,
+    ):
+        self.run_id = run_id or new_run_id()
+        self.lease_seconds = lease_seconds
+        self.heartbeat_seconds = heartbeat_seconds
+        self.host = socket.gethostname()
+        self.held = set()
+        self.lost = set()
+        self.lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    # Lifecycle
+
+    def start(self):
+        self._stop.clear()
+        self._thread = threading.Thread(
+            target=self._run, name="owl-leases", daemon=True
+        )
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+        self.release_all()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    # Claiming
+
+    def owns(self, lease):
+        return (
+            lease is not None
+            and lease.get("run_id") == self.run_id
+            and lease.get("host") == self.host
+        )
+
+    def is_stale(self, lease):
+        if lease["heartbeat_age"] > self.lease_seconds:
+            return True
+        # A lease left behind by a process that has exited on this machine
+        if lease.get("host") == self.host and isinstance(lease.get("pid"), int):
+            return not psutil.pid_exists(lease["pid"])
+        return False
+
+    def acquire(self, root):
+        """Claim a session; False if another run holds a live lease on it"""
+        if self._create(root):
+            return True
+        lease = read_lease(root)
+        if lease is None:
+            return self._create(root)  # Released in the meantime
+        if self.owns(lease):
+            with self.lock:
+                self.held.add(root)
+                self.lost.discard(root)
+            return True
+        if not self.is_stale(lease):
+            return False
+        return self._take_over(root)
+
+    def _create(self, root):
+        path = lease_path(root)
+        try:
+            fd = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            return False
+        lease = {
+            "run_id": self.run_id,
+            "pid": os.getpid(),
+            "host": self.host,
+            "acquired_at": time.time(),
+        }
+        with os.fdopen(fd, "w") as f:
+            json.dump(lease, f)
+        with self.lock:
+            self.held.add(root)
+            self.lost.discard(root)
+        return True
+
+    def _take_over(self, root):
+        path = lease_path(root)
+        aside = f"{path}.stale-{self.run_id}"
+        try:
+            os.replace(path, aside)
+        except FileNotFoundError:
+            return self._create(root)  # Another run removed it first
+        except OSError:
+            return False
+
+        # Another run may have taken over (and written a fresh lease) between
+        # our staleness check and the rename; put a live lease back
+        try:
+            age = time.time() - os.path.getmtime(aside)
+            if age <= self.lease_seconds and not self._is_dead(aside):
+                try:
+                    os.link(aside, path)
+                except OSError:
+                    pass
+                return False
+        finally:
+            try:
+                os.remove(aside)
+            except OSError:
+                pass
+        return self._create(root)
+
+    def _is_dead(self, path):
+        try:
+            with open(path) as f:
+                lease = json.load(f)
+        except (OSError, ValueError):
+            return False
+        if not isinstance(lease, dict) or lease.get("host") != self.host:
+            return False
+        pid = lease.get("pid")
+        return isinstance(pid, int) and not psutil.pid_exists(pid)
+
+    # Holding
+
+    def _run(self):
+        while not self._stop.wait(self.heartbeat_seconds):
+            self.heartbeat()
+
+    def heartbeat(self):
+        """Refresh every held lease; leases taken over by another run are lost"""
+        with self.lock:
+            held = list(self.held)
+        for root in held:
+            if not self.owns(read_lease(root)):
+                self._lose(root)
+                continue
+            try:
+                os.utime(lease_path(root))
+            except OSError:
+                self._lose(root)
+
+    def _lose(self, root):
+        with self.lock:
+            self.held.discard(root)
+            self.lost.add(root)
+
+    def check(self, root):
+        """Raise LeaseLost unless this run still holds the session's lease"""
+        with self.lock:
+            lost = root in self.lost or root not in self.held
+        if lost or not self.owns(read_lease(root)):
+            self._lose(root)
+            raise LeaseLost(f"Lease on {root} was taken over by another run")
+
+    def release(self, root):
+        with self.lock:
+            held = root in self.held
+            self.held.discard(root)
+            self.lost.discard(root)
+        if held and self.owns(read_lease(root)):
+            try:
+                os.remove(lease_path(root))
+            except OSError:
+                pass
+
+    def release_all(self):
+        with self.lock:
+            held = list(self.held)
+        for root in held:
+            self.release(root)
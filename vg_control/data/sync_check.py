@@ -0,0 +1,216 @@
+"""
+Video/input synchronization check
+
+Compares the recording's video with its input log without decoding either:
+the video's duration and frame count come from the MP4 sample tables (see
+mp4.py), the log's START-END span from its boundary rows only (the head of
+inputs.csv for START, its tail for END, or the time index sidecar when END
+isn't in the tail; event logs from their memory-mapped timestamps).
+
+A recording where the video stopped early (or started late) has a video
+shorter than the span of its inputs, so the inputs can't be lined up with
+the frames. The session is flagged when the two durations differ by more than
+the tolerance, or when the video holds far fewer or more frames than the span
+needs at the video's frame rate. A CSV whose END can't be found gets its
+measurements (marked end_estimated) but no verdict. The measurements are
+stored in metadata.json under "av_sync".
+"""
+
+import os
+
+from ..constants import FPS
+from .input_utils.event_log import EventLog, is_event_log
+from .input_utils.time_index import load_time_index, session_bounds
+from .mp4 import probe_video
+
+HEAD_BYTES = 128 * 1024
+TAIL_BYTES = 64 * 1024
+# Durations may differ by this much, or this share of the span if larger
+TOLERANCE_SECONDS = 2.0
+TOLERANCE_RATIO = 0.02
+# Share of the expected frames the video may be missing (or have extra)
+FRAME_TOLERANCE_RATIO = 0.1
+BOUNDARY_EVENTS = ("START", "END")
+
+
+def _parse_rows(lines):
+    """(timestamp, event_type) of every well-formed line"""
+    rows = []
+    for line in lines:
+        fields = line.split(",", 2)
+        if len(fields) < 2:
+            continue
+        try:
+            rows.append((float(fields[0]), fields[1]))
+        except ValueError:
+            continue
+    return rows
+
+
+def csv_bounds(csv_path, head_bytes=HEAD_BYTES, tail_bytes=TAIL_BYTES):
+    """
+    START-END bounds of an inputs.csv from its first and last rows only
+
+    START is the last one in the first 1000 rows and END the first one after
+    it (or, without END, the latest event), as in the input stats functions.
+    END is looked up in the time index sidecar if it isn't in the tail; when
+    neither has it, end is the latest event in the tail and end_estimated is
+    set. Returns a dict with start, end, the first and last input events
+    inside them and the estimated number of rows.
+    """
+    size = os.path.getsize(csv_path)
+    with open(csv_path, "rb") as f:
+        head = f.read(head_bytes)
+        f.seek(max(0, size - tail_bytes))
+        tail_start = f.tell()
+        tail = f.read()
+
+    head_lines = head.decode("utf-8", errors="replace").split("\n")
+    header_bytes = len(head_lines[0]) + 1
+    if len(head) == head_bytes:
+        head_lines = head_lines[:-1]  # Cut off mid-row
+    head_rows = _parse_rows(head_lines[1:1001])
+    starts = [t for t, event_type in head_rows if event_type == "START"]
+    if not starts:
+        raise ValueError(f"{csv_path} has no START event in its first rows")
+    start = starts[-1]
+
+    tail_lines = tail.decode("utf-8", errors="replace").split("\n")
+    if tail_start > 0:
+        tail_lines = tail_lines[1:]  # Starts mid-row
+    tail_rows = [row for row in _parse_rows(tail_lines) if row[0] >= start]
+    ends = [t for t, event_type in tail_rows if event_type == "END"]
+    if not ends:
+        # Events logged after END can push it out of the tail
+        _, indexed_end = indexed_bounds(csv_path)
+        if indexed_end is not None and indexed_end >= start:
+            ends = [indexed_end]
+    end_estimated = not ends
+    if ends:
+        end = ends[0]
+    else:
+        end = max([t for t, _ in tail_rows] + [t for t, _ in head_rows])
+
+    inputs = [
+        t
+        for t, event_type in head_rows + tail_rows
+        if event_type not in BOUNDARY_EVENTS and start <= t <= end
+    ]
+
+    # Rows in the file, from the average row length at both ends
+    sampled = [line for line in head_lines[1:] + tail_lines if line.strip()]
+    mean_row = sum(len(line) + 1 for line in sampled) / max(len(sampled), 1)
+    return {
+        "start": start,
+        "end": end,
+        "first_input": min(inputs) if inputs else None,
+        "last_input": max(inputs) if inputs else None,
+        "end_estimated": end_estimated,
+        "events": round((size - header_bytes) / mean_row) if sampled else 0,
+        "events_estimated": True,
+    }
+
+
+def indexed_bounds(csv_path):
+    """START and END from the CSV's time index, if one has been built"""
+    index = load_time_index(csv_path, build=False)
+    return session_bounds(csv_path, index) if index else (None, None)
+
+
+def event_log_bounds(path):
+    """START-END bounds of an event log, by the same rules as csv_bounds"""
+    log = EventLog(path)
+    timestamps = log.timestamps
+    names = log.type_names[log.column("event_type")]
+    starts = timestamps[:1000][names[:1000] == "START"]
+    if starts.size == 0:
+        raise ValueError(f"{path} has no START event in its first rows")
+    start = float(starts[-1])
+    after = timestamps >= start
+    ends = timestamps[after & (names == "END")]
+    end = float(ends[0]) if ends.size else float(timestamps[after].max())
+
+    is_input = (timestamps >= start) & (timestamps <= end)
+    for name in BOUNDARY_EVENTS:
+        is_input &= names != name
+    inputs = timestamps[is_input]
+    return {
+        "start": start,
+        "end": end,
+        "first_input": float(inputs.min()) if inputs.size else None,
+        "last_input": float(inputs.max()) if inputs.size else None,
+        "end_estimated": False,
+        "events": len(log),
+        "events_estimated": False,
+    }
+
+
+def input_bounds(path):
+    return event_log_bounds(path) if is_event_log(path) else csv_bounds(path)
+
+
+def check_sync(vid_path, csv_path, video=None):
+    """
+    Compare the video's header duration and frame count with the input span
+
+    Args:
+        vid_path: The recording's .mp4
+        csv_path: Its inputs.csv or event log
+        video: probe_video(vid_path), if already read
+
+    Returns:
+        (reasons, measurements); reasons is empty when the two are in sync.
+        offset_seconds is the input span minus the video duration (positive
+        when the video is shorter). Expected frames are counted at the
+        video's own frame rate. When the log's END couldn't be found
+        (end_estimated) the span is a guess and no reasons are given.
+    """
+    if video is None:
+        video = probe_video(vid_path)
+    bounds = input_bounds(csv_path)
+
+    video_duration = video["duration_ms"] / 1000
+    input_span = bounds["end"] - bounds["start"]
+    offset = input_span - video_duration
+    fps = video["fps"] or FPS
+    expected_frames = round(input_span * fps)
+    tolerance = max(TOLERANCE_SECONDS, TOLERANCE_RATIO * input_span)
+
+    def gap(a, b):
+        return round(b - a, 3) if a is not None and b is not None else None
+
+    measurements = {
+        "video_duration": round(video_duration, 3),
+        "video_frames": video["sample_count"],
+        "input_span": round(input_span, 3),
+        "expected_frames": expected_frames,
+        "offset_seconds": round(offset, 3),
+        "frame_offset": expected_frames - video["sample_count"],
+        "tolerance_seconds": round(tolerance, 3),
+        "events_per_second": round(bounds["events"] / input_span, 2)
+        if input_span > 0
+        else None,
+        "events_estimated": bounds["events_estimated"],
+        "end_estimated": bounds["end_estimated"],
+        # Time from START to the first input and from the last input to END
+        "lead_in_seconds": gap(bounds["start"], bounds["first_input"]),
+        "lead_out_seconds": gap(bounds["last_input"], bounds["end"]),
+    }
+
+    reasons = []
+    if bounds["end_estimated"]:
+        return reasons, measurements
+    if abs(offset) > tolerance:
+        shorter = "video" if offset > 0 else "input log"
+        reasons.append(
+            f"Video and inputs out of sync: video {video_duration:.2f}s, inputs "
+            f"{input_span:.2f}s ({shorter} shorter by {abs(offset):.2f}s)"
+        )
+    if expected_frames and (
+        abs(measurements["frame_offset"]) > FRAME_TOLERANCE_RATIO * expected_frames
+    ):
+        reasons.append(
+            f"Video has {video['sample_count']} frames, inputs span {expected_frames} "
+            f"at {fps:g} fps"
+        )
+    return reasons, measurements
@@ -1,15 +1,36 @@
 import os
-from typing import List, Optional
+from typing import Callable, List, Optional
 from datetime import datetime
+from functools import lru_cache
 import requests
 import subprocess
 import shlex
+import threading
 from tqdm import tqdm
 import time
 
 from ..constants import API_BASE_URL
 
 
+class UploadCancelled(Exception):
+    """Raised when an in-flight upload is cancelled through its cancel event."""
+
+
+def progress_path(run_id: Optional[str] = None) -> str:
+    """
+    The progress file progress mode writes for the UI: one per run when a
+    run id is given, so concurrent runs don't overwrite each other's progress.
+    """
+    import tempfile
+
+    name = (
+        f"owl-control-upload-progress-{run_id}.json"
+        if run_id
+        else "owl-control-upload-progress.json"
+    )
+    return os.path.join(tempfile.gettempdir(), name)
+
+
 def get_upload_url(
     api_key: str,
     archive_path: str,
@@ -22,8 +43,17 @@ def get_upload_url(
     video_height: Optional[int] = None,
     video_codec: Optional[str] = None,
     video_fps: Optional[float] = None,
+    bundle_sessions: Optional[int] = None,
+    session: Optional[requests.Session] = None,
 ) -> str:
-    """Request a pre-signed S3 URL for uploading a tar archive."""
+    """
+    Request a pre-signed S3 URL for uploading a tar archive.
+
+    If `session` is given it is reused (keeping its connection pool warm),
+    otherwise a throwaway session is created for this request. Bundles of
+    several sessions (with a manifest.json) pass their session count as
+    `bundle_sessions`.
+    """
 
     file_size = os.path.getsize(archive_path)
     file_size_mb = file_size // (1024 * 1024)
@@ -51,15 +81,20 @@ def get_upload_url(
         payload["video_codec"] = video_codec
     if video_fps is not None:
         payload["video_fps"] = video_fps
+    if bundle_sessions is not None:
+        payload["bundle_sessions"] = bundle_sessions
 
     headers = {"Content-Type": "application/json", "X-API-Key": api_key}
     url = f"{base_url}/tracker/upload/game_control"
 
-    with requests.Session() as session:
+    if session is None:
+        with requests.Session() as throwaway:
+            response = throwaway.post(url, headers=headers, json=payload, timeout=30)
+    else:
         response = session.post(url, headers=headers, json=payload, timeout=30)
-        response.raise_for_status()
-        data = response.json()
-        return data.get("url") or data.get("upload_url") or data["uploadUrl"]
+    response.raise_for_status()
+    data = response.json()
+    return data.get("url") or data.get("upload_url") or data["uploadUrl"]
 
 
 def upload_archive(
@@ -75,8 +110,25 @@ def upload_archive(
     video_height: Optional[int] = None,
     video_codec: Optional[str] = None,
     video_fps: Optional[float] = None,
+    bundle_sessions: Optional[int] = None,
+    session: Optional[requests.Session] = None,
+    progress_callback: Optional[Callable[[dict], None]] = None,
+    cancel_event: Optional[threading.Event] = None,
+    limit_rate: Optional[int] = None,
+    progress_file: Optional[str] = None,
 ) -> None:
-    """Upload an archive to the storage bucket via a pre-signed URL."""
+    """
+    Upload an archive to the storage bucket via a pre-signed URL.
+
+    `progress_callback` receives the same progress dicts that progress mode
+    writes to the progress file (`progress_file`, by default the shared
+    `progress_path()`; concurrent runs pass their own). Setting `cancel_event`
+    terminates curl and raises `UploadCancelled`. `limit_rate` caps the upload
+    in bytes/sec.
+    """
+
+    if progress_file is None:
+        progress_file = progress_path()
 
     upload_url = get_upload_url(
         api_key,
@@ -90,6 +142,8 @@ def upload_archive(
         video_height=video_height,
         video_codec=video_codec,
         video_fps=video_fps,
+        bundle_sessions=bundle_sessions,
+        session=session,
     )
 
     # Get file size for progress bar
@@ -102,9 +156,6 @@ def upload_archive(
         import tempfile
         import json
 
-        progress_file = os.path.join(
-            tempfile.gettempdir(), "owl-control-upload-progress.json"
-        )
         initial_progress = {
             "phase": "upload",
             "action": "start",
@@ -121,12 +172,24 @@ def upload_archive(
         except Exception as e:
             print(f"Warning: Could not initialize progress file: {e}")
 
+    if progress_callback is not None:
+        progress_callback(
+            {
+                "phase": "upload",
+                "action": "start",
+                "bytes_uploaded": 0,
+                "total_bytes": file_size,
+                "percent": 0,
+                "speed_mbps": 0,
+                "eta_seconds": 0,
+                "timestamp": time.time(),
+            }
+        )
+
     def emit_upload_progress(bytes_uploaded, total_bytes, speed_bps=0):
         """Write JSON progress data to file for UI consumption"""
-        if progress_mode:
+        if progress_mode or progress_callback is not None:
             import json
-            import tempfile
-            import os
 
             progress_data = {
                 "phase": "upload",
@@ -143,10 +206,12 @@ def upload_archive(
                 "timestamp": time.time(),
             }
 
+            if progress_callback is not None:
+                progress_callback(progress_data)
+            if not progress_mode:
+                return
+
             # Write to temp file for UI to read
-            progress_file = os.path.join(
-                tempfile.gettempdir(), "owl-control-upload-progress.json"
-            )
             try:
                 with open(progress_file, "w") as f:
                     json.dump(progress_data, f)
@@ -190,6 +255,8 @@ def upload_archive(
         "-#",
         "--no-buffer",
     ]
+    rate_args = ["--limit-rate", str(int(limit_rate))] if limit_rate else []
+    curl_args += rate_args
 
     # Debug: log the upload URL (hide sensitive parts)
     from urllib.parse import urlparse
@@ -219,8 +286,13 @@ def upload_archive(
             universal_newlines=True,
         )
 
+        if cancel_event is not None:
+            _watch_for_cancel(process, cancel_event)
+
         last_update = 0
-        start_time = time.time() if progress_mode else 0
+        start_time = (
+            time.time() if progress_mode or progress_callback is not None else 0
+        )
 
         # Read curl's progress output
         stderr_tail = []  # Keep last ~100 lines for diagnostics
@@ -244,7 +316,7 @@ def upload_archive(
                         pbar.refresh()
 
                         # Calculate speed and emit progress for UI
-                        if progress_mode and start_time > 0:
+                        if start_time > 0:
                             elapsed_time = time.time() - start_time
                             speed_bps = (
                                 current / elapsed_time if elapsed_time > 0 else 0
@@ -262,14 +334,15 @@ def upload_archive(
         # Wait for process to complete
         return_code = process.wait()
 
+        # A cancel that arrives after curl finished the PUT doesn't undo it
+        if return_code != 0 and cancel_event is not None and cancel_event.is_set():
+            raise UploadCancelled(f"Upload of {archive_path} was cancelled")
+
         # Cleanup progress file
         if progress_mode:
             import tempfile
             import os
 
-            progress_file = os.path.join(
-                tempfile.gettempdir(), "owl-control-upload-progress.json"
-            )
             try:
                 if os.path.exists(progress_file):
                     # Write final completion state
@@ -288,6 +361,20 @@ def upload_archive(
             except Exception as e:
                 print(f"Warning: Could not write final progress: {e}")
 
+        if progress_callback is not None and return_code == 0:
+            progress_callback(
+                {
+                    "phase": "upload",
+                    "action": "complete",
+                    "bytes_uploaded": file_size,
+                    "total_bytes": file_size,
+                    "percent": 100,
+                    "speed_mbps": 0,
+                    "eta_seconds": 0,
+                    "timestamp": time.time(),
+                }
+            )
+
         if return_code != 0:
             # Append tail of stderr to debug log to help diagnose e.g. unknown options (exit 2)
             try:
@@ -314,6 +401,7 @@ def upload_archive(
                 "-T",
                 f"{archive_path}",
                 "-#",
+                *rate_args,
             ]
 
             try:
@@ -330,6 +418,8 @@ def upload_archive(
                 bufsize=1,
                 universal_newlines=True,
             )
+            if cancel_event is not None:
+                _watch_for_cancel(process2, cancel_event)
 
             stderr_tail2 = []
             while True:
@@ -341,6 +431,8 @@ def upload_archive(
                     stderr_tail2.pop(0)
 
             return_code2 = process2.wait()
+            if return_code2 != 0 and cancel_event is not None and cancel_event.is_set():
+                raise UploadCancelled(f"Upload of {archive_path} was cancelled")
             if return_code2 != 0:
                 try:
                     with open(debug_log_path, "a") as debug_file:
@@ -353,7 +445,34 @@ def upload_archive(
                     pass
                 raise Exception(f"Upload failed with return code {return_code2}")
 
+            if progress_callback is not None:
+                progress_callback(
+                    {
+                        "phase": "upload",
+                        "action": "complete",
+                        "bytes_uploaded": file_size,
+                        "total_bytes": file_size,
+                        "percent": 100,
+                        "speed_mbps": 0,
+                        "eta_seconds": 0,
+                        "timestamp": time.time(),
+                    }
+                )
+
+
+def _watch_for_cancel(process, cancel_event):
+    """Terminate `process` from a daemon thread once `cancel_event` is set."""
+
+    def watch():
+        while process.poll() is None:
+            if cancel_event.wait(0.5):
+                process.terminate()
+                return
+
+    threading.Thread(target=watch, daemon=True).start()
+
 
+@lru_cache(maxsize=1)
 def get_hwid():
     try:
         with open("/sys/class/dmi/id/product_uuid", "r") as f:
@@ -0,0 +1,369 @@
+"""
+Resource governor for background validation and uploads
+
+Validation (pandas on the CPU), tar creation (disk) and uploads (network) can
+run while the user is playing and owl-recorder is capturing the game. The
+governor keeps that work out of the game's way:
+
+- it lowers this process's CPU and I/O priority (children such as curl
+  inherit it)
+- a sampler thread watches system CPU, disk and network pressure with psutil,
+  discounting this process's own CPU and disk use, and detects a recording in
+  progress (an owl-recorder process holding an .mp4 or inputs.csv open, or
+  writing steadily when its open files can't be read)
+- work calls checkpoint(step) between steps (before validating a session,
+  before building its tar, before uploading it). While recording or busy the
+  policy either pauses there until the system has been idle for a while, or
+  throttles: the step goes ahead after a short sleep and uploads are capped
+  with curl's --limit-rate.
+
+Every decision that changes what the governor does is appended to
+owl-control-debug.log in the temp directory.
+
+The policy is a dict (see DEFAULT_POLICY); load_policy reads overrides from a
+JSON file.
+"""
+
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+import psutil
+
+from .data.uploader import UploadCancelled
+
+ACTIONS = ("pause", "throttle", "ignore")
+
+DEFAULT_POLICY = {
+    # What to do while a recording is in progress / the system is busy
+    "when_recording": "pause",
+    "when_busy": "throttle",
+    # The system is busy when other processes use more than this
+    "max_cpu_percent": 50.0,
+    "max_disk_mbps": 40.0,  # disk reads + writes, MB/s
+    "max_net_mbps": 5.0,  # received, MB/s (this process only sends)
+    # Paused work resumes once the system has been idle this long
+    "idle_seconds": 15.0,
+    # Longest a checkpoint pauses for before going ahead throttled (None: no limit)
+    "max_pause_seconds": None,
+    # Throttled steps sleep this long first, and uploads are capped to this rate
+    "throttle_sleep_seconds": 2.0,
+    "throttle_upload_kbps": 1024,
+    "lower_priority": True,
+    "sample_seconds": 1.0,
+    # Recorder process names and the write rate that counts as recording when
+    # its open files can't be inspected
+    "recorder_names": ["owl-recorder", "owl-recorder.exe"],
+    "recording_write_kbps": 256,
+}
+
+RECORDING_SUFFIXES = (".mp4", ".csv")
+FIRST_SAMPLE_SECONDS = 0.5
+
+
+def debug_log_path():
+    return os.path.join(tempfile.gettempdir(), "owl-control-debug.log")
+
+
+def load_policy(path=None, **overrides):
+    """DEFAULT_POLICY updated from a JSON file (if given) and keyword overrides"""
+    policy = dict(DEFAULT_POLICY)
+    if path is not None:
+        with open(path) as f:
+            loaded = json.load(f)
+        if not isinstance(loaded, dict):
+            raise ValueError(f"Governor policy in {path} must be a JSON object")
+        policy.update(loaded)
+    policy.update(overrides)
+    return validate_policy(policy)
+
+
+def validate_policy(policy):
+    unknown = set(policy) - set(DEFAULT_POLICY)
+    if unknown:
+        raise ValueError(f"Unknown governor policy keys: {sorted(unknown)}")
+    for key in ("when_recording", "when_busy"):
+        if policy[key] not in ACTIONS:
+            raise ValueError(f"Governor policy {key} must be one of {ACTIONS}")
+    return policy
+
+
+class ResourceGovernor:
+    """
+    Samples system pressure in the background and decides, at each
+    checkpoint, whether work should go ahead, be throttled or pause
+
+    Args:
+        policy: Policy dict (defaults to DEFAULT_POLICY)
+        listener: Called with each logged decision dict (e.g. to forward it as
+            a progress notification)
+        log_path: Where decisions are appended (defaults to owl-control-debug.log)
+    """
+
+    def __init__(self, policy=None, listener=None, log_path=None):
+        self.policy = validate_policy(dict(policy or DEFAULT_POLICY))
+        self.listener = listener
+        self.log_path = log_path or debug_log_path()
+        self.process = psutil.Process()
+
+        self.sample = {"recording": False, "busy": False, "reasons": []}
+        self.idle_since = time.monotonic()
+        self.last_action = None
+        self.changed = threading.Condition()
+        self._stop = threading.Event()
+        self._thread = None
+        self._recorder = None
+        self._recorder_writes = None
+
+    # Lifecycle
+
+    def start(self):
+        if self.policy["lower_priority"]:
+            self.lower_priority()
+        self._previous = self._counters()
+        # Measure once before returning, so the first checkpoint is already
+        # gated by a real sample (e.g. a recording in progress)
+        time.sleep(min(self.policy["sample_seconds"], FIRST_SAMPLE_SECONDS))
+        try:
+            self._update(self.measure())
+        except psutil.Error:
+            pass
+        self._thread = threading.Thread(
+            target=self._run, name="owl-governor", daemon=True
+        )
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        with self.changed:
+            self.changed.notify_all()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def lower_priority(self):
+        """Drop this process to below-normal CPU and the lowest I/O priority"""
+        applied = []
+        try:
+            if sys.platform == "win32":
+                self.process.nice(psutil.BELOW_NORMAL_PRIORITY_CLASS)
+            else:
+                self.process.nice(10)
+            applied.append("cpu")
+        except (psutil.Error, OSError):
+            pass
+        try:
+            if sys.platform == "win32":
+                self.process.ionice(psutil.IOPRIO_VERYLOW)
+            elif hasattr(psutil, "IOPRIO_CLASS_IDLE"):
+                self.process.ionice(psutil.IOPRIO_CLASS_IDLE)
+            else:
+                raise AttributeError("ionice is not supported")
+            applied.append("io")
+        except (psutil.Error, OSError, AttributeError):
+            pass
+        self.log({"event": "priority", "lowered": applied})
+
+    # Sampling
+
+    def _counters(self):
+        cpu = self.process.cpu_times()
+        own_cpu = cpu.user + cpu.system + cpu.children_user + cpu.children_system
+        try:
+            io = self.process.io_counters()
+            own_disk = io.read_bytes + io.write_bytes
+        except (psutil.Error, AttributeError):
+            own_disk = 0
+        disk = psutil.disk_io_counters()
+        net = psutil.net_io_counters()
+        return {
+            "time": time.monotonic(),
+            "own_cpu": own_cpu,
+            "own_disk": own_disk,
+            "disk": disk.read_bytes + disk.write_bytes if disk else 0,
+            "net_recv": net.bytes_recv if net else 0,
+            "system_cpu": psutil.cpu_percent(None),
+        }
+
+    def _run(self):
+        while not self._stop.wait(self.policy["sample_seconds"]):
+            try:
+                self._update(self.measure())
+            except psutil.Error:
+                continue
+
+    def _update(self, sample):
+        with self.changed:
+            self.sample = sample
+            if sample["recording"] or sample["busy"]:
+                self.idle_since = None
+            elif self.idle_since is None:
+                self.idle_since = time.monotonic()
+            self.changed.notify_all()
+
+    def measure(self):
+        """Pressure since the previous sample, excluding this process's own use"""
+        current = self._counters()
+        previous, self._previous = self._previous, current
+        seconds = max(current["time"] - previous["time"], 1e-3)
+
+        own_cpu = 100 * (current["own_cpu"] - previous["own_cpu"]) / seconds
+        cpu = max(0.0, current["system_cpu"] - own_cpu / (psutil.cpu_count() or 1))
+        own_disk = current["own_disk"] - previous["own_disk"]
+        disk_bytes = max(0, current["disk"] - previous["disk"] - own_disk)
+        disk_mbps = disk_bytes / seconds / 1e6
+        net_mbps = max(0, current["net_recv"] - previous["net_recv"]) / seconds / 1e6
+
+        reasons = []
+        if cpu > self.policy["max_cpu_percent"]:
+            reasons.append(f"cpu {cpu:.0f}%")
+        if disk_mbps > self.policy["max_disk_mbps"]:
+            reasons.append(f"disk {disk_mbps:.1f} MB/s")
+        if net_mbps > self.policy["max_net_mbps"]:
+            reasons.append(f"network {net_mbps:.1f} MB/s")
+        busy = bool(reasons)
+        recording = self.recording_in_progress(seconds)
+        if recording:
+            reasons.insert(0, "recording in progress")
+        return {
+            "recording": recording,
+            "busy": busy,
+            "reasons": reasons,
+            "cpu_percent": round(cpu, 1),
+            "disk_mbps": round(disk_mbps, 2),
+            "net_mbps": round(net_mbps, 2),
+        }
+
+    def find_recorder(self):
+        names = {name.lower() for name in self.policy["recorder_names"]}
+        if self._recorder is not None and self._recorder.is_running():
+            return self._recorder
+        self._recorder = None
+        for process in psutil.process_iter(["name"]):
+            if (process.info["name"] or "").lower() in names:
+                self._recorder = process
+                self._recorder_writes = None
+                break
+        return self._recorder
+
+    def recording_in_progress(self, seconds):
+        recorder = self.find_recorder()
+        if recorder is None:
+            return False
+        try:
+            return any(
+                f.path.lower().endswith(RECORDING_SUFFIXES)
+                for f in recorder.open_files()
+            )
+        except psutil.AccessDenied:
+            pass
+        except psutil.NoSuchProcess:
+            return False
+
+        # Fall back on the recorder's write rate
+        try:
+            writes = recorder.io_counters().write_bytes
+        except (psutil.Error, AttributeError):
+            return False
+        previous, self._recorder_writes = self._recorder_writes, writes
+        if previous is None:
+            return False
+        limit = self.policy["recording_write_kbps"] * 1024
+        return (writes - previous) / seconds > limit
+
+    # Decisions
+
+    def decide(self):
+        """(action, sample) for the current state: "run", "pause" or "throttle" """
+        with self.changed:
+            sample = self.sample
+            idle_since = self.idle_since
+        if sample["recording"]:
+            action = self.policy["when_recording"]
+        elif sample["busy"]:
+            action = self.policy["when_busy"]
+        elif (
+            self.last_action == "pause"
+            and idle_since is not None
+            and time.monotonic() - idle_since < self.policy["idle_seconds"]
+        ):
+            action = "pause"  # Not idle for long enough yet
+        else:
+            action = "run"
+        return ("run" if action == "ignore" else action), sample
+
+    def checkpoint(self, step, cancel_event=None):
+        """
+        Block while the policy says to pause, sleep if it says to throttle
+
+        Returns the upload rate limit in bytes/s for this step (None for no
+        limit). Raises UploadCancelled if cancel_event is set while paused.
+        """
+        action, sample = self.decide()
+        self._transition(action, step, sample)
+
+        if action == "pause":
+            paused_at = time.monotonic()
+            limit = self.policy["max_pause_seconds"]
+            while action == "pause":
+                if cancel_event is not None and cancel_event.is_set():
+                    raise UploadCancelled(f"Cancelled while paused before {step}")
+                if self._stop.is_set():
+                    break
+                if limit is not None and time.monotonic() - paused_at >= limit:
+                    action = "throttle"
+                    self._transition(action, step, sample, timed_out=True)
+                    break
+                with self.changed:
+                    self.changed.wait(self.policy["sample_seconds"])
+                action, sample = self.decide()
+            if action != "pause" and self.last_action == "pause":
+                self._transition(action, step, sample)
+
+        if action == "throttle":
+            if cancel_event is not None:
+                cancel_event.wait(self.policy["throttle_sleep_seconds"])
+            else:
+                time.sleep(self.policy["throttle_sleep_seconds"])
+            return int(self.policy["throttle_upload_kbps"] * 1024)
+        return None
+
+    def _transition(self, action, step, sample, timed_out=False):
+        if action == self.last_action and not timed_out:
+            return
+        previous, self.last_action = self.last_action, action
+        self.log(
+            {
+                "event": "decision",
+                "action": action,
+                "previous": previous,
+                "step": step,
+                "reasons": sample["reasons"],
+                "cpu_percent": sample.get("cpu_percent"),
+                "disk_mbps": sample.get("disk_mbps"),
+                "net_mbps": sample.get("net_mbps"),
+                "timed_out": timed_out,
+            }
+        )
+
+    def log(self, decision):
+        decision = {"timestamp": time.time(), **decision}
+        try:
+            with open(self.log_path, "a") as f:
+                f.write(
+                    f"[{datetime.now().isoformat()}] GOVERNOR: {json.dumps(decision)}\n"
+                )
+        except OSError:
+            pass  # Don't fail if debug logging fails
+        if self.listener is not None:
+            self.listener(decision)
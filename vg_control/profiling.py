@@ -0,0 +1,247 @@
+"""
+Opt-in profiling for the upload bridge and the data_utils CLIs
+
+Enabled with --profile or the OWL_CONTROL_PROFILE environment variable. Code
+marks its phases with
+
+    with profiling.phase("validate_keyboard", trace_memory=True):
+        ...
+
+Each phase gets its own cProfile (functions called in a nested phase are
+attributed to the nested phase only) and its wall time including nested
+phases, summed over every time it runs. Phases with trace_memory also record
+their peak traced memory and the top allocation sites still alive when they
+end. Everything goes to one text report, owl-control-profile.txt next to
+owl-control-debug.log in the temp directory, which can be attached to a bug
+report.
+
+cProfile allows one active profiler per interpreter, so phases are profiled
+on one thread at a time: the first thread to enter a phase owns profiling
+until it leaves its outermost phase. Phases on other threads meanwhile (e.g. a
+worker RPC during an upload job) only add to their phase's wall time.
+
+When profiling is off, phase() returns a shared no-op context manager.
+"""
+
+import contextlib
+import cProfile
+import io
+import os
+import platform
+import pstats
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from datetime import datetime
+
+PROFILE_ENV = "OWL_CONTROL_PROFILE"
+REPORT_NAME = "owl-control-profile.txt"
+TOP_FUNCTIONS = 30
+TOP_ALLOCATIONS = 15
+
+_NULL_PHASE = contextlib.nullcontext()
+_profiler = None
+
+
+def profiling_requested(flag=False):
+    """True if --profile was given or OWL_CONTROL_PROFILE is set to a true value"""
+    value = os.environ.get(PROFILE_ENV, "").strip().lower()
+    return bool(flag) or value not in ("", "0", "false", "no", "off")
+
+
+def report_path():
+    return os.path.join(tempfile.gettempdir(), REPORT_NAME)
+
+
+class Profiler:
+    """Per-phase cProfile and tracemalloc results for one run of a command"""
+
+    def __init__(self, command):
+        self.command = command
+        self.started = datetime.now()
+        self.phases = {}
+        self._local = threading.local()
+        # cProfile and tracemalloc are process-wide: only one thread at a time
+        # (the owner, while it is inside a phase) profiles its phases
+        self._lock = threading.Lock()
+        self._owner = None
+
+    def _stack(self):
+        if not hasattr(self._local, "stack"):
+            self._local.stack = []
+        return self._local.stack
+
+    def _entry(self, name):
+        if name not in self.phases:
+            self.phases[name] = {
+                "calls": 0,
+                "seconds": 0.0,
+                "profile": cProfile.Profile(),
+                "peak_bytes": None,
+                "top_allocations": [],
+            }
+        return self.phases[name]
+
+    def _claim(self):
+        """Make this thread the profiling owner if no other thread is"""
+        with self._lock:
+            if self._owner is None:
+                self._owner = threading.get_ident()
+            return self._owner == threading.get_ident()
+
+    @contextlib.contextmanager
+    def phase(self, name, trace_memory=False):
+        with self._lock:
+            entry = self._entry(name)
+        stack = self._stack()
+        profiled = stack[-1]["profiled"] if stack else self._claim()
+        if not profiled:
+            # Another thread owns the profilers; only time this phase
+            frame = {"entry": entry, "profiled": False}
+            stack.append(frame)
+            start = time.perf_counter()
+            try:
+                yield
+            finally:
+                stack.pop()
+                with self._lock:
+                    entry["calls"] += 1
+                    entry["seconds"] += time.perf_counter() - start
+            return
+
+        # Only one profiler can be active in the interpreter; pause the
+        # enclosing phase
+        if stack:
+            stack[-1]["entry"]["profile"].disable()
+        started_tracing = trace_memory and not tracemalloc.is_tracing()
+        if started_tracing:
+            tracemalloc.start()
+        if trace_memory:
+            # Resetting the peak for this phase must not lose the enclosing ones'
+            _, peak = tracemalloc.get_traced_memory()
+            for frame in stack:
+                frame["peak"] = max(frame["peak"], peak)
+            tracemalloc.reset_peak()
+
+        frame = {"entry": entry, "peak": 0, "profiled": True}
+        stack.append(frame)
+        start = time.perf_counter()
+        entry["profile"].enable()
+        try:
+            yield
+        finally:
+            entry["profile"].disable()
+            with self._lock:
+                entry["calls"] += 1
+                entry["seconds"] += time.perf_counter() - start
+            stack.pop()
+
+            if trace_memory:
+                peak = max(tracemalloc.get_traced_memory()[1], frame["peak"])
+                if entry["peak_bytes"] is None or peak >= entry["peak_bytes"]:
+                    # Keep the allocation sites of the most memory-hungry run
+                    entry["peak_bytes"] = peak
+                    statistics = tracemalloc.take_snapshot().statistics("lineno")
+                    entry["top_allocations"] = [
+                        str(stat) for stat in statistics[:TOP_ALLOCATIONS]
+                    ]
+                if started_tracing:
+                    tracemalloc.stop()
+            if stack:
+                stack[-1]["entry"]["profile"].enable()
+            else:
+                with self._lock:
+                    self._owner = None
+
+    def report(self):
+        lines = [
+            f"owl-control profile: {self.command}",
+            f"Started: {self.started.isoformat()}",
+            f"Finished: {datetime.now().isoformat()}",
+            f"Command line: {' '.join(sys.argv)}",
+            f"Python: {sys.version.split()[0]} on {platform.platform()}",
+            f"CPUs: {os.cpu_count()}",
+            "",
+            (
+                f"{'Phase':<32} {'Calls':>8} {'Wall s':>10} "
+                f"{'Mean ms':>10} {'Peak MB':>10}"
+            ),
+        ]
+        phases = sorted(self.phases.items(), key=lambda item: -item[1]["seconds"])
+        for name, entry in phases:
+            mean_ms = 1000 * entry["seconds"] / entry["calls"] if entry["calls"] else 0
+            peak = (
+                f"{entry['peak_bytes'] / (1024 * 1024):.1f}"
+                if entry["peak_bytes"] is not None
+                else "-"
+            )
+            lines.append(
+                f"{name:<32} {entry['calls']:>8} {entry['seconds']:>10.3f} "
+                f"{mean_ms:>10.1f} {peak:>10}"
+            )
+
+        for name, entry in phases:
+            lines += ["", "=" * 80, f"Phase: {name}", "=" * 80]
+            if entry["top_allocations"]:
+                lines.append("Top allocations still alive at the end of the phase:")
+                lines += [f"  {allocation}" for allocation in entry["top_allocations"]]
+                lines.append("")
+
+            stream = io.StringIO()
+            try:
+                stats = pstats.Stats(entry["profile"], stream=stream)
+            except TypeError:
+                continue  # Nothing was profiled (e.g. all time in nested phases)
+            stats.sort_stats("cumulative").print_stats(TOP_FUNCTIONS)
+            lines.append(stream.getvalue().rstrip())
+        return "\n".join(lines) + "\n"
+
+    def write_report(self, path=None):
+        path = path or report_path()
+        with open(path, "w") as f:
+            f.write(self.report())
+        return path
+
+
+def enable(command):
+    """Start profiling this process; phases are recorded from now on"""
+    global _profiler
+    _profiler = Profiler(command)
+    return _profiler
+
+
+def is_enabled():
+    return _profiler is not None
+
+
+def phase(name, trace_memory=False):
+    """Context manager for a profiled phase (a no-op when profiling is off)"""
+    if _profiler is None:
+        return _NULL_PHASE
+    return _profiler.phase(name, trace_memory)
+
+
+def write_report(path=None):
+    """Write the report if profiling is on; returns its path (or None)"""
+    if _profiler is None:
+        return None
+    return _profiler.write_report(path)
+
+
+@contextlib.contextmanager
+def profile_command(command, flag=False):
+    """
+    Profile the body if requested by flag or environment variable, writing the
+    report (and printing where it is) when it finishes, even on errors
+    """
+    if not profiling_requested(flag):
+        yield
+        return
+    enable(command)
+    try:
+        yield
+    finally:
+        path = write_report()
+        print(f"Profile written to {path}", file=sys.stderr)
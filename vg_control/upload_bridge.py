@@ -1,4 +1,10 @@
-from .data.owl import upload_all_files
+from .constants import ROOT_DIR
+from .data.disk_budget import parse_budget
+from .data.owl import EVENT_LOG_MODES, upload_all_files
+from .data.session_lock import new_run_id
+from .governor import ACTIONS, ResourceGovernor, load_policy
+from .profiling import PROFILE_ENV, profile_command
+from .worker import DEFAULT_IDLE_TIMEOUT, run_worker
 import argparse
 import sys
 
@@ -6,23 +12,153 @@ import sys
 def main():
     # Set up argument parser
     parser = argparse.ArgumentParser(description="Upload Bridge")
+    parser.add_argument("--api-token", type=str, help="API token for upload")
     parser.add_argument(
-        "--api-token", type=str, required=True, help="API token for upload"
+        "--progress", action="store_true", help="Enable progress output for UI"
     )
     parser.add_argument(
-        "--progress", action="store_true", help="Enable progress output for UI"
+        "--event-log",
+        choices=EVENT_LOG_MODES,
+        default="off",
+        help="Upload the compact binary event log alongside or instead of inputs.csv",
+    )
+    parser.add_argument(
+        "--sampled-validation",
+        action="store_true",
+        help=(
+            "Validate long input logs from sampled windows, reading them in full "
+            "only when a threshold is in doubt"
+        ),
+    )
+    parser.add_argument(
+        "--bundle",
+        action="store_true",
+        help="Upload small sessions together in one archive with a manifest",
+    )
+    parser.add_argument(
+        "--root",
+        action="append",
+        dest="roots",
+        metavar="DIR",
+        help=f"Directory of recordings; repeat for several (default {ROOT_DIR})",
+    )
+    parser.add_argument(
+        "--disk-budget",
+        help=(
+            "After uploading, evict uploaded sessions to keep them under a size "
+            '("50GB") or keep a share of the disk free ("20%%")'
+        ),
+    )
+    parser.add_argument(
+        "--governor",
+        action="store_true",
+        help=(
+            "Pause or throttle validation and uploads while recording or while the "
+            "system is busy"
+        ),
+    )
+    parser.add_argument(
+        "--governor-policy",
+        metavar="FILE",
+        help="JSON file overriding the governor's default policy (implies --governor)",
+    )
+    parser.add_argument(
+        "--when-recording",
+        choices=ACTIONS,
+        help=(
+            "What the governor does while a recording is in progress (implies "
+            "--governor)"
+        ),
+    )
+    parser.add_argument(
+        "--run-id",
+        help=(
+            "Identifies this run's session leases and its progress file "
+            "(default: a new random id)"
+        ),
+    )
+    parser.add_argument(
+        "--worker",
+        action="store_true",
+        help="Run as a long-lived JSON-RPC worker over stdin/stdout",
+    )
+    parser.add_argument(
+        "--idle-timeout",
+        type=float,
+        default=DEFAULT_IDLE_TIMEOUT,
+        help="Seconds without requests before the worker exits",
+    )
+
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        help=(
+            "Write a per-phase profile report to the temp directory (or set "
+            f"{PROFILE_ENV}=1)"
+        ),
     )
 
     # Parse arguments
     args = parser.parse_args()
+    if args.disk_budget is not None:
+        try:
+            parse_budget(args.disk_budget)
+        except ValueError as e:
+            parser.error(str(e))
+
+    args.governor_policy_dict = None
+    if args.governor or args.governor_policy or args.when_recording:
+        overrides = {}
+        if args.when_recording:
+            overrides["when_recording"] = args.when_recording
+        try:
+            args.governor_policy_dict = load_policy(args.governor_policy, **overrides)
+        except (OSError, ValueError) as e:
+            parser.error(f"Invalid governor policy: {e}")
+
+    with profile_command("upload_bridge", args.profile):
+        return run(parser, args)
+
+
+def run(parser, args):
+    if args.worker:
+        token = args.api_token.strip() if args.api_token else None
+        return run_worker(
+            token,
+            idle_timeout=args.idle_timeout,
+            disk_budget=args.disk_budget,
+            roots=args.roots,
+            governor_policy=args.governor_policy_dict,
+            run_id=args.run_id,
+        )
+
+    if not args.api_token:
+        parser.error("--api-token is required unless --worker is given")
 
     token = args.api_token.strip()
     progress_mode = args.progress
+    run_id = args.run_id or new_run_id()
 
-    print(f"Upload bridge starting with token={token[:4]}... progress={progress_mode}")
+    print(
+        f"Upload bridge starting with token={token[:4]}... "
+        f"progress={progress_mode} run={run_id}"
+    )
 
+    governor = None
+    if args.governor_policy_dict is not None:
+        governor = ResourceGovernor(args.governor_policy_dict).start()
     try:
-        upload_all_files(token, progress_mode=progress_mode)
+        upload_all_files(
+            token,
+            progress_mode=progress_mode,
+            event_log=args.event_log,
+            disk_budget=args.disk_budget,
+            bundle=args.bundle,
+            sampled_validation=args.sampled_validation,
+            roots=args.roots,
+            governor=governor,
+            run_id=run_id,
+        )
         print("Upload completed successfully")
         return 0
     except Exception as e:
@@ -35,6 +171,9 @@ def main():
         with open("error.txt", "w") as f:
             f.write(error_msg)
         return 1
+    finally:
+        if governor is not None:
+            governor.stop()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,509 @@
+"""
+Long-running upload worker speaking JSON-RPC 2.0 over stdin/stdout.
+
+Each line on stdin is one request, each line on stdout is one response or
+notification. Keeping the process alive between uploads avoids paying
+interpreter startup and the pandas import every time, and lets the worker keep
+its HTTP connection pool and per-session validation results warm.
+
+Methods:
+    scan      -> list the sessions that are still pending upload, under every
+                 recording root the worker was started with
+    validate  -> validate pending sessions (cached by file size/mtime),
+                 from sampled windows if `sampled_validation` is set
+    upload    -> validate and upload pending sessions (runs in the background),
+                 bundling small ones if `bundle` is set, then enforce the
+                 disk budget if one is set
+    cancel    -> cancel the running job
+    status    -> report what the worker is doing
+    shutdown  -> cancel any running job and exit
+
+While a job runs the worker emits `progress` notifications and, when it
+finishes, the job's response. Started with a governor policy, it also emits a
+`governor` notification whenever the governor pauses, throttles or resumes
+work (see governor.py). Jobs lease each session they work on (see
+session_lock.py); sessions a concurrent run has leased are skipped and listed
+under `skipped`. The worker exits on its own after `idle_timeout` seconds
+without requests or running jobs, or when stdin closes.
+"""
+
+import json
+import os
+import queue
+import subprocess
+import sys
+import threading
+import time
+
+import requests
+
+from .data.disk_budget import enforce_disk_budgets, parse_budget
+from .data.owl import OWLDataManager, session_size
+from .data.session_lock import LeaseManager
+from .data.uploader import UploadCancelled
+from .governor import ResourceGovernor
+
+# JSON-RPC 2.0 error codes
+PARSE_ERROR = -32700
+INVALID_REQUEST = -32600
+METHOD_NOT_FOUND = -32601
+INVALID_PARAMS = -32602
+INTERNAL_ERROR = -32603
+WORKER_BUSY = -32000
+JOB_CANCELLED = -32001
+
+# Errors a request or job can fail with; reported to the client as INTERNAL_ERROR
+REQUEST_ERRORS = (
+    OSError,
+    ValueError,
+    TypeError,
+    LookupError,
+    RuntimeError,
+    subprocess.SubprocessError,
+)
+
+DEFAULT_IDLE_TIMEOUT = 600  # seconds
+
+
+class UploadWorker:
+    def __init__(
+        self,
+        token=None,
+        idle_timeout=DEFAULT_IDLE_TIMEOUT,
+        out=None,
+        disk_budget=None,
+        roots=None,
+        governor_policy=None,
+        run_id=None,
+    ):
+        self.token = token
+        self.disk_budget = disk_budget
+        self.roots = roots
+        # Sessions are leased while a job works on them, so a concurrent
+        # upload_bridge run or worker leaves them alone
+        self.leases = LeaseManager(run_id)
+        self.governor = None
+        if governor_policy is not None:
+            self.governor = ResourceGovernor(
+                governor_policy,
+                listener=lambda decision: self.notify("governor", decision),
+            )
+        self.idle_timeout = idle_timeout
+        self.out = out if out is not None else sys.stdout
+        self.started_at = time.time()
+
+        # Warm state kept across requests; the index and cache are shared by
+        # the job thread and the request loop, under state_lock
+        self.http_session = requests.Session()
+        self.session_index = {}  # root -> session dict from the last scan
+        self.validation_cache = {}  # root -> (signature, invalid reasons)
+        self.state_lock = threading.Lock()
+
+        self.write_lock = threading.Lock()
+        self.job_lock = threading.Lock()
+        self.job = None  # dict describing the running job, if any
+        self.last_progress = None
+        self.running = True
+
+    # Output
+
+    def send(self, message):
+        line = json.dumps({"jsonrpc": "2.0", **message})
+        with self.write_lock:
+            self.out.write(line + "\n")
+            self.out.flush()
+
+    def respond(self, request_id, result):
+        self.send({"id": request_id, "result": result})
+
+    def respond_error(self, request_id, code, message):
+        self.send({"id": request_id, "error": {"code": code, "message": message}})
+
+    def notify(self, method, params):
+        self.send({"method": method, "params": params})
+
+    def emit_progress(self, progress):
+        self.last_progress = progress
+        self.notify("progress", progress)
+
+    # Session state
+
+    def scan(self):
+        """Refresh the session index and drop cache entries of sessions that left it."""
+        sessions = OWLDataManager(self.token, roots=self.roots).find_pending_sessions()
+        with self.state_lock:
+            self.session_index = {session["root"]: session for session in sessions}
+            for root in list(self.validation_cache):
+                if root not in self.session_index:
+                    del self.validation_cache[root]
+        return sessions
+
+    def session_signature(self, session):
+        """Sizes and mtimes of the recorded files; any change invalidates the cache."""
+        # Stat'ed by the scan that produced the session
+        return (session["stat"]["mp4"], session["stat"]["csv"])
+
+    def validate(self, manager, session, verbose=False, cancel_event=None):
+        root = session["root"]
+        signature = self.session_signature(session)
+        with self.state_lock:
+            cached = self.validation_cache.get(root)
+        if cached is not None and cached[0] == signature:
+            return cached[1]
+
+        invalid_reasons = manager.validate_session(
+            session, verbose=verbose, cancel_event=cancel_event
+        )
+        with self.state_lock:
+            self.validation_cache[root] = (signature, invalid_reasons)
+        return invalid_reasons
+
+    def select_sessions(self, params):
+        """Resolve the optional `sessions` param (a list of roots) in a fresh scan."""
+        sessions = self.scan()
+        roots = params.get("sessions")
+        if roots is None:
+            return sessions
+        if not isinstance(roots, list):
+            raise TypeError("'sessions' must be a list of session directories")
+        with self.state_lock:
+            return [
+                self.session_index[root] for root in roots if root in self.session_index
+            ]
+
+    # Methods
+
+    def rpc_scan(self, params):
+        sessions = self.scan()
+        return {
+            "sessions": [
+                {
+                    "root": session["root"],
+                    "mp4_file": session["mp4_file"],
+                    "csv_file": session["csv_file"],
+                    "bytes": session_size(session),
+                }
+                for session in sessions
+            ]
+        }
+
+    def rpc_status(self, params):
+        job = self.job
+        with self.state_lock:
+            sessions_indexed = len(self.session_index)
+            validations_cached = len(self.validation_cache)
+        return {
+            "state": "busy" if job is not None else "idle",
+            "job": None
+            if job is None
+            else {
+                "id": job["id"],
+                "method": job["method"],
+                "started_at": job["started_at"],
+                "cancelled": job["cancel_event"].is_set(),
+            },
+            "last_progress": self.last_progress,
+            "sessions_indexed": sessions_indexed,
+            "validations_cached": validations_cached,
+            "uptime_seconds": time.time() - self.started_at,
+        }
+
+    def rpc_cancel(self, params):
+        job = self.job
+        if job is None:
+            return {"cancelled": False}
+        job["cancel_event"].set()
+        return {"cancelled": True, "job_id": job["id"]}
+
+    def rpc_shutdown(self, params):
+        self.rpc_cancel(params)
+        self.running = False
+        return {"shutting_down": True}
+
+    def job_validate(self, params, cancel_event):
+        manager = OWLDataManager(
+            self.token,
+            sampled_validation=bool(params.get("sampled_validation")),
+            roots=self.roots,
+            governor=self.governor,
+            leases=self.leases,
+        )
+        sessions = self.select_sessions(params)
+        results = []
+        skipped = []
+        for i, session in enumerate(sessions):
+            if cancel_event.is_set():
+                raise UploadCancelled("Validation was cancelled")
+            if not manager.claim(session):
+                skipped.append(session["root"])
+                continue
+            self.emit_progress(
+                {
+                    "phase": "validate",
+                    "action": "progress",
+                    "session": session["root"],
+                    "index": i,
+                    "total": len(sessions),
+                    "timestamp": time.time(),
+                }
+            )
+            try:
+                invalid_reasons = self.validate(
+                    manager, session, params.get("verbose"), cancel_event
+                )
+            finally:
+                manager.release(session)
+            results.append(
+                {"root": session["root"], "invalid_reasons": invalid_reasons}
+            )
+        return {"sessions": results, "skipped": skipped}
+
+    def job_upload(self, params, cancel_event):
+        token = (params.get("api_token") or self.token or "").strip()
+        if not token:
+            raise ValueError("No API token given")
+        self.token = token
+
+        # A budget given with the request overrides the worker's default
+        disk_budget = params.get("disk_budget", self.disk_budget)
+        if disk_budget is not None:
+            disk_budget = parse_budget(disk_budget)
+
+        manager = OWLDataManager(
+            token,
+            bundle=bool(params.get("bundle")),
+            sampled_validation=bool(params.get("sampled_validation")),
+            roots=self.roots,
+            governor=self.governor,
+            leases=self.leases,
+        )
+        sessions = self.select_sessions(params)
+        uploaded = []
+        invalid = []
+        valid = []
+        skipped = []
+        try:
+            for session in sessions:
+                if cancel_event.is_set():
+                    raise UploadCancelled("Upload was cancelled")
+                if not manager.claim(session):
+                    skipped.append(session["root"])
+                    continue
+
+                invalid_reasons = self.validate(
+                    manager, session, params.get("verbose"), cancel_event
+                )
+                if len(invalid_reasons) > 0:
+                    manager.release(session)
+                    invalid.append(
+                        {"root": session["root"], "invalid_reasons": invalid_reasons}
+                    )
+                    continue
+                if manager.bundle:
+                    # Bundles are planned once every session is validated
+                    valid.append(session)
+                else:
+                    uploaded += self.upload_group(
+                        manager, [session], sessions, cancel_event
+                    )
+
+            for group in manager.plan_uploads(valid):
+                if cancel_event.is_set():
+                    raise UploadCancelled("Upload was cancelled")
+                uploaded += self.upload_group(manager, group, sessions, cancel_event)
+        finally:
+            # Sessions left unfinished (cancelled, failed) go back to the pool
+            self.leases.release_all()
+
+        budget_report = None
+        if disk_budget is not None:
+            budget_report = enforce_disk_budgets(disk_budget, manager.roots)
+
+        return {
+            "uploaded": uploaded,
+            "invalid": invalid,
+            "total_files_uploaded": len(uploaded),
+            "total_duration_uploaded": manager.total_duration,
+            "total_bytes_uploaded": manager.total_bytes,
+            "disk_budget": budget_report,
+            "skipped": skipped,
+        }
+
+    def upload_group(self, manager, group, sessions, cancel_event):
+        """Upload one session or bundle of sessions; returns their roots"""
+        roots = [session["root"] for session in group]
+        index = sessions.index(group[0])
+
+        def on_progress(progress):
+            self.emit_progress(
+                {
+                    **progress,
+                    "session": roots[0],
+                    "sessions": roots,
+                    "index": index,
+                    "total": len(sessions),
+                }
+            )
+
+        if not manager.upload(
+            group,
+            http_session=self.http_session,
+            progress_callback=on_progress,
+            cancel_event=cancel_event,
+        ):
+            return []  # Another run took the group over
+        with self.state_lock:
+            for root in roots:
+                self.session_index.pop(root, None)
+                self.validation_cache.pop(root, None)
+        return roots
+
+    def start_job(self, request_id, method, target, params):
+        with self.job_lock:
+            if self.job is not None:
+                self.respond_error(
+                    request_id,
+                    WORKER_BUSY,
+                    f"Worker is busy with '{self.job['method']}' (id {self.job['id']})",
+                )
+                return
+            cancel_event = threading.Event()
+            self.job = {
+                "id": request_id,
+                "method": method,
+                "started_at": time.time(),
+                "cancel_event": cancel_event,
+            }
+
+        def run():
+            try:
+                result = target(params, cancel_event)
+                self.respond(request_id, result)
+            except UploadCancelled as e:
+                self.respond_error(request_id, JOB_CANCELLED, str(e))
+            except REQUEST_ERRORS as e:
+                self.respond_error(
+                    request_id, INTERNAL_ERROR, f"{type(e).__name__}: {e}"
+                )
+            finally:
+                with self.job_lock:
+                    self.job = None
+
+        thread = threading.Thread(target=run, name=f"owl-worker-{method}", daemon=True)
+        self.job["thread"] = thread
+        thread.start()
+
+    # Dispatch
+
+    def handle_line(self, line):
+        try:
+            request = json.loads(line)
+        except json.JSONDecodeError as e:
+            self.respond_error(None, PARSE_ERROR, f"Parse error: {e}")
+            return
+
+        if not isinstance(request, dict) or not isinstance(request.get("method"), str):
+            self.respond_error(None, INVALID_REQUEST, "Invalid request")
+            return
+
+        request_id = request.get("id")
+        method = request["method"]
+        params = request.get("params") or {}
+        if not isinstance(params, dict):
+            self.respond_error(request_id, INVALID_PARAMS, "params must be an object")
+            return
+
+        jobs = {"validate": self.job_validate, "upload": self.job_upload}
+        if method in jobs:
+            self.start_job(request_id, method, jobs[method], params)
+            return
+
+        handler = getattr(self, f"rpc_{method}", None)
+        if handler is None:
+            self.respond_error(
+                request_id, METHOD_NOT_FOUND, f"Unknown method: {method}"
+            )
+            return
+
+        try:
+            result = handler(params)
+        except REQUEST_ERRORS as e:
+            self.respond_error(request_id, INTERNAL_ERROR, f"{type(e).__name__}: {e}")
+            return
+        if request_id is not None:
+            self.respond(request_id, result)
+
+    def serve(self, stdin=None):
+        """Read requests until shutdown, stdin closes or the idle timeout expires."""
+        stdin = stdin if stdin is not None else sys.stdin
+        lines = queue.Queue()
+
+        def read_stdin():
+            for line in stdin:
+                lines.put(line)
+            lines.put(None)
+
+        threading.Thread(
+            target=read_stdin, name="owl-worker-stdin", daemon=True
+        ).start()
+        self.notify("ready", {"pid": os.getpid(), "run_id": self.leases.run_id})
+        self.leases.start()
+        if self.governor is not None:
+            self.governor.start()
+
+        last_activity = time.time()
+        while self.running:
+            try:
+                line = lines.get(timeout=1.0)
+            except queue.Empty:
+                if self.job is not None:
+                    last_activity = time.time()
+                elif time.time() - last_activity > self.idle_timeout:
+                    self.notify("idle_shutdown", {"idle_seconds": self.idle_timeout})
+                    break
+                continue
+
+            if line is None:  # stdin closed, nobody is listening anymore
+                self.rpc_cancel({})
+                break
+            last_activity = time.time()
+            if line.strip():
+                self.handle_line(line)
+
+        self.stop()
+
+    def stop(self):
+        """Wait for a cancelled job to unwind, then release the warm state."""
+        job = self.job
+        if job is not None:
+            job["thread"].join(timeout=30)
+        if self.governor is not None:
+            self.governor.stop()
+        self.leases.stop()
+        self.http_session.close()
+
+
+def run_worker(
+    token=None,
+    idle_timeout=DEFAULT_IDLE_TIMEOUT,
+    disk_budget=None,
+    roots=None,
+    governor_policy=None,
+    run_id=None,
+):
+    # stdout carries the protocol; route stray prints (progress, warnings) to stderr
+    out = sys.stdout
+    sys.stdout = sys.stderr
+    try:
+        UploadWorker(
+            token,
+            idle_timeout=idle_timeout,
+            out=out,
+            disk_budget=disk_budget,
+            roots=roots,
+            governor_policy=governor_policy,
+            run_id=run_id,
+        ).serve()
+    finally:
+        sys.stdout = out
+    return 0